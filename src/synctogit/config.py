@@ -1,6 +1,7 @@
 import abc
 import contextlib
-from typing import ContextManager, Generic, TextIO, TypeVar
+from enum import Enum
+from typing import ContextManager, Generic, TextIO, Type, TypeVar
 
 from configupdater import ConfigUpdater
 
@@ -91,6 +92,40 @@ class BoolConfigItem(ConfigItem[bool]):
         return BOOLEAN_STATES[value.lower()]
 
 
+E = TypeVar("E", bound=Enum)
+
+
+class EnumConfigItem(ConfigItem[E]):
+    """An item which value is one of the values of the `enum_cls` members."""
+
+    def __init__(
+        self,
+        section: str,
+        key: str,
+        enum_cls: Type[E],
+        default: E = DEFAULT_SENTINEL,
+    ) -> None:
+        super().__init__(section, key, default)
+        self.enum_cls = enum_cls
+
+    def set(self, config: "Config", value: E) -> None:
+        super().set(config, value.value)
+
+    def _conv(self, value: str) -> E:
+        try:
+            return self.enum_cls(value)
+        except ValueError:
+            raise ValueError(
+                "Invalid value of %s.%s: %r. Expected one of: %s"
+                % (
+                    self.section,
+                    self.key,
+                    value,
+                    ", ".join(str(m.value) for m in self.enum_cls),
+                )
+            ) from None
+
+
 class Config:
     def __init__(self, config_read_writer: ConfigReadWriter) -> None:
         self.config_read_writer = config_read_writer
@@ -0,0 +1,84 @@
+import contextlib
+import logging
+import random
+import signal
+import threading
+from typing import Callable, Iterator, Sequence
+
+logger = logging.getLogger(__name__)
+
+_stop_signals = tuple(
+    getattr(signal, name) for name in ("SIGINT", "SIGTERM") if hasattr(signal, name)
+)
+
+
+class Daemon:
+    """Call a function periodically until a stop is requested.
+
+    The next call is scheduled `interval_seconds` after the previous one
+    has finished, give or take a random jitter, so the multiple daemons
+    started at the same time don't hit a service simultaneously.
+
+    The failures of the function are logged and don't stop the daemon.
+    """
+
+    # `stop` is thread-safe and might be called from a signal handler.
+
+    def __init__(
+        self, fn: Callable[[], None], *, interval_seconds: float, jitter: float = 0.1
+    ) -> None:
+        self.fn = fn
+        self.interval_seconds = interval_seconds
+        # A fraction of the interval.
+        self.jitter = jitter
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        """Stop the daemon once the current call is done."""
+        self._stop_event.set()
+
+    @property
+    def is_stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def run(self) -> None:
+        with self._handle_signals(_stop_signals):
+            while not self.is_stopped:
+                try:
+                    self.fn()
+                except Exception:
+                    logger.exception("Sync has failed")
+                if self.is_stopped:
+                    break
+                delay = self.next_delay()
+                logger.info("Next sync in %d seconds", delay)
+                self._stop_event.wait(delay)
+        logger.info("Daemon has been stopped")
+
+    def next_delay(self) -> float:
+        jitter = self.interval_seconds * self.jitter
+        return max(0.0, self.interval_seconds + random.uniform(-jitter, jitter))
+
+    @contextlib.contextmanager
+    def _handle_signals(self, signums: Sequence[int]) -> Iterator[None]:
+        if threading.current_thread() is not threading.main_thread():
+            # The signal handlers can be set in the main thread only.
+            yield
+            return
+
+        def handler(signum, frame):
+            if self.is_stopped:
+                # The second signal interrupts the current sync.
+                raise KeyboardInterrupt()
+            logger.warning(
+                "Received signal %d. Exiting once the current sync is done...",
+                signum,
+            )
+            self.stop()
+
+        previous = {signum: signal.signal(signum, handler) for signum in signums}
+        try:
+            yield
+        finally:
+            for signum, prev_handler in previous.items():
+                signal.signal(signum, prev_handler)
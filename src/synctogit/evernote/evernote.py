@@ -1,10 +1,12 @@
 import binascii
 import datetime
 import logging
+import operator
 from collections import OrderedDict
 from functools import wraps
+from pathlib import Path
 from socket import error as socketerror
-from typing import Mapping, Optional
+from typing import Container, Mapping, Optional
 
 import evernote.edam as Edam
 import evernote.edam.error.constants as Errors
@@ -15,13 +17,16 @@ from evernote.api.client import EvernoteClient
 
 from synctogit.filename_sanitizer import normalize_filename
 from synctogit.service import (
+    RateLimiter,
     ServiceAPIError,
     ServiceRateLimitError,
     ServiceTokenExpiredError,
     retry_ratelimited,
 )
+from synctogit.service.notes.resources import write_staging_file
 
 from . import models, note_parser
+from .metadata_snapshot import MetadataSnapshot
 
 # import evernote.edam.userstore.constants as UserStoreConstants
 # import evernote.edam.type.ttypes as Types
@@ -29,6 +34,10 @@ from . import models, note_parser
 logger = logging.getLogger(__name__)
 
 _MAXLEN_TITLE_FILENAME = 30
+_SYNC_CHUNK_MAX_ENTRIES = 500
+
+# The requests quota is per account, so each client has its own limiter.
+_rate_limiter = operator.attrgetter("rate_limiter")
 
 
 # required API permissions:
@@ -64,17 +73,29 @@ def translate_exceptions(f):
 class Evernote:
     # Must be thread-safe.
 
-    def __init__(self, sandbox=True):
+    def __init__(
+        self,
+        sandbox=True,
+        metadata_snapshot: Optional[MetadataSnapshot] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
         self.sandbox = sandbox
+        self.rate_limiter = rate_limiter or RateLimiter("evernote")
         self.client = None
+        # When the snapshot is passed, the metadata is retrieved incrementally
+        # using the update sequence numbers.
+        self.metadata_snapshot = metadata_snapshot
 
     @translate_exceptions
     def auth(self, access_token: str) -> None:
         self.client = EvernoteClient(token=access_token, sandbox=self.sandbox)
 
     def get_actual_metadata(self) -> Mapping[models.NoteGuid, models.NoteMetadata]:
-        notes_metadata = self._get_all_notes_metadata()
-        notebooks = self._get_notebooks()
+        if self.metadata_snapshot is not None:
+            notes_metadata, notebooks = self._get_incremental_metadata()
+        else:
+            notes_metadata = self._get_all_notes_metadata()
+            notebooks = self._get_notebooks()
 
         res = OrderedDict(
             (
@@ -91,14 +112,81 @@ class Evernote:
         )
         return res
 
-    @retry_ratelimited
+    def _get_incremental_metadata(self):
+        snapshot = self.metadata_snapshot
+        self._sync_metadata_snapshot(snapshot)
+        try:
+            snapshot.save()
+        except OSError as e:
+            logger.warning("Unable to save Evernote metadata snapshot: %r", e)
+
+        notebooks = OrderedDict(
+            (n.guid, self._map_to_notebook_info(n)) for n in snapshot.get_notebooks()
+        )
+
+        notes_metadata = OrderedDict()
+        # Newest notes first, like the `findNotesMetadata` results.
+        notes = sorted(
+            snapshot.get_notes(), key=lambda n: (n.created or 0, n.guid), reverse=True
+        )
+        for n in notes:
+            if n.notebookGuid not in notebooks:
+                logger.warning(
+                    "Skipping note %s because its notebook %s doesn't exist",
+                    n.guid,
+                    n.notebookGuid,
+                )
+                continue
+            notes_metadata[n.guid] = self._map_to_note_info(n)
+        return notes_metadata, notebooks
+
+    @retry_ratelimited(limiter=_rate_limiter)
+    @translate_exceptions
+    def _sync_metadata_snapshot(self, snapshot: MetadataSnapshot) -> None:
+        # https://dev.evernote.com/doc/articles/synchronization.php
+        note_store = self.client.get_note_store()
+
+        user_id = self._user.id
+        if snapshot.user_id != user_id:
+            snapshot.discard()
+            snapshot.user_id = user_id
+
+        sync_state = note_store.getSyncState()
+        if snapshot.update_count and (
+            snapshot.last_sync_time < (sync_state.fullSyncBefore or 0)
+        ):
+            logger.info("Evernote requested a full resync of metadata")
+            snapshot.discard()
+            snapshot.user_id = user_id
+
+        if sync_state.updateCount == snapshot.update_count:
+            logger.info("No metadata changes since the last Evernote sync")
+            return
+
+        sync_filter = Edam.notestore.NoteStore.SyncChunkFilter()
+        sync_filter.includeNotes = True
+        sync_filter.includeNotebooks = True
+        sync_filter.includeExpunged = True
+
+        while True:
+            chunk = note_store.getFilteredSyncChunk(
+                snapshot.update_count, _SYNC_CHUNK_MAX_ENTRIES, sync_filter
+            )
+            snapshot.apply_chunk(chunk)
+            snapshot.last_sync_time = chunk.currentTime
+            if chunk.chunkHighUSN is None or chunk.chunkHighUSN >= chunk.updateCount:
+                snapshot.update_count = chunk.updateCount
+                break
+            snapshot.update_count = chunk.chunkHighUSN
+
+    @retry_ratelimited(limiter=_rate_limiter)
     @translate_exceptions
     def _get_notebooks(self) -> Mapping[models.NotebookGuid, models.NotebookInfo]:
         note_store = self.client.get_note_store()
         notebooks = note_store.listNotebooks()
         return OrderedDict((n.guid, self._map_to_notebook_info(n)) for n in notebooks)
 
-    @retry_ratelimited
+    @retry_ratelimited(limiter=_rate_limiter)
     @translate_exceptions
     def _get_all_notes_metadata(self) -> Mapping[models.NoteGuid, models.NoteInfo]:
         note_store = self.client.get_note_store()
@@ -132,9 +220,38 @@ class Evernote:
 
         return res
 
-    @retry_ratelimited
+    def get_note(
+        self,
+        guid: models.NoteGuid,
+        resources_base: str,
+        stored_resources: Container[str] = frozenset(),
+        staging_dir: Optional[Path] = None,
+    ) -> models.Note:
+        """Retrieve a note.
+
+        Resources which filenames are in `stored_resources` are not
+        downloaded: the filenames contain the hash of the resource's body,
+        so these resources are known to be unchanged. The `body` of such
+        resources is None.
+
+        If `staging_dir` is set, the resources are written to temporary
+        files in that dir as soon as they are downloaded, and their `body`
+        is a Path, so only one resource is kept in memory at a time.
+        """
+        note = self._get_note(guid)
+        for r in note.resources or []:
+            if self._resource_filename(r) not in stored_resources:
+                # Thrift doesn't support partial reads of the resource data,
+                # so the whole resource has to be retrieved at once.
+                body = self._get_resource_data(r.guid)
+                if staging_dir is not None:
+                    body = write_staging_file(staging_dir, [body])
+                r.data.body = body
+        return self._map_to_note(note, resources_base)
+
+    @retry_ratelimited(limiter=_rate_limiter)
     @translate_exceptions
-    def get_note(self, guid: models.NoteGuid, resources_base: str) -> models.Note:
+    def _get_note(self, guid: models.NoteGuid):
         note_store = self.client.get_note_store()
 
         # These args must be positional :(
@@ -143,15 +260,23 @@ class Evernote:
         # TypeError("getNote() missing 4 required positional arguments:
         # 'withContent', 'withResourcesData', 'withResourcesRecognition',
         # and 'withResourcesAlternateData'",)
-        note = note_store.getNote(
+        return note_store.getNote(
             guid,
             True,  # withContent
-            True,  # withResourcesData
+            False,  # withResourcesData
             False,  # withResourcesRecognition
             False,  # withResourcesAlternateData
         )
 
-        return self._map_to_note(note, resources_base)
+    @retry_ratelimited(limiter=_rate_limiter)
+    @translate_exceptions
+    def _get_resource_data(self, resource_guid: str) -> bytes:
+        note_store = self.client.get_note_store()
+        return note_store.getResourceData(resource_guid)
+
+    def _resource_filename(self, resource) -> str:
+        chash = binascii.hexlify(resource.data.bodyHash).decode()
+        return note_parser.resource_filename(chash, resource.mime)
 
     def _map_to_notebook_info(self, notebook) -> models.NotebookInfo:
         n = notebook
@@ -205,7 +330,7 @@ class Evernote:
                 resources[chash] = models.NoteResource(
                     body=r.data.body,
                     mime=r.mime,
-                    filename=note_parser.resource_filename(chash, r.mime),
+                    filename=self._resource_filename(r),
                 )
 
         return models.Note(
@@ -218,9 +343,13 @@ class Evernote:
             resources=resources,
         )
 
+    @cached_property
+    def _user(self):
+        return self.client.get_user_store().getUser()
+
     @cached_property
     def _timezone(self) -> datetime.tzinfo:
-        return pytz.timezone(self.client.get_user_store().getUser().timezone)
+        return pytz.timezone(self._user.timezone)
 
     def _normalize_timestamp(self, ts: Optional[int]) -> Optional[datetime.datetime]:
         if not ts:
@@ -0,0 +1,103 @@
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from evernote.edam.type.ttypes import Note, Notebook
+
+from synctogit.service.notes.cached_state import load_cached_state, save_cached_state
+
+# The fields of the Thrift structs which are preserved in the snapshot.
+# They are sufficient to build the `NoteInfo` and `NotebookInfo` models.
+_NOTE_FIELDS = (
+    "guid",
+    "title",
+    "notebookGuid",
+    "updateSequenceNum",
+    "tagGuids",
+    "created",
+    "updated",
+    "deleted",
+)
+_NOTEBOOK_FIELDS = (
+    "guid",
+    "name",
+    "updateSequenceNum",
+    "stack",
+)
+
+
+class MetadataSnapshot:
+    """A local copy of the account's notes and notebooks metadata.
+
+    The snapshot is kept up to date with the Evernote's incremental
+    synchronization protocol: `update_count` is the highest USN
+    which changes have been merged into the snapshot.
+    """
+
+    version = 1
+
+    def __init__(self, snapshot_path: Path) -> None:
+        self.snapshot_path = snapshot_path
+        self.discard()
+
+    def discard(self) -> None:
+        self.user_id = None  # type: Optional[int]
+        self.update_count = 0
+        self.last_sync_time = 0  # type: int  # milliseconds since epoch
+        self.notes = {}  # type: Dict[str, Dict[str, Any]]
+        self.notebooks = {}  # type: Dict[str, Dict[str, Any]]
+
+    def load(self) -> None:
+        if not load_cached_state(
+            self.snapshot_path,
+            self.version,
+            "Evernote metadata snapshot",
+            self._load,
+        ):
+            self.discard()
+
+    def _load(self, data: Dict[str, Any]) -> None:
+        self.user_id = data["user_id"]
+        self.update_count = int(data["update_count"])
+        self.last_sync_time = int(data["last_sync_time"])
+        self.notes = dict(data["notes"])
+        self.notebooks = dict(data["notebooks"])
+
+    def save(self) -> None:
+        save_cached_state(
+            self.snapshot_path,
+            self.version,
+            dict(
+                user_id=self.user_id,
+                update_count=self.update_count,
+                last_sync_time=self.last_sync_time,
+                notes=self.notes,
+                notebooks=self.notebooks,
+            ),
+        )
+
+    def apply_chunk(self, chunk) -> None:
+        for note in chunk.notes or []:
+            if note.active is False:
+                # The note has been moved to the trash.
+                self.notes.pop(note.guid, None)
+            else:
+                self.notes[note.guid] = _to_dict(note, _NOTE_FIELDS)
+        for notebook in chunk.notebooks or []:
+            self.notebooks[notebook.guid] = _to_dict(notebook, _NOTEBOOK_FIELDS)
+        for guid in chunk.expungedNotes or []:
+            self.notes.pop(guid, None)
+        for guid in chunk.expungedNotebooks or []:
+            self.notebooks.pop(guid, None)
+
+    def get_notes(self) -> Iterable[Note]:
+        return [Note(**d) for d in self.notes.values()]
+
+    def get_notebooks(self) -> Iterable[Notebook]:
+        return [Notebook(**d) for d in self.notebooks.values()]
+
+
+def _to_dict(struct, fields) -> Dict[str, Optional[Any]]:
+    d = {field: getattr(struct, field) for field in fields}
+    if d.get("tagGuids") is not None:
+        d["tagGuids"] = list(d["tagGuids"])
+    return d
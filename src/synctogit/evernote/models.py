@@ -1,5 +1,6 @@
 import datetime
-from typing import Iterable, Mapping, NamedTuple, NewType, Optional, Sequence
+from pathlib import Path
+from typing import Iterable, Mapping, NamedTuple, NewType, Optional, Sequence, Union
 
 NotebookGuid = NewType("NotebookGuid", str)
 NoteGuid = NewType("NoteGuid", str)
@@ -30,7 +31,9 @@ class NoteMetadata(NamedTuple):
 
 
 class NoteResource(NamedTuple):
-    body: bytes
+    # A Path is a temporary file with the body which should be moved.
+    # None if the resource is already stored and is unchanged.
+    body: Optional[Union[bytes, Path]]
     mime: str
     filename: str
 
@@ -1,18 +1,28 @@
 import base64
+import functools
 import logging
-from typing import Mapping
+from pathlib import Path
+from typing import Mapping, Optional
 
-from synctogit import templates
 from synctogit.config import BoolConfigItem, Config, IntConfigItem, StrConfigItem
-from synctogit.git_config import git_push, git_remote_name
+from synctogit.git_config import git_commit_every_bytes, git_commit_every_notes
+from synctogit.git_factory import local_git_ignored_cache_dir, local_repo_dir
 from synctogit.git_transaction import GitTransaction
 from synctogit.service import BaseAuth, BaseAuthSession, BaseSync, InvalidAuthSession
-from synctogit.service.notes import SyncIteration, WorkingCopy
+from synctogit.service.notes import SyncIteration
+from synctogit.service.notes.config import (
+    checkpoint_interval_seconds,
+    max_inflight_bytes,
+    notes_render_threads,
+    shared_resources,
+    working_copy_metadata_from_git,
+)
 from synctogit.timezone import get_timezone
 
 from . import index_renderer
 from .auth import InteractiveAuth
 from .evernote import Evernote
+from .metadata_snapshot import MetadataSnapshot
 from .models import Note, NoteGuid, NoteMetadata
 from .working_copy import EvernoteWorkingCopy
 
@@ -82,10 +92,37 @@ class EvernoteAuth(BaseAuth[EvernoteAuthSession]):
 
 
 class EvernoteSync(BaseSync[EvernoteAuthSession]):
+    rate_limiter_name = "evernote"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # Reused by the subsequent syncs.
+        self._evernote = None  # type: Optional[Evernote]
+        self._headers_cache = EvernoteWorkingCopy.create_headers_cache(
+            Path(local_repo_dir(self.git))
+        )
+
     def run_sync(self) -> None:
-        evernote = Evernote(sandbox=evernote_sandbox.get(self.config))
+        if self._evernote is None:
+            self._evernote = self._create_client()
+        self._sync_loop(self._evernote)
+
+    def _create_client(self) -> Evernote:
+        metadata_snapshot = MetadataSnapshot(
+            Path(local_repo_dir(self.git))
+            / local_git_ignored_cache_dir
+            / "evernote_metadata.json"
+        )
+        if not self.force_full_resync:
+            metadata_snapshot.load()
+
+        evernote = Evernote(
+            sandbox=evernote_sandbox.get(self.config),
+            metadata_snapshot=metadata_snapshot,
+            rate_limiter=self.rate_limiter,
+        )
         evernote.auth(self.auth_session.token)
-        self._sync_loop(evernote)
+        return evernote
 
     def _sync_loop(self, evernote):
         any_fail = False
@@ -96,14 +133,13 @@ class EvernoteSync(BaseSync[EvernoteAuthSession]):
 
             logger.info("Starting sync iteration...")
 
-            with GitTransaction(
-                self.git,
-                remote_name=git_remote_name.get(self.config),
-                push=git_push.get(self.config),
-            ) as t:
+            with self.git_transaction() as t:
                 wc = EvernoteWorkingCopy(
                     git_transaction=t,
                     timezone=get_timezone(self.config),
+                    metadata_from_git=working_copy_metadata_from_git.get(self.config),
+                    shared_resources=shared_resources.get(self.config),
+                    headers_cache=self._headers_cache,
                 )
 
                 si = _EvernoteSyncIteration(
@@ -112,6 +148,13 @@ class EvernoteSync(BaseSync[EvernoteAuthSession]):
                     notes_download_threads=notes_download_threads.get(self.config),
                     force_full_resync=self.force_full_resync,
                     git_transaction=t,
+                    max_inflight_bytes=max_inflight_bytes.get(self.config),
+                    notes_render_threads=notes_render_threads.get(self.config),
+                    checkpoint_interval_seconds=checkpoint_interval_seconds.get(
+                        self.config
+                    ),
+                    commit_every_notes=git_commit_every_notes.get(self.config),
+                    commit_every_bytes=git_commit_every_bytes.get(self.config),
                 )
 
                 changeset, update_context = si.run_transaction()
@@ -132,27 +175,20 @@ class EvernoteSync(BaseSync[EvernoteAuthSession]):
 
 
 class _EvernoteSyncIteration(SyncIteration[NoteGuid, NoteMetadata, Note]):
-    def __init__(
-        self,
-        *,
-        evernote: Evernote,
-        working_copy: WorkingCopy,
-        notes_download_threads: int,
-        force_full_resync: bool,
-        git_transaction: GitTransaction
-    ) -> None:
-        super().__init__(
-            working_copy=working_copy,
-            notes_download_threads=notes_download_threads,
-            force_full_resync=force_full_resync,
-            git_transaction=git_transaction,
-        )
+    def __init__(self, *, evernote: Evernote, **kwargs) -> None:
+        super().__init__(**kwargs)
         self.evernote = evernote
 
     def get_note(self, note_key: NoteGuid, note_metadata: NoteMetadata) -> Note:
         return self.evernote.get_note(
             note_key,
-            self.working_copy.get_relative_resources_url(note_key, note_metadata),
+            self.working_copy.get_relative_resources_url(
+                note_key,
+                note_metadata,
+                shared_resources=self.working_copy.shared_resources,
+            ),
+            stored_resources=self.working_copy.get_stored_resource_filenames(note_key),
+            staging_dir=self.working_copy.staging_dir,
         )
 
     def get_service_metadata(self) -> Mapping[NoteGuid, NoteMetadata]:
@@ -173,7 +209,7 @@ class _EvernoteSyncIteration(SyncIteration[NoteGuid, NoteMetadata, Note]):
             )
             for note in service_metadata.values()
         ]
+        index_path = git_transaction.repo_dir / "index.html"
         index_renderer.render(
-            note_links,
-            templates.file_writer(str(git_transaction.repo_dir / "index.html")),
+            note_links, functools.partial(git_transaction.write_bytes, index_path)
         )
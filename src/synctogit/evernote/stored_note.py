@@ -1,7 +1,7 @@
 import re
 from collections import OrderedDict
 from pathlib import Path
-from typing import Mapping, Tuple
+from typing import Mapping, Optional, Tuple
 
 import pytz
 
@@ -27,7 +27,10 @@ class EvernoteStoredNote(StoredNote):
 
     @classmethod
     def get_stored_note_metadata(
-        cls, notes_dir, note_path: Path
+        cls,
+        notes_dir,
+        note_path: Path,
+        header_vars: Optional[Mapping[str, str]] = None,
     ) -> Tuple[NoteGuid, NoteMetadata]:
         dir_parts = note_path.relative_to(notes_dir).parents[0].parts
         if not (1 <= len(dir_parts) <= 2):
@@ -36,7 +39,8 @@ class EvernoteStoredNote(StoredNote):
             )
         file = note_path.name
 
-        header_vars = cls._parse_note_header(note_path)
+        if header_vars is None:
+            header_vars = cls._parse_note_header(note_path)
         try:
             name = (
                 # fmt: off
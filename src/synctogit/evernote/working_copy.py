@@ -1,8 +1,8 @@
 from pathlib import Path
-from typing import Sequence, Tuple
+from typing import Mapping, Sequence, Tuple
 
 from synctogit.evernote.models import Note, NoteGuid, NoteMetadata
-from synctogit.service.notes import Changeset, NoteResource, WorkingCopy
+from synctogit.service.notes import Changeset, NoteResource, RenderedNote, WorkingCopy
 
 from .stored_note import EvernoteStoredNote
 
@@ -33,12 +33,14 @@ class EvernoteWorkingCopy(WorkingCopy[NoteGuid, NoteMetadata, EvernoteChangeset]
         return m1.update_sequence_num != m2.update_sequence_num
 
     def _get_stored_note_metadata(
-        self, notes_dir, note_path: Path
+        self, notes_dir, note_path: Path, header_vars: Mapping[str, str]
     ) -> Tuple[NoteGuid, NoteMetadata]:
-        return EvernoteStoredNote.get_stored_note_metadata(notes_dir, note_path)
+        return EvernoteStoredNote.get_stored_note_metadata(
+            notes_dir, note_path, header_vars
+        )
 
-    def save_note(self, note: Note, metadata: NoteMetadata):
-        super()._save_note(
+    def render_note(self, note: Note, metadata: NoteMetadata) -> RenderedNote:
+        return RenderedNote(
             note_key=note.guid,
             metadata=metadata,
             html_body=EvernoteStoredNote.note_to_html(note, self.timezone),
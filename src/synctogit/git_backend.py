@@ -0,0 +1,210 @@
+import abc
+import subprocess
+from enum import Enum
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import git
+
+from .git_factory import local_repo_dir
+
+# Keep the command lines well below the Windows limit of 32k chars.
+_MAX_ARGV_CHARS = 8000
+
+
+class GitBackendType(Enum):
+    # The git CLI driven by GitPython.
+    gitpython = "gitpython"
+    # libgit2, in-process. Requires the `pygit2` extra.
+    pygit2 = "pygit2"
+
+
+class GitBackend(abc.ABC):
+    """The git operations performed by a `GitTransaction` on the working
+    tree of a non-bare repo.
+
+    The paths are relative to the working tree and are always separated
+    with a forward slash.
+    """
+
+    def __init__(self, repo: git.Repo) -> None:
+        self.git = repo
+        self.repo_dir = Path(local_repo_dir(repo))
+
+    @abc.abstractmethod
+    def is_dirty(self) -> bool:
+        """Whether there are any staged, unstaged or untracked changes."""
+        pass
+
+    @abc.abstractmethod
+    def stash(self) -> None:
+        """Stash all changes, including the untracked files.
+        Must not fail when there're no changes.
+        """
+        pass
+
+    @abc.abstractmethod
+    def stage_all(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def stage_paths(self, paths: Iterable[str]) -> None:
+        """Stage the current state of the `paths` (files or dirs),
+        including their removal.
+        """
+        pass
+
+    @abc.abstractmethod
+    def commit_staged(self, message: str) -> bool:
+        """Commit the index, unless it is the same as HEAD.
+        Returns True if a commit has been created.
+        """
+        pass
+
+    @abc.abstractmethod
+    def head_oid(self) -> Optional[str]:
+        pass
+
+    @abc.abstractmethod
+    def reset_hard(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def push(self, remote_name: str) -> None:
+        """Push the current branch. Raises on failure."""
+        pass
+
+    @abc.abstractmethod
+    def list_tree_blobs(self, path: str) -> Iterator[Tuple[str, str]]:
+        """Yield `(path, blob_oid)` pairs of the files committed under
+        the `path` directory in HEAD.
+        """
+        pass
+
+    @abc.abstractmethod
+    def read_blobs(self, oids: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        """Yield `(blob_oid, contents)` pairs."""
+        pass
+
+
+class GitPythonBackend(GitBackend):
+    def is_dirty(self) -> bool:
+        # A single `git status` instead of the two diffs and the listing
+        # of all the untracked files made by `Repo.is_dirty`. It also
+        # benefits from the untracked cache and fsmonitor, if they are
+        # enabled (see `git_factory`).
+        return bool(self.git.git.status("--porcelain", "--untracked-files=normal"))
+
+    def stash(self) -> None:
+        # Does nothing if there're no changes.
+        self.git.git.stash("--include-untracked")
+
+    def stage_all(self) -> None:
+        # I've had some issues with charset under Windows when using
+        # the python version: self.git.index.add("*")
+        self.git.git.add(["-A", "."])
+
+    def stage_paths(self, paths: Iterable[str]) -> None:
+        existing = []
+        removed = []
+        for path in sorted(paths):
+            (existing if (self.repo_dir / path).exists() else removed).append(path)
+        for chunk in _argv_chunks(existing):
+            self.git.git.add("-A", "--", *chunk)
+        for chunk in _argv_chunks(removed):
+            self.git.git.rm("-r", "-q", "--cached", "--ignore-unmatch", "--", *chunk)
+
+    def commit_staged(self, message: str) -> bool:
+        if self.head_oid() is not None:
+            status, _, _ = self.git.git.diff(
+                "--cached",
+                "--quiet",
+                with_extended_output=True,
+                with_exceptions=False,
+            )
+            if status == 0:
+                return False
+        self.git.index.commit(message)
+        return True
+
+    def head_oid(self) -> Optional[str]:
+        if not self.git.head.is_valid():
+            return None
+        return self.git.head.commit.hexsha
+
+    def reset_hard(self) -> None:
+        self.git.git.reset("--hard", "-q")
+
+    def push(self, remote_name: str) -> None:
+        remote = self.git.remotes[remote_name]
+        pushinfo_list = remote.push(self.git.active_branch.name)
+        assert len(pushinfo_list) == 1
+        for pushinfo in pushinfo_list:
+            if pushinfo.flags & git.PushInfo.ERROR:
+                raise ValueError(pushinfo.summary)
+
+    def list_tree_blobs(self, path: str) -> Iterator[Tuple[str, str]]:
+        output = self.git.git.ls_tree("-r", "-z", "HEAD", "--", path)
+        for line in output.split("\0"):
+            if not line:
+                continue
+            info, file_path = line.split("\t", 1)
+            _, obj_type, oid = info.split(" ")
+            if obj_type == "blob":
+                yield file_path, oid
+
+    def read_blobs(self, oids: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        # A single `git cat-file --batch` process for all of the blobs.
+        proc = self.git.git.cat_file(
+            "--batch", as_process=True, istream=subprocess.PIPE
+        )
+        try:
+            for oid in oids:
+                proc.stdin.write(b"%s\n" % oid.encode())
+                proc.stdin.flush()
+                header = proc.stdout.readline().split()
+                if len(header) != 3:
+                    raise ValueError(
+                        "Unable to read the blob %s: %s" % (oid, b" ".join(header))
+                    )
+                size = int(header[2])
+                contents = proc.stdout.read(size)
+                proc.stdout.read(1)  # Trailing newline
+                yield oid, contents
+        finally:
+            proc.stdin.close()
+            proc.wait()
+
+
+def create_git_backend(repo: git.Repo, backend_type: GitBackendType) -> GitBackend:
+    if backend_type == GitBackendType.pygit2:
+        # pygit2 is an optional dependency.
+        try:
+            from .git_backend_pygit2 import Pygit2Backend
+        except ImportError:
+            raise ValueError(
+                "The pygit2 git backend is not available. Please install "
+                "missing extras with `pip install 'synctogit[pygit2]'`."
+            )
+
+        return Pygit2Backend(repo)
+    return GitPythonBackend(repo)
+
+
+def committer(repo: git.Repo) -> git.Actor:
+    # Respects the GIT_COMMITTER_* env vars, see `git_factory`.
+    return git.Actor.committer(repo.config_reader())
+
+
+def _argv_chunks(args: List[str]) -> Iterator[List[str]]:
+    chunk = []  # type: List[str]
+    chunk_chars = 0
+    for arg in args:
+        if chunk and chunk_chars + len(arg) > _MAX_ARGV_CHARS:
+            yield chunk
+            chunk = []
+            chunk_chars = 0
+        chunk.append(arg)
+        chunk_chars += len(arg) + 1
+    if chunk:
+        yield chunk
@@ -0,0 +1,134 @@
+import bisect
+import os
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import git
+import pygit2
+
+from .git_backend import GitPythonBackend, committer
+
+
+class Pygit2Backend(GitPythonBackend):
+    """The working tree operations are performed in-process by libgit2,
+    so a short sync doesn't spawn a git process per operation, each of
+    them re-reading the index.
+
+    Pushing is left to the git CLI, so the user's ssh and credential
+    helpers are respected.
+    """
+
+    def __init__(self, repo: git.Repo) -> None:
+        super().__init__(repo)
+        self.repo = pygit2.Repository(str(self.repo_dir))
+
+    def is_dirty(self) -> bool:
+        # pygit2 can't stop the scan at the first change, so at least
+        # the untracked dirs are not walked. The ignored files are not
+        # listed, and the clean ones are never.
+        return bool(self.repo.status(untracked_files="normal"))
+
+    def stash(self) -> None:
+        try:
+            self.repo.stash(self._signature(), include_untracked=True)
+        except KeyError:
+            # Nothing to stash.
+            pass
+
+    def stage_all(self) -> None:
+        # Stages the removals as well and skips the ignored files,
+        # the same as `git add -A`.
+        index = self._read_index()
+        index.add_all()
+        index.write()
+
+    def stage_paths(self, paths: Iterable[str]) -> None:
+        index = self._read_index()
+        indexed = sorted(entry.path for entry in index)  # type: List[str]
+        for path in sorted(paths):
+            stale = set(_entries_under(indexed, path))
+            full_path = self.repo_dir / path
+            if full_path.is_dir():
+                files = [
+                    (Path(root) / fn).relative_to(self.repo_dir).as_posix()
+                    for root, _, fns in os.walk(str(full_path))
+                    for fn in fns
+                ]
+            elif full_path.exists():
+                files = [path]
+            else:
+                files = []
+            for file_path in files:
+                if file_path in stale:
+                    stale.discard(file_path)
+                elif self.repo.path_is_ignored(file_path):
+                    # The same as `git add`, which skips the untracked
+                    # ignored files.
+                    continue
+                index.add(file_path)
+            for file_path in stale:
+                index.remove(file_path)
+        index.write()
+
+    def commit_staged(self, message: str) -> bool:
+        index = self._read_index()
+        tree = index.write_tree()
+        parents = []
+        if not self.repo.head_is_unborn:
+            head = self.repo.head.peel(pygit2.Commit)
+            if head.tree_id == tree:
+                return False
+            parents = [head.id]
+        signature = self._signature()
+        self.repo.create_commit("HEAD", signature, signature, message, tree, parents)
+        return True
+
+    def head_oid(self) -> Optional[str]:
+        if self.repo.head_is_unborn:
+            return None
+        return str(self.repo.head.target)
+
+    def reset_hard(self) -> None:
+        self.repo.reset(self.repo.head.target, pygit2.GIT_RESET_HARD)
+
+    def list_tree_blobs(self, path: str) -> Iterator[Tuple[str, str]]:
+        if self.repo.head_is_unborn:
+            return
+        tree = self.repo.head.peel(pygit2.Commit).tree
+        try:
+            obj = tree[path]
+        except KeyError:
+            return
+        yield from _walk_tree(self.repo, path, obj)
+
+    def read_blobs(self, oids: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        for oid in oids:
+            yield oid, self.repo[oid].data
+
+    def _read_index(self) -> pygit2.Index:
+        # The index might have been changed by the git CLI.
+        index = self.repo.index
+        index.read()
+        return index
+
+    def _signature(self) -> pygit2.Signature:
+        actor = committer(self.git)
+        return pygit2.Signature(actor.name, actor.email)
+
+
+def _entries_under(indexed: List[str], path: str) -> Iterator[str]:
+    # `indexed` is sorted, so the entries of the `path` dir follow it.
+    i = bisect.bisect_left(indexed, path)
+    while i < len(indexed) and indexed[i].startswith(path):
+        entry = indexed[i]
+        if entry == path or entry.startswith(path + "/"):
+            yield entry
+        i += 1
+
+
+def _walk_tree(repo: pygit2.Repository, path: str, obj) -> Iterator[Tuple[str, str]]:
+    if isinstance(obj, pygit2.Blob):
+        yield path, str(obj.id)
+    elif isinstance(obj, pygit2.Tree):
+        for entry in repo[obj.id]:
+            yield from _walk_tree(repo, path + "/" + entry.name, repo[entry.id])
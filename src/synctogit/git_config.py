@@ -1,7 +1,29 @@
-from synctogit.config import BoolConfigItem, StrConfigItem
+from synctogit.config import (
+    BoolConfigItem,
+    EnumConfigItem,
+    IntConfigItem,
+    StrConfigItem,
+)
+from synctogit.git_backend import GitBackendType
 
+# "gitpython" (the git CLI) or "pygit2" (libgit2, requires the pygit2 extra).
+git_backend = EnumConfigItem("git", "backend", GitBackendType, GitBackendType.gitpython)
+git_bare = BoolConfigItem("git", "bare", False)
+# Enable the untracked cache and fsmonitor in the repo, so the status
+# checks of the working tree are cheaper.
+git_fast_status = BoolConfigItem("git", "fast_status", False)
 git_branch = StrConfigItem("git", "branch", "master")
 git_push = BoolConfigItem("git", "push", False)
+# Push in background, retrying the failed pushes, instead of waiting
+# for the remote at the end of each sync.
+git_background_push = BoolConfigItem("git", "background_push", False)
 git_remote = StrConfigItem("git", "remote", None)
 git_remote_name = StrConfigItem("git", "remote_name", "origin")
 git_repo_dir = StrConfigItem("git", "repo_dir")
+# Stage only the files changed by the sync instead of the whole working tree.
+# The other changes of the working tree are left uncommitted then.
+git_targeted_staging = BoolConfigItem("git", "targeted_staging", False)
+# Commit every that many saved notes or bytes during a sync.
+# 0 means a single commit per sync.
+git_commit_every_notes = IntConfigItem("git", "commit_every_notes", 0)
+git_commit_every_bytes = IntConfigItem("git", "commit_every_bytes", 0)
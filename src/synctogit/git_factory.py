@@ -1,5 +1,6 @@
 import contextlib
 import os
+import subprocess
 from typing import Optional
 
 import git
@@ -31,16 +32,39 @@ def git_factory(
     *,
     branch: str = "master",
     remote_name: str = "origin",
-    remote: str = None
+    remote: str = None,
+    bare: bool = False,
+    fast_status: bool = False
 ) -> git.Repo:
     return _GitFactory(
-        repo_dir=repo_dir, branch=branch, remote_name=remote_name, remote=remote
+        repo_dir=repo_dir,
+        branch=branch,
+        remote_name=remote_name,
+        remote=remote,
+        bare=bare,
+        fast_status=fast_status,
     ).git
 
 
+def local_repo_dir(repo: git.Repo) -> str:
+    """The dir where the local files of a sync are kept: the working tree
+    of a regular repo, or the git dir of a bare one.
+    """
+    if repo.bare:
+        return repo.git_dir
+    return repo.working_tree_dir
+
+
 class _GitFactory:
     def __init__(
-        self, repo_dir: str, *, branch: str, remote_name: str, remote: Optional[str]
+        self,
+        repo_dir: str,
+        *,
+        branch: str,
+        remote_name: str,
+        remote: Optional[str],
+        bare: bool,
+        fast_status: bool
     ) -> None:
         repo_dir = os.path.realpath(repo_dir) + os.sep
 
@@ -48,6 +72,8 @@ class _GitFactory:
         self.branch = branch
         self.remote_name = remote_name
         self.remote = remote
+        self.bare = bare
+        self.fast_status = fast_status
         self.git = self._check_init_git()
 
     def _check_init_git(self):
@@ -69,7 +95,15 @@ class _GitFactory:
 
     def _load_existing_git_repo(self) -> git.Repo:
         repo = git.Repo(self.repo_dir)
-        expected_path = os.path.normpath(self.repo_dir + os.sep + ".git")
+        if repo.bare != self.bare:
+            raise GitError(
+                "Git repo is %sbare, but a %sbare one has been requested"
+                % ("" if repo.bare else "not ", "" if self.bare else "non-")
+            )
+        if self.bare:
+            expected_path = os.path.normpath(self.repo_dir)
+        else:
+            expected_path = os.path.normpath(self.repo_dir + os.sep + ".git")
         chosen_path = os.path.normpath(repo.git_dir)
         # Ensure that the chosen Git repo is not some other higher level repo.
         assert chosen_path == expected_path
@@ -86,17 +120,32 @@ class _GitFactory:
                 "commit manually or simply delete the .git directory."
             )
         self._ensure_remote(repo)
-        self._ensure_gitignore(repo)
+        if not self.bare:
+            self._ensure_gitignore(repo)
+            self._ensure_fast_status(repo)
         return repo
 
     def _init_new_git_repo(self) -> git.Repo:
-        repo = git.Repo.init(self.repo_dir)
+        repo = git.Repo.init(self.repo_dir, bare=self.bare)
         # Create orphan branch
         repo.head.reference = git.Head(repo, "refs/heads/%s" % self.branch)
-        self._ensure_gitignore(repo)
+        if self.bare:
+            self._initial_bare_commit(repo)
+        else:
+            self._ensure_gitignore(repo)
+            self._ensure_fast_status(repo)
         self._ensure_remote(repo)
         return repo
 
+    def _initial_bare_commit(self, repo: git.Repo) -> None:
+        # There's no working tree, so there's nothing to ignore, but
+        # the branch must not be empty.
+        empty_tree = repo.git.mktree(istream=subprocess.DEVNULL)
+        commit = repo.git.commit_tree(
+            empty_tree, "-m", "Initial commit (automated commit by synctogit)"
+        )
+        repo.git.update_ref("HEAD", commit)
+
     def _ensure_remote(self, repo: git.Repo) -> None:
         if not self.remote:
             return
@@ -112,6 +161,22 @@ class _GitFactory:
                 )
         assert origin.exists()
 
+    def _ensure_fast_status(self, repo: git.Repo) -> None:
+        # The untracked cache lets `git status` skip the dirs which
+        # haven't been changed, and the builtin fsmonitor daemon tells
+        # git which files have been changed, so the status checks don't
+        # have to walk the whole working tree.
+        if not self.fast_status:
+            return
+        settings = {"core.untrackedCache": "true"}
+        # The daemon is not available on every platform.
+        if "fsmonitor--daemon" in repo.git.version("--build-options"):
+            settings["core.fsmonitor"] = "true"
+        for name, value in settings.items():
+            current = repo.git.config("--local", "--get", name, with_exceptions=False)
+            if current != value:
+                repo.git.config("--local", name, value)
+
     def _ensure_gitignore(self, repo: git.Repo) -> None:
         gitignore_path = os.path.join(self.repo_dir, ".gitignore")
 
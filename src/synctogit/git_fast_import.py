@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, Set
+
+import git
+
+from .git_backend import committer
+from .git_factory import GitError
+from .git_tree import BaseGitTree, TBlobBody, open_blob_body
+
+logger = logging.getLogger(__name__)
+
+_copy_chunk_size = 1024 * 1024
+
+
+class FastImportTree(BaseGitTree):
+    """The tree of a bulk import.
+
+    The blobs are streamed to a single `git fast-import` process as soon
+    as they are written, so the memory consumption doesn't depend on
+    the size of the import: only the paths and the oids of the files
+    are kept. The objects of a large import are written to a packfile
+    instead of a loose object per file.
+    """
+
+    def __init__(self, repo: git.Repo, root: Path) -> None:
+        super().__init__(repo, root)
+        self._proc = None
+        # The commands must not be interleaved.
+        self._proc_lock = threading.Lock()
+        # The blobs which are not readable by the other git commands yet.
+        self._unflushed = set()  # type: Set[str]
+        self._progress = 0
+
+    def load(self) -> None:
+        # The oids of the blobs are computed without waiting for
+        # fast-import (see `_store_blob`).
+        object_format = self.git.config_reader().get_value(
+            "extensions", "objectformat", "sha1"
+        )
+        if object_format != "sha1":
+            raise GitError(
+                "Bulk import is not supported for the %s repos" % object_format
+            )
+        self._load_files()
+        self._proc = self.git.git.fast_import(
+            "--quiet", "--done", as_process=True, istream=subprocess.PIPE
+        )
+
+    def close(self) -> None:
+        with self._proc_lock:
+            proc, self._proc = self._proc, None
+        if proc is None or proc.returncode is not None:
+            # Not started or aborted.
+            return
+        try:
+            try:
+                proc.stdin.write(b"done\n")
+            finally:
+                proc.stdin.close()
+            proc.wait()
+        except Exception as e:
+            logger.warning("git fast-import has failed: %r", e)
+
+    def read_bytes(self, path: Path) -> bytes:
+        relpath = self._relpath(path)
+        with self._lock:
+            entry = self._files.get(relpath)
+        if entry is not None and entry[1] in self._unflushed:
+            with self._proc_lock:
+                self._flush()
+        return super().read_bytes(path)
+
+    def commit(self, message: str) -> None:
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        if not pending:
+            return
+
+        actor = committer(self.git)
+        message_bytes = message.encode()
+        commands = [
+            b"commit %s\n" % self.git.head.reference.path.encode(),
+            b"committer %s <%s> %d +0000\n"
+            % (actor.name.encode(), actor.email.encode(), int(time.time())),
+            b"data %d\n%s\n" % (len(message_bytes), message_bytes),
+        ]  # type: List[bytes]
+        if self.git.head.is_valid():
+            commands.append(b"from %s\n" % self.git.head.commit.hexsha.encode())
+        # Removals go first, so a file could replace a dir.
+        commands.extend(
+            b"D %s\n" % _quote_path(file_path)
+            for file_path, entry in pending.items()
+            if entry is None
+        )
+        commands.extend(
+            b"M %s %s %s\n"
+            % (entry[0].encode(), entry[1].encode(), _quote_path(file_path))
+            for file_path, entry in pending.items()
+            if entry is not None
+        )
+        commands.append(b"\n")
+
+        with self._proc_lock:
+            for command in commands:
+                self._proc.stdin.write(command)
+            # The branch is updated by the checkpoint.
+            self._flush()
+
+    def _store_blob(self, body: TBlobBody) -> str:
+        with open_blob_body(body) as (stream, size):
+            h = hashlib.sha1(b"blob %d\0" % size)
+            with self._proc_lock:
+                self._proc.stdin.write(b"blob\ndata %d\n" % size)
+                remaining = size
+                while remaining:
+                    chunk = stream.read(min(remaining, _copy_chunk_size))
+                    if not chunk:
+                        # The size has already been sent, so the rest
+                        # of the stream would be taken for the blob.
+                        self._abort()
+                        raise ValueError("Blob is shorter than %d bytes" % size)
+                    h.update(chunk)
+                    self._proc.stdin.write(chunk)
+                    remaining -= len(chunk)
+                self._proc.stdin.write(b"\n")
+                oid = h.hexdigest()
+                self._unflushed.add(oid)
+        return oid
+
+    def _abort(self) -> None:
+        # Must be called under the `_proc_lock`.
+        # Nothing after the last checkpoint is imported then.
+        self._proc.kill()
+        try:
+            # Drops the buffered commands, which can't be written anymore.
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            self._proc.wait()
+        except git.exc.GitCommandError:
+            pass
+
+    def _flush(self) -> None:
+        # Must be called under the `_proc_lock`.
+        # Wait until fast-import has written the packfile and updated
+        # the refs: the progress line is printed once everything before
+        # it has been processed.
+        self._progress += 1
+        progress = b"progress synctogit %d\n" % self._progress
+        self._proc.stdin.write(b"checkpoint\n" + progress)
+        self._proc.stdin.flush()
+        while True:
+            line = self._proc.stdout.readline()
+            if not line:
+                # Raises the error of the process.
+                self._proc.wait()
+                raise git.exc.GitCommandError(
+                    ["git", "fast-import"], self._proc.returncode
+                )
+            if line == progress:
+                break
+        self._unflushed.clear()
+
+
+def _quote_path(path: str) -> bytes:
+    quoted = path.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ('"%s"' % quoted).encode()
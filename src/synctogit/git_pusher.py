@@ -0,0 +1,174 @@
+import logging
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import git
+
+from .git_backend import GitPythonBackend
+from .git_factory import local_repo_dir
+
+logger = logging.getLogger(__name__)
+
+
+class PushStatus(NamedTuple):
+    # There are commits which are waiting to be pushed.
+    is_pending: bool
+    is_pushing: bool
+    # The number of the consecutive failed attempts.
+    failed_attempts: int
+    last_error: Optional[str]
+    # Unix time of the last successful push.
+    last_pushed_at: Optional[float]
+
+
+class GitPusher:
+    """Pushes the current branch in a background thread, so the sync
+    doesn't wait for the remote.
+
+    The push requests made while a push is in progress are coalesced
+    into a single subsequent push of the branch, which includes all of
+    the commits made so far. A failed push is retried with an
+    exponential back-off until it succeeds or the pusher is closed.
+    """
+
+    # Must be thread-safe.
+
+    def __init__(
+        self,
+        repo: git.Repo,
+        *,
+        remote_name: str = "origin",
+        min_retry_delay_seconds: float = 5.0,
+        max_retry_delay_seconds: float = 600.0
+    ) -> None:
+        # A separate Repo, so its caches aren't shared with the sync thread.
+        self.backend = GitPythonBackend(git.Repo(local_repo_dir(repo)))
+        self.remote_name = remote_name
+        self.min_retry_delay_seconds = min_retry_delay_seconds
+        self.max_retry_delay_seconds = max_retry_delay_seconds
+
+        self._cond = threading.Condition()
+        self._thread = None  # type: Optional[threading.Thread]
+        self._is_closed = False
+        self._is_pending = False
+        self._is_pushing = False
+        self._attempts = 0
+        self._failed_attempts = 0
+        self._retry_at = 0.0
+        # The attempts awaited by `flush` are not delayed.
+        self._flush_attempts = 0
+        self._last_error = None  # type: Optional[str]
+        self._last_pushed_at = None  # type: Optional[float]
+
+    def start(self) -> None:
+        with self._cond:
+            assert self._thread is None
+            self._thread = threading.Thread(
+                target=self._run, name="synctogit-git-pusher", daemon=True
+            )
+            self._thread.start()
+
+    def request_push(self) -> None:
+        """Schedule a push of the commits made so far."""
+        with self._cond:
+            self._is_pending = True
+            self._cond.notify_all()
+
+    def status(self) -> PushStatus:
+        with self._cond:
+            return PushStatus(
+                is_pending=self._is_pending,
+                is_pushing=self._is_pushing,
+                failed_attempts=self._failed_attempts,
+                last_error=self._last_error,
+                last_pushed_at=self._last_pushed_at,
+            )
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Push the pending commits right away, without waiting for
+        the back-off of a failed push, and wait for the result.
+
+        Returns True if there's nothing left to push.
+        """
+        with self._cond:
+            if not self._is_pending and not self._is_pushing:
+                return True
+            # The push which is in progress doesn't include the commits
+            # requested after it has been started, so then the next
+            # attempt is awaited as well.
+            attempts = self._attempts + 1
+            if self._is_pushing and self._is_pending:
+                attempts += 1
+            self._flush_attempts = max(self._flush_attempts, attempts)
+            self._retry_at = 0.0
+            self._cond.notify_all()
+            self._cond.wait_for(
+                lambda: self._attempts >= attempts or self._is_closed, timeout
+            )
+            return not self._is_pending and not self._is_pushing
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """Flush the pending commits and stop the thread.
+
+        Returns True if everything has been pushed.
+        """
+        is_pushed = self.flush(timeout)
+        with self._cond:
+            self._is_closed = True
+            self._cond.notify_all()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+        if not is_pushed:
+            logger.warning(
+                "Some commits haven't been pushed. They will be pushed by "
+                "the next sync. The last error: %s",
+                self._last_error,
+            )
+        return is_pushed
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._is_closed:
+                    delay = self._retry_at - time.monotonic()
+                    if self._is_pending and delay <= 0:
+                        break
+                    self._cond.wait(delay if self._is_pending else None)
+                if self._is_closed:
+                    return
+                self._is_pending = False
+                self._is_pushing = True
+
+            error = None  # type: Optional[Exception]
+            try:
+                self.backend.push(self.remote_name)
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                self._is_pushing = False
+                self._attempts += 1
+                if error is None:
+                    self._failed_attempts = 0
+                    self._last_error = None
+                    self._last_pushed_at = time.time()
+                else:
+                    # The failed commits are pushed along with the next ones.
+                    self._is_pending = True
+                    self._failed_attempts += 1
+                    self._last_error = repr(error)
+                    delay = min(
+                        self.max_retry_delay_seconds,
+                        self.min_retry_delay_seconds * 2 ** (self._failed_attempts - 1),
+                    )
+                    if self._attempts < self._flush_attempts:
+                        delay = 0
+                    self._retry_at = time.monotonic() + delay
+                    logger.warning(
+                        "Unable to git push: %r. Retrying in %d seconds...",
+                        error,
+                        delay,
+                    )
+                self._cond.notify_all()
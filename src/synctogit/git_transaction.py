@@ -1,10 +1,22 @@
 import datetime
 import logging
+import os
+import shutil
+import threading
 from pathlib import Path
+from typing import Iterable, Iterator, Optional, Set, Tuple
 
 import git
 
-from .git_factory import gitignore_synctogit_files_prefix
+from .git_backend import GitBackendType, create_git_backend
+from .git_factory import (
+    gitignore_synctogit_files_prefix,
+    local_git_ignored_cache_dir,
+    local_repo_dir,
+)
+from .git_fast_import import FastImportTree
+from .git_pusher import GitPusher
+from .git_tree import BaseGitTree, GitTree
 
 logger = logging.getLogger(__name__)
 
@@ -32,18 +44,65 @@ class GitTransaction:
     # Must be thread-safe.
 
     def __init__(
-        self, repo: git.Repo, *, push: bool = False, remote_name: str = "origin"
+        self,
+        repo: git.Repo,
+        *,
+        push: bool = False,
+        remote_name: str = "origin",
+        targeted_staging: bool = False,
+        bulk_import: bool = False,
+        backend: GitBackendType = GitBackendType.gitpython,
+        pusher: Optional[GitPusher] = None
     ) -> None:
         self.git = repo
+        self.backend = create_git_backend(repo, backend)
         self.push = push
+        # Push in background with the pusher instead of pushing before
+        # leaving the transaction. The push errors are not raised then.
+        self.pusher = pusher
         self.remote_name = remote_name
+        # Never stage the whole working tree, only the paths passed
+        # to `touch`. The changes made outside of the transactions are
+        # left uncommitted then.
+        self.targeted_staging = targeted_staging
+        # Stream the files to a `git fast-import` process instead of
+        # writing them to the working tree, which is updated only once
+        # the transaction is over. Intended for the initial imports.
+        self.bulk_import = bulk_import
 
-        self.repo_dir = Path(repo.working_tree_dir)
+        # A bare repo has no working tree: the files are written directly
+        # to the git objects (see `tree`), and `repo_dir` is the git dir,
+        # which keeps the lockfile and the local caches.
+        self.is_bare = repo.bare
+        # The files are accessed via the tree instead of the working tree
+        # when it is set.
+        self.tree = None  # type: Optional[BaseGitTree]
+        self._head_at_enter = None  # type: Optional[str]
+
+        self.repo_dir = Path(local_repo_dir(repo))
         lockfile_name = "%s.lockfile" % gitignore_synctogit_files_prefix
         self.lockfile_path = self.repo_dir / lockfile_name
 
         self.transaction_commit_message = None
 
+        self._touched_paths = set()  # type: Set[Path]
+        self._touched_paths_lock = threading.Lock()
+        # Whether anything has been changed via the transaction since
+        # the last commit. Unless it is set, the working tree of a failed
+        # transaction has to be scanned for the changes, which is slow
+        # for the large repos.
+        self._has_changes = False
+        # Keeps the HEAD which the last transaction has ended clean at.
+        # The working tree is not scanned for the leftovers on entering
+        # while it matches the HEAD.
+        self._clean_head_path = (
+            self.repo_dir / local_git_ignored_cache_dir / "clean_head"
+        )
+        # Whether the working tree could have been changed outside
+        # of the transaction, so the touched paths are not enough
+        # to commit all of the changes.
+        self._may_have_untouched_changes = True
+
     def __enter__(self):
         if self.lockfile_path.is_file():
             raise GitSimultaneousTransaction(
@@ -52,22 +111,142 @@ class GitTransaction:
                 "a mistake: %s" % self.lockfile_path
             )
 
-        self._stash()
+        self._head_at_enter = self._head_oid()
+        if not self.is_bare:
+            # The sync might fail and leave the working tree dirty, so
+            # the clean head is removed until the transaction is over.
+            is_clean = self._pop_clean_head() == self._head_at_enter
+            if not is_clean:
+                self._stash()
+            self._may_have_untouched_changes = is_clean
+
+        if self.bulk_import:
+            self.tree = FastImportTree(self.git, self.repo_dir)
+        elif self.is_bare:
+            self.tree = GitTree(
+                self.git,
+                self.repo_dir,
+                self.repo_dir / local_git_ignored_cache_dir / "index",
+            )
+        if self.tree is not None:
+            self.tree.load()
         self.lockfile_path.write_bytes(b"1")
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         rmfile_silent(self.lockfile_path)
 
-        if exc_type is not None:
-            self._stash()
+        if self.tree is not None:
+            try:
+                # The changes of a failed transaction are simply dropped.
+                if exc_type is None:
+                    self.tree.commit(self._get_commit_message())
+            finally:
+                self.tree.close()
+                self.tree = None
+                if not self.is_bare:
+                    self._checkout_head()
+            if exc_type is None:
+                self._push()
+        elif exc_type is not None:
+            self._stash(known_dirty=self._has_changes)
         else:
-            if self.git.is_dirty(untracked_files=True):
+            if self.targeted_staging or not self._may_have_untouched_changes:
+                self._commit_touched_paths(self._get_commit_message())
+            else:
                 self._commit_changes()
+            self._save_clean_head()
 
             self._push()
 
+    def touch(self, *paths: Path) -> None:
+        """Record the paths (files or dirs) which have been created, changed
+        or removed within the transaction, so they could be committed
+        without scanning the whole working tree.
+
+        The paths changed with `write_bytes` and `remove_path` are recorded
+        automatically. Only the changes made bypassing the transaction
+        must be touched explicitly.
+        """
+        with self._touched_paths_lock:
+            self._touched_paths.update(paths)
+            self._has_changes = True
+
+    def checkpoint(self) -> None:
+        """Commit the changes of the paths touched so far, so they would
+        be kept even if the transaction fails. Nothing is pushed.
+
+        Only the touched paths are staged, so the cost of a checkpoint
+        doesn't depend on the size of the working tree.
+        """
+        message = "Sync checkpoint at %s" % _datetime_now().strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+        if self.tree is not None:
+            self.tree.commit(message)
+        else:
+            self._commit_touched_paths(message)
+
+    # The files of the repo must be accessed with the methods below,
+    # so they would work for the bare repos as well.
+
+    def is_file(self, path: Path) -> bool:
+        if self.tree is not None:
+            return self.tree.is_file(path)
+        return path.is_file()
+
+    def is_dir(self, path: Path) -> bool:
+        if self.tree is not None:
+            return self.tree.is_dir(path)
+        return path.is_dir()
+
+    def listdir(self, path: Path) -> Set[str]:
+        """Return the names of the files and dirs in the `path` dir.
+        A missing dir is considered empty.
+        """
+        if self.tree is not None:
+            return self.tree.listdir(path)
+        try:
+            return set(os.listdir(str(path)))
+        except (FileNotFoundError, NotADirectoryError):
+            return set()
+
+    def read_bytes(self, path: Path) -> bytes:
+        if self.tree is not None:
+            return self.tree.read_bytes(path)
+        return path.read_bytes()
+
+    def write_bytes(self, path: Path, data: bytes) -> None:
+        """Write the file, creating its parent dirs."""
+        if self.tree is not None:
+            self.tree.write(path, data)
+            return
+        os.makedirs(str(path.parents[0]), exist_ok=True)
+        path.write_bytes(data)
+        self.touch(path)
+
+    def makedirs(self, path: Path) -> None:
+        # There are no empty dirs in git, so the tree creates them
+        # implicitly along with the files.
+        if self.tree is None:
+            os.makedirs(str(path), exist_ok=True)
+
+    def remove_path(self, path: Path) -> None:
+        """Remove the `path` file or dir, if it exists."""
+        if self.tree is not None:
+            self.tree.remove(path)
+        elif path.is_dir():
+            shutil.rmtree(str(path))
+            self.touch(path)
+        elif path.exists():
+            rmfile_silent(path)
+            self.touch(path)
+
     def remove_dirs_until_not_empty(self, path: Path) -> None:
+        if self.tree is not None:
+            # Empty dirs are removed from the tree automatically.
+            return
+
         assert self.repo_dir.is_absolute()
         assert path.is_absolute()
 
@@ -84,30 +263,76 @@ class GitTransaction:
                 pass
             path = path.parents[0]
 
-    def _stash(self):
-        if self.git.is_dirty(untracked_files=True):
+    def list_tree_blobs(self, path: str) -> Iterator[Tuple[str, str]]:
+        """Yield `(path, blob_oid)` pairs of the files committed under
+        the `path` directory in HEAD. The paths are relative to
+        the repo root and are always separated with a forward slash.
+        """
+        return self.backend.list_tree_blobs(path)
+
+    def read_blobs(self, oids: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        """Yield `(blob_oid, contents)` pairs."""
+        return self.backend.read_blobs(oids)
+
+    def _head_oid(self) -> Optional[str]:
+        return self.backend.head_oid()
+
+    def _checkout_head(self) -> None:
+        # The working tree hasn't been touched by the tree, so it still
+        # matches the HEAD at the beginning of the transaction.
+        if self._head_oid() != self._head_at_enter:
+            self.backend.reset_hard()
+
+    def _pop_clean_head(self) -> Optional[str]:
+        try:
+            head = self._clean_head_path.read_text().strip()
+        except FileNotFoundError:
+            return None
+        rmfile_silent(self._clean_head_path)
+        return head
+
+    def _save_clean_head(self) -> None:
+        head = self._head_oid()
+        if head is None:
+            return
+        os.makedirs(str(self._clean_head_path.parent), exist_ok=True)
+        self._clean_head_path.write_text(head)
+
+    def _stash(self, known_dirty: bool = False):
+        if known_dirty or self.backend.is_dirty():
             logger.warning("Git repo is dirty. Working copy is going to be be stashed.")
 
-            self.git.git.stash("--include-untracked")
+            self.backend.stash()
 
     def _commit_changes(self):
-        # I've had some issues with charset under Windows when using
-        # the python version: self.git.index.add("*")
-        self.git.git.add(["-A", "."])
+        self.backend.stage_all()
+        self.backend.commit_staged(self._get_commit_message())
+
+    def _get_commit_message(self) -> str:
         message = self.transaction_commit_message
         if not message:
             message = "Sync at %s" % _datetime_now().strftime("%Y-%m-%d %H:%M:%S")
-        self.git.index.commit(message)
+        return message
+
+    def _commit_touched_paths(self, message: str) -> None:
+        with self._touched_paths_lock:
+            paths = self._touched_paths
+            self._touched_paths = set()
+            self._has_changes = False
+        if not paths:
+            return
+        self.backend.stage_paths(
+            path.relative_to(self.repo_dir).as_posix() for path in paths
+        )
+        self.backend.commit_staged(message)
 
     def _push(self):
         if not self.push:
             return
+        if self.pusher is not None:
+            self.pusher.request_push()
+            return
         try:
-            remote = self.git.remotes[self.remote_name]
-            pushinfo_list = remote.push(self.git.active_branch.name)
-            assert len(pushinfo_list) == 1
-            for pushinfo in pushinfo_list:
-                if pushinfo.flags & git.PushInfo.ERROR:
-                    raise ValueError(pushinfo.summary)
+            self.backend.push(self.remote_name)
         except Exception as e:
             raise GitPushError("Unable to git push: %s" % repr(e))
@@ -0,0 +1,271 @@
+import abc
+import contextlib
+import io
+import os
+import subprocess
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, Set, Tuple, Union
+
+import git
+from gitdb import IStream
+
+_blob_mode = "100644"
+_null_oid = "0" * 40
+
+# The contents of a blob: either the bytes, a path to a file or
+# a file-like object which is read from its current position.
+TBlobBody = Union[bytes, Path, BinaryIO]
+
+
+@contextlib.contextmanager
+def open_blob_body(body: TBlobBody) -> Iterator[Tuple[BinaryIO, int]]:
+    """Yield a `(stream, size)` pair of the blob `body`."""
+    if isinstance(body, bytes):
+        yield io.BytesIO(body), len(body)
+    elif isinstance(body, Path):
+        with open(str(body), "rb") as f:
+            yield f, os.fstat(f.fileno()).st_size
+    else:
+        pos = body.tell()
+        size = body.seek(0, io.SEEK_END) - pos
+        body.seek(pos)
+        yield body, size
+
+
+class BaseGitTree(abc.ABC):
+    """A git tree which is modified without a working tree.
+
+    The tree of HEAD is kept in memory, the blobs are written straight
+    to the object database, and a new commit is built from the previous
+    tree plus the changes, so the files are never checked out.
+
+    The paths are absolute and must be within the `root` dir,
+    the same as for the working tree of a non-bare repo.
+    """
+
+    # Must be thread-safe.
+
+    def __init__(self, repo: git.Repo, root: Path) -> None:
+        self.git = repo
+        self.root = root
+        self._lock = threading.Lock()
+        self._files = {}  # type: Dict[str, Tuple[str, str]]
+        self._dirs = {"": set()}  # type: Dict[str, Set[str]]
+        # Changes which have not been committed yet. None means removal.
+        self._pending = {}  # type: Dict[str, Optional[Tuple[str, str]]]
+
+    @abc.abstractmethod
+    def load(self) -> None:
+        """Read the tree of HEAD."""
+        pass
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        """Release the resources. The uncommitted changes are dropped."""
+        pass
+
+    @abc.abstractmethod
+    def commit(self, message: str) -> None:
+        """Commit the changes to the current branch."""
+        pass
+
+    @abc.abstractmethod
+    def _store_blob(self, body: TBlobBody) -> str:
+        """Write the blob to the object database and return its oid."""
+        pass
+
+    def _load_files(self) -> None:
+        files = {}
+        if self.git.head.is_valid():
+            output = self.git.git.ls_tree("-r", "-z", "HEAD")
+            for line in output.split("\0"):
+                if not line:
+                    continue
+                info, file_path = line.split("\t", 1)
+                mode, obj_type, oid = info.split(" ")
+                if obj_type == "blob":
+                    files[file_path] = (mode, oid)
+
+        with self._lock:
+            self._files = {}
+            self._dirs = {"": set()}
+            self._pending = {}
+            for file_path, entry in files.items():
+                self._add(file_path, entry)
+            self._pending = {}
+
+    def is_file(self, path: Path) -> bool:
+        relpath = self._relpath(path)
+        with self._lock:
+            return relpath in self._files
+
+    def is_dir(self, path: Path) -> bool:
+        relpath = self._relpath(path)
+        with self._lock:
+            return relpath in self._dirs
+
+    def listdir(self, path: Path) -> Set[str]:
+        """Return the names of the files and dirs in the `path` dir.
+        A missing dir is considered empty.
+        """
+        relpath = self._relpath(path)
+        with self._lock:
+            return set(self._dirs.get(relpath, ()))
+
+    def read_bytes(self, path: Path) -> bytes:
+        relpath = self._relpath(path)
+        with self._lock:
+            entry = self._files.get(relpath)
+        if entry is None:
+            raise FileNotFoundError(str(path))
+        _, oid = entry
+        return self.git.git.cat_file("blob", oid, stdout_as_string=False)
+
+    def write(self, path: Path, body: TBlobBody) -> None:
+        """Write the `body` blob to the object database and put it
+        to the `path`, replacing whatever has been there.
+        """
+        relpath = self._relpath(path)
+        if not relpath:
+            raise ValueError("Unable to write a file to the tree root")
+        oid = self._store_blob(body)
+        with self._lock:
+            self._add(relpath, (_blob_mode, oid))
+
+    def remove(self, path: Path) -> None:
+        """Remove the `path` file or dir, if it exists."""
+        relpath = self._relpath(path)
+        with self._lock:
+            self._remove(relpath)
+
+    def _relpath(self, path: Path) -> str:
+        # raises ValueError if path is not within root
+        relpath = path.relative_to(self.root).as_posix()
+        return "" if relpath == "." else relpath
+
+    def _add(self, relpath: str, entry: Tuple[str, str]) -> None:
+        if self._files.get(relpath) == entry:
+            return
+        # A file replaces a dir with the same name and vice versa.
+        self._remove_dir(relpath)
+        parts = relpath.split("/")
+        for i in range(1, len(parts)):
+            self._remove_file("/".join(parts[:i]))
+
+        self._files[relpath] = entry
+        self._pending[relpath] = entry
+        self._link(relpath)
+
+    def _remove(self, relpath: str) -> None:
+        self._remove_file(relpath)
+        self._remove_dir(relpath)
+
+    def _remove_file(self, relpath: str) -> None:
+        if relpath not in self._files:
+            return
+        del self._files[relpath]
+        self._pending[relpath] = None
+        self._unlink(relpath)
+
+    def _remove_dir(self, relpath: str) -> None:
+        if not relpath or relpath not in self._dirs:
+            return
+        for name in list(self._dirs[relpath]):
+            self._remove("%s/%s" % (relpath, name))
+
+    def _link(self, relpath: str) -> None:
+        while relpath:
+            parent, _, name = relpath.rpartition("/")
+            self._dirs.setdefault(parent, set()).add(name)
+            relpath = parent
+
+    def _unlink(self, relpath: str) -> None:
+        # Empty dirs don't exist in git, so they are removed as well.
+        while relpath:
+            parent, _, name = relpath.rpartition("/")
+            self._dirs[parent].discard(name)
+            if self._dirs[parent] or not parent:
+                break
+            del self._dirs[parent]
+            relpath = parent
+
+
+class GitTree(BaseGitTree):
+    """The tree of a bare repo.
+
+    The trees are written from a scratch index, where only the changed
+    entries are updated before writing a tree, so the unchanged
+    subtrees are reused by git.
+    """
+
+    def __init__(self, repo: git.Repo, root: Path, index_path: Path) -> None:
+        super().__init__(repo, root)
+        self.index_path = index_path
+
+    def load(self) -> None:
+        os.makedirs(str(self.index_path.parents[0]), exist_ok=True)
+        if self.git.head.is_valid():
+            self._git_index("read-tree", "HEAD")
+        else:
+            self._git_index("read-tree", "--empty")
+        self._load_files()
+
+    def close(self) -> None:
+        try:
+            self.index_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def commit(self, message: str) -> None:
+        # Nothing is committed if the tree is the same as the one of HEAD.
+        tree_oid = self.write_tree()
+        parent = self.git.head.commit if self.git.head.is_valid() else None
+        if parent is not None and parent.tree.hexsha == tree_oid:
+            return
+        parents = [] if parent is None else ["-p", parent.hexsha]
+        commit_oid = self.git.git.commit_tree(tree_oid, *parents, "-m", message)
+        # The expected old value protects from the concurrent updates.
+        old_oid = [] if parent is None else [parent.hexsha]
+        self.git.git.update_ref("HEAD", commit_oid, *old_oid)
+
+    def write_tree(self) -> str:
+        """Write the current tree to the object database and
+        return its oid.
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            lines = [
+                # Removals go first, so a file could replace a dir.
+                "0 %s\t%s" % (_null_oid, file_path)
+                for file_path, entry in pending.items()
+                if entry is None
+            ] + [
+                "%s %s\t%s" % (entry[0], entry[1], file_path)
+                for file_path, entry in pending.items()
+                if entry is not None
+            ]
+            if lines:
+                data = "".join("%s\0" % line for line in lines).encode()
+                self._git_index("update-index", "-z", "--index-info", istream=data)
+            return self._git_index("write-tree").strip()
+
+    def _store_blob(self, body: TBlobBody) -> str:
+        with open_blob_body(body) as (stream, size):
+            istream = self.git.odb.store(IStream(b"blob", size, stream))
+        return istream.hexsha.decode()
+
+    def _git_index(self, command: str, *args, istream: Optional[bytes] = None) -> str:
+        env = {"GIT_INDEX_FILE": str(self.index_path)}
+        fn = getattr(self.git.git, command.replace("-", "_"))
+        if istream is None:
+            return fn(*args, env=env)
+        proc = fn(*args, env=env, as_process=True, istream=subprocess.PIPE)
+        try:
+            proc.stdin.write(istream)
+        finally:
+            proc.stdin.close()
+        output = proc.stdout.read()
+        proc.wait()
+        return output.decode()
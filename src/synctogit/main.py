@@ -1,20 +1,45 @@
 import logging
+import sys
+from pathlib import Path
 
 import click
 
-from . import __version__, evernote, git_config, onenote, todoist
+from . import __version__
 from .config import Config, FilesystemConfigReadWriter
-from .git_factory import git_factory
+from .daemon import Daemon
+from .git_transaction import GitPushError
 from .print_on_exception_only import PrintOnExceptionOnly
-from .service import InvalidAuthSession, ServiceTokenExpiredError, UserCancelledError
+from .scheduler import Scheduler
+from .syncer import Syncer, services
 
 logger = logging.getLogger(__name__)
 
-services = {
-    "evernote": evernote,
-    "onenote": onenote,
-    "todoist": todoist,
-}
+
+def _add_daemon_arguments(command):
+    """Add the options of the daemon mode shared by the commands."""
+    # The options are listed in the reverse order, the same as
+    # the stacked decorators.
+    command = click.option(
+        "-q",
+        "--quiet",
+        is_flag=True,
+        help="Do not print anything unless exit code is non-zero. "
+        "Print only the warnings and the errors in the daemon mode",
+    )(command)
+    command = click.option(
+        "--interval",
+        type=click.IntRange(min=1),
+        default=900,
+        show_default=True,
+        help="Seconds between the syncs in the daemon mode. "
+        "A random jitter of 10% is added",
+    )(command)
+    command = click.option(
+        "--daemon",
+        is_flag=True,
+        help="Keep running and sync periodically until SIGINT or SIGTERM is received",
+    )(command)
+    return command
 
 
 @click.command()
@@ -32,11 +57,12 @@ services = {
     help="Force download all notes",
 )
 @click.option(
-    "-q",
-    "--quiet",
+    "--bulk-import",
     is_flag=True,
-    help="Do not print anything unless exit code is non-zero",
+    help="Stream the files to git fast-import instead of the working tree "
+    "(faster for the initial import of a large account)",
 )
+@_add_daemon_arguments
 @click.argument(
     "config",
     type=click.Path(exists=True),
@@ -45,70 +71,131 @@ services = {
     "service",
     type=click.Choice(services.keys()),
 )
-def main(batch, force_update, quiet, config, service):
+def main(batch, force_update, bulk_import, daemon, interval, quiet, config, service):
     """SyncToGit. Sync your Evernote notes to a local git repository.
 
     CONFIG should point to an existing config file. Note that this file
     might be overwritten by synctogit.
     """
 
-    with PrintOnExceptionOnly(quiet, logging.INFO):
-        synctogit(
-            service=service,
-            batch=batch,
-            force_update=force_update,
-            config=config,
+    kwargs = dict(
+        service=service,
+        batch=batch,
+        force_update=force_update,
+        bulk_import=bulk_import,
+        config=config,
+    )
+    if daemon:
+        # The output of a daemon can't be held until it exits.
+        logging.basicConfig(
+            stream=sys.stderr, level=logging.WARNING if quiet else logging.INFO
         )
+        synctogit(daemon_interval=interval, **kwargs)
+        return
 
+    with PrintOnExceptionOnly(quiet, logging.INFO):
+        synctogit(**kwargs)
 
-def synctogit(*, service, batch, force_update, config):
+
+def synctogit(
+    *, service, batch, force_update, config, bulk_import=False, daemon_interval=None
+):
+    """Sync once, or periodically until a stop signal is received
+    if `daemon_interval` (in seconds) is set.
+    """
     config = Config(FilesystemConfigReadWriter(config))
 
-    service_module = services[service]
+    syncer = Syncer.create(
+        service,
+        config,
+        batch=batch,
+        force_update=force_update,
+        bulk_import=bulk_import,
+    )
+    try:
+        if daemon_interval is None:
+            syncer.sync()
+        else:
+            Daemon(syncer.sync, interval_seconds=daemon_interval).run()
+    finally:
+        is_pushed = syncer.close()
+    if not is_pushed:
+        raise GitPushError("Unable to git push: %s" % syncer.pusher.status().last_error)
 
-    service_implementation = service_module.get_service_implementation()
 
-    git = git_factory(
-        repo_dir=git_config.git_repo_dir.get(config),
-        branch=git_config.git_branch.get(config),
-        remote_name=git_config.git_remote_name.get(config),
-        remote=git_config.git_remote.get(config),
+@click.command()
+@click.version_option(version=__version__)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="The number of the accounts synced simultaneously",
+)
+@click.option(
+    "--max-per-service",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="The number of the accounts of the same service synced "
+    "simultaneously. 0 means no limit",
+)
+@click.option(
+    "-f",
+    "--force-update",
+    is_flag=True,
+    help="Force download all notes",
+)
+@_add_daemon_arguments
+@click.argument(
+    "config_dir",
+    type=click.Path(exists=True, file_okay=False),
+)
+def main_multi(
+    jobs, max_per_service, force_update, daemon, interval, quiet, config_dir
+):
+    """SyncToGit. Sync multiple accounts in a single process.
+
+    CONFIG_DIR should contain a config file (*.ini) per account. Each of
+    them must specify the service in the [synctogit] section, e.g.
+    `service = evernote`. The accounts must be authorized beforehand
+    with the synctogit command, because there are no prompts here.
+    """
+    scheduler = Scheduler.from_dir(
+        Path(config_dir),
+        jobs=jobs,
+        max_per_service=max_per_service,
+        force_update=force_update,
     )
+    if not scheduler.config_paths:
+        raise click.BadParameter("There are no *.ini files", param_hint="CONFIG_DIR")
 
-    while _sync(service_implementation, git, config, batch, force_update):
-        pass
-
+    if daemon:
+        logging.basicConfig(
+            stream=sys.stderr, level=logging.WARNING if quiet else logging.INFO
+        )
+        synctogit_multi(scheduler, daemon_interval=interval)
+        return
 
-def _sync(service_implementation, git, config, batch, force_update):
-    AuthSession = service_implementation.auth_session
-    Auth = service_implementation.auth
-    Sync = service_implementation.sync
+    with PrintOnExceptionOnly(quiet, logging.INFO):
+        synctogit_multi(scheduler)
 
-    try:
-        session = AuthSession.load_from_config(config)
-    except InvalidAuthSession as e:
-        logger.info("Invalid auth session: %s", str(e))
-        if batch:
-            raise Exception("Unable to proceed due to running batch mode.", e)
-
-        try:
-            session = Auth.interactive_auth(config)
-        except UserCancelledError as e:
-            logger.info(str(e))
-            return False
-        session.save_to_config(config)
 
+def synctogit_multi(scheduler: Scheduler, *, daemon_interval=None):
+    """Sync the accounts of the `scheduler` once, or periodically
+    until a stop signal is received if `daemon_interval` is set.
+    """
+    failures = []
     try:
-        logger.info("Authenticating...")
-        sync = Sync(
-            config=config,
-            auth_session=session,
-            git=git,
-            force_full_resync=force_update,
+        if daemon_interval is None:
+            failures.extend(r for r in scheduler.run() if not r.is_ok)
+        else:
+            Daemon(scheduler.run, interval_seconds=daemon_interval).run()
+    finally:
+        failures.extend(scheduler.close())
+    if failures:
+        raise Exception(
+            "Sync has failed for the accounts: %s"
+            % ", ".join(sorted({r.name for r in failures}))
         )
-        sync.run_sync()
-        return False
-    except ServiceTokenExpiredError:
-        logger.warning("Auth token expired.")
-        session.remove_session_from_config(config)
-        return True
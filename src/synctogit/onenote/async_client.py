@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import operator
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+import requests
+
+from synctogit.git_transaction import rmfile_silent
+from synctogit.service import (
+    RateLimiter,
+    ServiceAPIError,
+    ServiceTokenExpiredError,
+    ServiceUnavailableError,
+    async_retry_ratelimited,
+    async_retry_unavailable,
+)
+from synctogit.service.notes.resources import TResourceBody, new_staging_path
+
+from . import oauth
+from .client import BaseOauthClient
+
+logger = logging.getLogger(__name__)
+
+_rate_limiter = operator.attrgetter("rate_limiter")
+
+
+class AsyncOauthClient(BaseOauthClient):
+    """A Microsoft Graph client which performs all requests on a single asyncio
+    event loop running in a background thread.
+
+    All requests share a single HTTP/2 connection pool, and the number
+    of simultaneous requests is limited globally by `max_concurrency`,
+    instead of being multiplied by the nested thread pools.
+    The blocking methods might be called from any thread.
+    """
+
+    # Must be threadsafe
+
+    def __init__(
+        self,
+        *,
+        client_id: str,
+        client_secret: str,
+        token: Dict[str, Any],
+        max_concurrency: int = 30,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+    ) -> None:
+        super().__init__(
+            client_id=client_id,
+            client_secret=client_secret,
+            token=token,
+            rate_limiter=rate_limiter,
+        )
+        self.max_concurrency = max_concurrency
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="synctogit-onenote-async",
+            daemon=True,
+        )
+        self._thread.start()
+        self._run(self._setup(transport))
+
+    async def _setup(self, transport: Optional[httpx.AsyncBaseTransport]) -> None:
+        # The asyncio primitives must be created within the loop.
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._refresh_lock = asyncio.Lock()
+        self._http = httpx.AsyncClient(
+            http2=transport is None,
+            transport=transport,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+            timeout=60,
+        )
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        kwargs.pop("stream", None)  # The body is always read
+        return self._run(self._request("GET", url, **kwargs))
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self._run(self._request("POST", url, **kwargs))
+
+    def request_once(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return self._run(self._request_once(method.upper(), url, **kwargs))
+
+    def get_to_file(self, url: str, staging_dir: Path) -> Path:
+        return self._run(self._get_to_file(url, staging_dir))
+
+    def get_bodies(
+        self, urls: Sequence[str], staging_dir: Optional[Path]
+    ) -> List[TResourceBody]:
+        return self._run(self._get_bodies(urls, staging_dir))
+
+    def close(self) -> None:
+        self._run(self._http.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _get_bodies(
+        self, urls: Sequence[str], staging_dir: Optional[Path]
+    ) -> List[TResourceBody]:
+        async def get_body(url):
+            if staging_dir is not None:
+                return await self._get_to_file(url, staging_dir)
+            return (await self._request("GET", url)).content
+
+        return list(await asyncio.gather(*(get_body(url) for url in urls)))
+
+    @async_retry_ratelimited(limiter=_rate_limiter)
+    @async_retry_unavailable
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self._request_once(method, url, **kwargs)
+
+    async def _request_once(self, method: str, url: str, **kwargs) -> httpx.Response:
+        async with self._semaphore:
+            response = await self._send(method, url, **kwargs)
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+            return response
+
+    @async_retry_ratelimited(limiter=_rate_limiter)
+    @async_retry_unavailable
+    async def _get_to_file(self, url: str, staging_dir: Path) -> Path:
+        async with self._semaphore:
+            response = await self._send("GET", url)
+            path = new_staging_path(staging_dir)
+            try:
+                with self.translate_exceptions(), open(str(path), "xb") as f:
+                    async for chunk in response.aiter_bytes(self.chunk_size):
+                        # The chunks are small, so the blocking write is
+                        # cheaper than handing it over to a thread.
+                        f.write(chunk)
+            except httpx.TransportError as e:
+                # The connection broken while streaming the body.
+                rmfile_silent(path)
+                raise ServiceUnavailableError(e)
+            except BaseException:
+                rmfile_silent(path)
+                raise
+            finally:
+                await response.aclose()
+            return path
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request and return a successful response
+        which body hasn't been read yet.
+        """
+        for _ in range(2):
+            token = await self._get_fresh_token()
+            request = self._http.build_request(
+                method,
+                url,
+                headers={"Authorization": "Bearer %s" % token["access_token"]},
+                **kwargs,
+            )
+            with self.translate_exceptions():
+                response = await self._send_request(request)
+                if response.status_code == 401:
+                    await response.aclose()
+                    await self._async_refresh_token(token)
+                    continue
+                if response.is_error:
+                    await response.aread()
+                    await response.aclose()
+                    raise requests.HTTPError(response=response)
+                return response
+        raise ServiceTokenExpiredError("Failed to update auth token")
+
+    async def _send_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            return await self._http.send(request, stream=True)
+        except httpx.TransportError as e:
+            raise ServiceAPIError(e)
+
+    async def _get_fresh_token(self) -> Dict[str, Any]:
+        token = self.get_token()
+        expires_at = token.get("expires_at")
+        if expires_at is not None and expires_at - 60 < time.time():
+            await self._async_refresh_token(token)
+            token = self.get_token()
+        return token
+
+    async def _async_refresh_token(self, initial_token: Dict[str, Any]) -> None:
+        async with self._refresh_lock:
+            if self.get_token() != initial_token:
+                # Probably because some another request already refreshed
+                # the token.
+                logger.debug("Skipping token refresh")
+                return
+
+            with self.translate_exceptions():
+                response = await self._http.post(
+                    oauth.authority_url + oauth.token_endpoint,
+                    data=dict(
+                        grant_type="refresh_token",
+                        refresh_token=initial_token["refresh_token"],
+                        client_id=self.client_id,
+                        client_secret=self.client_secret,
+                    ),
+                )
+                if response.is_error:
+                    raise requests.HTTPError(response=response)
+
+            token = response.json()
+            token.setdefault("refresh_token", initial_token["refresh_token"])
+            if "expires_in" in token:
+                token["expires_at"] = time.time() + int(token["expires_in"])
+            with self.lock:
+                self._token = token
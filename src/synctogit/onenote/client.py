@@ -1,16 +1,24 @@
+import abc
+import base64
 import contextlib
+import json
 import logging
+import operator
 import threading
+from pathlib import Path
 from socket import error as socketerror
-from typing import Any, Dict, Iterable, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from urllib.parse import urlencode
 
 import requests
 from oauthlib.oauth2 import TokenExpiredError
+from requests.structures import CaseInsensitiveDict
 from requests_oauthlib import OAuth2Session
 from requests_toolbelt.multipart import decoder
 from urllib3.util import Retry
 
 from synctogit.service import (
+    RateLimiter,
     ServiceAPIError,
     ServiceRateLimitError,
     ServiceTokenExpiredError,
@@ -18,21 +26,46 @@ from synctogit.service import (
     retry_ratelimited,
     retry_unavailable,
 )
+from synctogit.service.notes.resources import TResourceBody, write_staging_file
 
 from . import oauth
 from .compat import hide_spurious_urllib3_multipart_warning
 from .exc import EncryptedSectionError
+from .resource_executor import ResourceExecutor
 
 logger = logging.getLogger(__name__)
 
+# The requests quota is per account, so each client has its own limiter.
+_rate_limiter = operator.attrgetter("rate_limiter")
+_batch_rate_limiter = operator.attrgetter("_client.rate_limiter")
+
 
 class OneNoteAPI:
     # Must be threadsafe
     # https://developer.microsoft.com/en-us/graph/docs/api-reference/v1.0/resources/onenote-api-overview  # noqa
 
     base_api_url = oauth.base_api_url
+    batch_api_url = oauth.batch_api_url
+
+    # https://docs.microsoft.com/en-us/graph/json-batching
+    max_batch_size = 20
+
+    _pages_of_section_params = {
+        "$select": ",".join(
+            [
+                "id",
+                "title",
+                "createdDateTime",
+                "lastModifiedDateTime",
+                "parentSection",
+                "level",
+                "order",
+            ]
+        ),
+        "pagelevel": "true",
+    }
 
-    def __init__(self, client: "OauthClient") -> None:
+    def __init__(self, client: "BaseOauthClient") -> None:
         self._client = client
 
     def get_page_html(self, page_id: str) -> decoder.MultipartDecoder:
@@ -123,29 +156,117 @@ class OneNoteAPI:
         return page
 
     def get_pages_of_section(self, section_id: str) -> Iterable[Dict[str, Any]]:
-        select_fields = [
-            "id",
-            "title",
-            "createdDateTime",
-            "lastModifiedDateTime",
-            "parentSection",
-            "level",
-            "order",
-        ]
-        params = {
-            "$select": ",".join(select_fields),
-            "pagelevel": "true",
-        }
-
         # The `/pages` method doesn't support the `order` field and
         # the `pagelevel` parameter. Also I had observed some old metadata
         # being returned for some pages. The /sections/%/pages method doesn't
         # have these issues.
         # url = self.base_api_url + '/pages'
-        url = self.base_api_url + "/sections/%s/pages" % section_id
-        for resp_page in self._get_paginated(url, params=params):
+        url = self._pages_of_section_url(section_id)
+        for resp_page in self._get_paginated(url, params=self._pages_of_section_params):
             yield from resp_page["value"]
 
+    def get_pages_of_sections(
+        self, section_ids: Sequence[str]
+    ) -> Dict[str, Optional[List[Dict[str, Any]]]]:
+        """The same as `get_pages_of_section`, but the first pages of
+        the lists of all sections are retrieved with batch requests.
+
+        The pages of the encrypted sections are None.
+        """
+        urls = [
+            self._pages_of_section_url(section_id)
+            + "?"
+            + urlencode(self._pages_of_section_params, safe="$,")
+            for section_id in section_ids
+        ]
+        section_to_pages = {}  # type: Dict[str, Optional[List[Dict[str, Any]]]]
+        for section_id, response in zip(section_ids, self.batch_get(urls)):
+            try:
+                with self._client.translate_exceptions():
+                    response.raise_for_status()
+            except EncryptedSectionError:
+                section_to_pages[section_id] = None
+                continue
+            d = response.json()
+            pages = list(d["value"])
+            next_url = d.get("@odata.nextLink")
+            if next_url:
+                for resp_page in self._get_paginated(next_url):
+                    pages.extend(resp_page["value"])
+            section_to_pages[section_id] = pages
+        return section_to_pages
+
+    def batch_get(self, urls: Sequence[str]) -> List[requests.Response]:
+        """Send GET requests to the `urls` using as few batch requests
+        as possible and return the responses in the same order.
+
+        The throttled and the 5xx requests are retried, but the rest of
+        the responses are not checked for errors: `raise_for_status`
+        should be called within `OauthClient.translate_exceptions`.
+        """
+        responses = {}  # type: Dict[int, requests.Response]
+        for start in range(0, len(urls), self.max_batch_size):
+            pending = {
+                i: url
+                for i, url in enumerate(
+                    urls[start : start + self.max_batch_size], start
+                )
+            }
+            self._send_batch(pending, responses)
+        return [responses[i] for i in range(len(urls))]
+
+    @retry_ratelimited(limiter=_batch_rate_limiter)
+    @retry_unavailable
+    def _send_batch(
+        self, pending: Dict[int, str], responses: Dict[int, requests.Response]
+    ) -> None:
+        # The completed requests are removed from `pending`, so only
+        # the failed ones are sent again on retry. The batch request
+        # itself is retried by this method as well, so it bypasses
+        # the retries of the client.
+        r = self._client.request_once(
+            "post",
+            self.batch_api_url,
+            json={
+                "requests": [
+                    {"id": str(i), "method": "GET", "url": self._relative_url(url)}
+                    for i, url in pending.items()
+                ]
+            },
+        )
+        retriable_error = None  # type: Optional[Exception]
+        for d in r.json()["responses"]:
+            i = int(d["id"])
+            response = _batch_response(d, pending[i])
+            if response.status_code == 429 or 500 <= response.status_code < 600:
+                try:
+                    with self._client.translate_exceptions():
+                        response.raise_for_status()
+                except (ServiceRateLimitError, ServiceUnavailableError) as e:
+                    # Rate limit takes precedence: it has a longer delay.
+                    if not isinstance(retriable_error, ServiceRateLimitError):
+                        retriable_error = e
+                continue
+            responses[i] = response
+            del pending[i]
+
+        if retriable_error is not None:
+            raise retriable_error
+        if pending:
+            raise ServiceAPIError(
+                "Batch response doesn't contain the responses "
+                "for the requests %s" % sorted(pending)
+            )
+
+    def _relative_url(self, url: str) -> str:
+        graph_api_url = oauth.graph_api_url
+        if not url.startswith(graph_api_url + "/"):
+            raise ValueError("Unable to batch a foreign URL `%s`" % url)
+        return url[len(graph_api_url) :]
+
+    def _pages_of_section_url(self, section_id: str) -> str:
+        return self.base_api_url + "/sections/%s/pages" % section_id
+
     def get_notebooks(self) -> Iterable[Dict[str, Any]]:
         select_fields = [
             "id",
@@ -190,37 +311,67 @@ class OneNoteAPI:
             next_url = d.get("@odata.nextLink")
 
 
-class OauthClient:
+class BaseOauthClient(abc.ABC):
+    """An authorized Microsoft Graph client.
+
+    The failed requests raise the `Service*` exceptions
+    (see `translate_exceptions`).
+    """
+
     # Must be threadsafe
 
+    chunk_size = 256 * 1024
+
     def __init__(
-        self, *, client_id: str, client_secret: str, token: Dict[str, Any]
+        self,
+        *,
+        client_id: str,
+        client_secret: str,
+        token: Dict[str, Any],
+        rate_limiter: Optional[RateLimiter] = None,
     ) -> None:
         self.client_id = client_id
         self.client_secret = client_secret
         self._token = token
-        self._client = self._get_client()
         self.lock = threading.Lock()
+        self.rate_limiter = rate_limiter or RateLimiter("onenote")
 
     def get_token(self) -> Dict[str, Any]:
         with self.lock:
             return self._token
 
-    @retry_ratelimited
-    @retry_unavailable
-    def get(self, *args, **kwargs) -> requests.Response:
-        for _ in range(2):
-            with self.lock:
-                initial_token = self._token
-                client = self._client
-            with self.translate_exceptions():
-                try:
-                    response = client.get(*args, **kwargs)
-                    response.raise_for_status()
-                    return response
-                except TokenExpiredError:
-                    self._refresh_token(initial_token)
-        raise ServiceTokenExpiredError("Failed to update auth token")
+    @abc.abstractmethod
+    def get(self, url: str, **kwargs) -> requests.Response:
+        pass
+
+    @abc.abstractmethod
+    def post(self, url: str, **kwargs) -> requests.Response:
+        pass
+
+    @abc.abstractmethod
+    def request_once(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request bypassing the rate limiter and the retries,
+        for the callers which retry it on their own.
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_to_file(self, url: str, staging_dir: Path) -> Path:
+        """Stream the response body to a new file in `staging_dir`
+        instead of reading it into memory.
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_bodies(
+        self, urls: Sequence[str], staging_dir: Optional[Path]
+    ) -> List[TResourceBody]:
+        """Retrieve the bodies of the `urls` simultaneously."""
+        pass
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        pass
 
     @contextlib.contextmanager
     def translate_exceptions(self):  # noqa
@@ -245,8 +396,9 @@ class OauthClient:
                 # MS Graph APIs do return it, so maybe they'll consider to add
                 # it as well?
                 # https://developer.microsoft.com/en-us/graph/docs/concepts/throttling
-                s = e.response.headers.get("retry-after")
-                if not s:
+                try:
+                    s = int(e.response.headers.get("retry-after"))
+                except (TypeError, ValueError):
                     s = 5 * 60
                 s = min(s, 3600) + 10
                 raise ServiceRateLimitError(e, rate_limit_duration_seconds=s)
@@ -277,6 +429,91 @@ class OauthClient:
         except (socketerror, EOFError) as e:
             raise ServiceAPIError(e)
 
+
+class OauthClient(BaseOauthClient):
+    # Must be threadsafe
+
+    def __init__(
+        self,
+        *,
+        client_id: str,
+        client_secret: str,
+        token: Dict[str, Any],
+        resource_threads: int = 12,
+        resource_threads_per_host: int = 6,
+        rate_limiter: Optional[RateLimiter] = None,
+    ) -> None:
+        super().__init__(
+            client_id=client_id,
+            client_secret=client_secret,
+            token=token,
+            rate_limiter=rate_limiter,
+        )
+        self._client = self._get_client()
+        # Shared by the resources of all pages.
+        self._resource_executor = ResourceExecutor(
+            max_workers=resource_threads, max_per_host=resource_threads_per_host
+        )
+
+    def get(self, *args, **kwargs) -> requests.Response:
+        return self._request("get", *args, **kwargs)
+
+    def post(self, *args, **kwargs) -> requests.Response:
+        return self._request("post", *args, **kwargs)
+
+    def request_once(self, method: str, *args, **kwargs) -> requests.Response:
+        for _ in range(2):
+            with self.lock:
+                initial_token = self._token
+                client = self._client
+            with self.translate_exceptions():
+                try:
+                    response = getattr(client, method)(*args, **kwargs)
+                    response.raise_for_status()
+                    return response
+                except TokenExpiredError:
+                    self._refresh_token(initial_token)
+        raise ServiceTokenExpiredError("Failed to update auth token")
+
+    @retry_ratelimited(limiter=_rate_limiter)
+    @retry_unavailable
+    def _request(self, method: str, *args, **kwargs) -> requests.Response:
+        return self.request_once(method, *args, **kwargs)
+
+    @retry_ratelimited(limiter=_rate_limiter)
+    @retry_unavailable
+    def get_to_file(self, url: str, staging_dir: Path) -> Path:
+        # The whole download is retried, so the connection broken while
+        # streaming the body is retried as well.
+        response = self.request_once("get", url, stream=True)
+        with contextlib.closing(response), self.translate_exceptions():
+            try:
+                return write_staging_file(
+                    staging_dir, response.iter_content(chunk_size=self.chunk_size)
+                )
+            except (
+                requests.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+            ) as e:
+                raise ServiceUnavailableError(e)
+
+    def get_body(self, url: str, staging_dir: Optional[Path]) -> TResourceBody:
+        if staging_dir is not None:
+            return self.get_to_file(url, staging_dir)
+        return self.get(url).content
+
+    def get_bodies(
+        self, urls: Sequence[str], staging_dir: Optional[Path]
+    ) -> List[TResourceBody]:
+        return self._resource_executor.map(
+            lambda url: self.get_body(url, staging_dir), urls
+        )
+
+    def close(self) -> None:
+        self._resource_executor.shutdown()
+        with self.lock:
+            self._client.close()
+
     def _refresh_token(self, initial_token):
         with self.lock:
             if self._token != initial_token:
@@ -301,6 +538,24 @@ class OauthClient:
         return session
 
 
+def _batch_response(d: Dict[str, Any], url: str) -> requests.Response:
+    """Build a `requests.Response` from a single response of a batch."""
+    response = requests.Response()
+    response.status_code = int(d["status"])
+    response.headers = CaseInsensitiveDict(d.get("headers") or {})
+    response.url = url
+    response.encoding = "utf-8"
+    body = d.get("body")
+    if body is None:
+        response._content = b""
+    elif isinstance(body, str):
+        # The bodies of non-JSON responses are base64-encoded.
+        response._content = base64.b64decode(body)
+    else:
+        response._content = json.dumps(body).encode()
+    return response
+
+
 class _HTTPAdapter(requests.adapters.HTTPAdapter):
     # https://github.com/psf/requests/issues/2011#issuecomment-64440818
 
@@ -0,0 +1,102 @@
+import datetime
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+import dateutil.parser
+
+from synctogit.service.notes.cached_state import load_cached_state, save_cached_state
+
+from .models import OneNotePageInfo, OneNoteSection, OneNoteSectionId
+
+logger = logging.getLogger(__name__)
+
+
+class SectionsSnapshot:
+    """A local copy of the pages lists of the OneNote sections.
+
+    The pages list of a section is reused as long as the section's
+    `last_modified` timestamp is the same as the one the list has been
+    retrieved with, so only the modified sections have to be listed.
+    """
+
+    version = 1
+
+    def __init__(self, snapshot_path: Path) -> None:
+        self.snapshot_path = snapshot_path
+        self.discard()
+
+    def discard(self) -> None:
+        self.sections = {}  # type: Dict[str, Dict[str, Any]]
+
+    def load(self) -> None:
+        if not load_cached_state(
+            self.snapshot_path,
+            self.version,
+            "OneNote sections snapshot",
+            self._load,
+        ):
+            self.discard()
+
+    def _load(self, data: Dict[str, Any]) -> None:
+        self.sections = dict(data["sections"])
+
+    def save(self) -> None:
+        save_cached_state(
+            self.snapshot_path, self.version, dict(sections=self.sections)
+        )
+
+    def get_pages(self, section: OneNoteSection) -> Optional[Sequence[OneNotePageInfo]]:
+        """Return the pages of the `section`, or None if the section
+        has been modified since its pages were stored.
+        """
+        d = self.sections.get(section.id)
+        if d is None or d["last_modified"] != _dump_datetime(section.last_modified):
+            return None
+        try:
+            return [
+                OneNotePageInfo(
+                    id=page["id"],
+                    title=page["title"],
+                    created=_load_datetime(page["created"]),
+                    last_modified=_load_datetime(page["last_modified"]),
+                )
+                for page in d["pages"]
+            ]
+        except Exception as e:
+            logger.warning(
+                "OneNote sections snapshot contains malformed pages "
+                "of section %s: %r",
+                section.id,
+                e,
+            )
+            return None
+
+    def set_pages(
+        self, section: OneNoteSection, pages: Sequence[OneNotePageInfo]
+    ) -> None:
+        self.sections[section.id] = dict(
+            last_modified=_dump_datetime(section.last_modified),
+            pages=[
+                dict(
+                    id=page.id,
+                    title=page.title,
+                    created=_dump_datetime(page.created),
+                    last_modified=_dump_datetime(page.last_modified),
+                )
+                for page in pages
+            ],
+        )
+
+    def retain_sections(self, section_ids: Iterable[OneNoteSectionId]) -> None:
+        section_ids = set(section_ids)
+        for section_id in set(self.sections) - section_ids:
+            del self.sections[section_id]
+
+
+def _dump_datetime(dt: datetime.datetime) -> str:
+    return dt.isoformat()
+
+
+def _load_datetime(s: str) -> datetime.datetime:
+    return dateutil.parser.parse(s)
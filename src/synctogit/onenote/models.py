@@ -1,5 +1,6 @@
 import datetime
-from typing import Mapping, NamedTuple, NewType, Sequence
+from pathlib import Path
+from typing import Mapping, NamedTuple, NewType, Sequence, Union
 
 OneNoteSectionId = NewType("OneNoteSectionId", str)
 OneNotePageId = NewType("OneNotePageId", str)
@@ -37,7 +38,7 @@ class OneNotePageMetadata(NamedTuple):
 
 
 class OneNoteResource(NamedTuple):
-    body: bytes
+    body: Union[bytes, Path]  # Path is a temporary file which should be moved
     mime: str
     filename: str
 
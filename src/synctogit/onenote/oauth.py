@@ -12,7 +12,9 @@ authority_url = "https://login.microsoftonline.com/common"
 auth_endpoint = "/oauth2/v2.0/authorize"
 token_endpoint = "/oauth2/v2.0/token"
 
-base_api_url = "https://graph.microsoft.com/v1.0/me/onenote"
+graph_api_url = "https://graph.microsoft.com/v1.0"
+base_api_url = graph_api_url + "/me/onenote"
+batch_api_url = graph_api_url + "/$batch"
 
 resource_url_pattern = re.compile(
     r"^https://graph.microsoft.com/v1.0"
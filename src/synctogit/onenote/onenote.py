@@ -1,17 +1,22 @@
+import concurrent.futures
 import datetime
 import logging
-from collections import OrderedDict, defaultdict
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import Any, Dict, Mapping, Optional, Sequence, Union
+from pathlib import Path
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Union
 
 import dateutil.parser
 
 from synctogit.filename_sanitizer import normalize_filename
+from synctogit.service import RateLimiter
+from synctogit.service.notes.resources import TResourceBody
 
 from . import oauth
-from .client import OauthClient, OneNoteAPI
+from .client import BaseOauthClient, OauthClient, OneNoteAPI
 from .exc import EncryptedSectionError
+from .metadata_snapshot import SectionsSnapshot
 from .models import (
     OneNoteNotebook,
     OneNotePage,
@@ -37,6 +42,13 @@ class OneNoteOrder(Enum):
     reversed_last_modified = "-last_modified"
 
 
+class OneNoteHttpEngine(Enum):
+    # requests, concurrency is achieved with threads
+    threads = "threads"
+    # httpx on an asyncio loop with a single connection pool
+    asyncio = "asyncio"
+
+
 class OneNoteClient:
     # Must be threadsafe
 
@@ -48,6 +60,14 @@ class OneNoteClient:
         token: Dict[str, Any],
         notebooks_order: OneNoteOrder = OneNoteOrder.created,
         sections_order: OneNoteOrder = OneNoteOrder.created,
+        http_engine: OneNoteHttpEngine = OneNoteHttpEngine.threads,
+        async_max_concurrency: int = 30,
+        resource_threads: int = 12,
+        resource_threads_per_host: int = 6,
+        section_listing_threads: int = 8,
+        batch_requests: bool = False,
+        sections_snapshot: Optional[SectionsSnapshot] = None,
+        rate_limiter: Optional[RateLimiter] = None,
     ) -> None:
         # NB: REST API limitations:
         # - no colors
@@ -60,15 +80,35 @@ class OneNoteClient:
         # - communicate with the running one note (but it requires
         #   the MS Office version of OneNote)
 
-        client = OauthClient(
-            client_id=client_id,
-            client_secret=client_secret,
-            token=token,
-        )
+        if http_engine == OneNoteHttpEngine.asyncio:
+            # httpx is an optional dependency.
+            from .async_client import AsyncOauthClient
+
+            client = AsyncOauthClient(
+                client_id=client_id,
+                client_secret=client_secret,
+                token=token,
+                max_concurrency=async_max_concurrency,
+                rate_limiter=rate_limiter,
+            )  # type: BaseOauthClient
+        else:
+            client = OauthClient(
+                client_id=client_id,
+                client_secret=client_secret,
+                token=token,
+                resource_threads=resource_threads,
+                resource_threads_per_host=resource_threads_per_host,
+                rate_limiter=rate_limiter,
+            )
         self._api = OneNoteAPI(client)
 
         self.notebooks_order = notebooks_order
         self.sections_order = sections_order
+        self.section_listing_threads = section_listing_threads
+        self.batch_requests = batch_requests
+        # When the snapshot is passed, only the pages of the sections
+        # which have been modified since the previous sync are listed.
+        self.sections_snapshot = sections_snapshot
 
         self.notebooks = None  # type: Sequence[OneNoteNotebook]
         self.section_to_pages = (
@@ -78,11 +118,15 @@ class OneNoteClient:
         self._page_id_to_section_id = (
             None
         )  # type: Mapping[OneNoteSectionId, OneNotePageId]  # noqa
+        self._page_id_to_info = {}  # type: Mapping[OneNotePageId, OneNotePageInfo]
 
     @property
     def token(self) -> Dict[str, Any]:
         return self._api._client.get_token()
 
+    def close(self) -> None:
+        self._api._client.close()
+
     def sync_metadata(self) -> None:
         # XXX ensure they're converged?
         self.notebooks = self._get_notebooks()
@@ -91,17 +135,63 @@ class OneNoteClient:
         self._page_id_to_section_id = self._get_page_id_to_section_id(
             self.section_to_pages
         )
+        self._page_id_to_info = {
+            page_info.id: page_info
+            for page_infos in self.section_to_pages.values()
+            for page_info in page_infos
+        }
 
-    def get_page(self, page_id: OneNotePageId, resources_base: str) -> OneNotePage:
+    def check_pages_unchanged(self, page_ids: Iterable[OneNotePageId]) -> bool:
+        """Check that the pages haven't been modified since `sync_metadata`.
+
+        The pages list of each of the affected sections is retrieved
+        only once, no matter how many pages it contains.
+        """
+        page_ids = list(page_ids)
+        section_ids = set()
+        for page_id in page_ids:
+            section_id = self._page_id_to_section_id.get(page_id)
+            if section_id is None:
+                return False
+            section_ids.add(section_id)
+
+        sections = [
+            section
+            for notebook in self.notebooks
+            for section in notebook.sections
+            if section.id in section_ids
+        ]
+        actual = {
+            page_info.id: page_info.last_modified
+            for page_infos in self._get_pages_of_sections(sections).values()
+            for page_info in page_infos
+        }
+        for page_id in page_ids:
+            if actual.get(page_id) != self._page_id_to_info[page_id].last_modified:
+                logger.info("Page %s has been changed during sync", page_id)
+                return False
+        return True
+
+    def get_page(
+        self,
+        page_id: OneNotePageId,
+        resources_base: str,
+        *,
+        content_addressed_resources: bool = False,
+        staging_dir: Optional[Path] = None,
+    ) -> OneNotePage:
         # XXX ensure they're converged?
         multipart_data = self._api.get_page_html(page_id)
 
-        resource_retrieval = _PageResourceRetrieval(self._api._client)
+        resource_retrieval = _PageResourceRetrieval(
+            self._api._client, staging_dir=staging_dir
+        )
         try:
             page_parser = PageParser.from_multipart(
                 multipart_data,
                 resource_retrieval=resource_retrieval,
                 resources_base=resources_base,
+                content_addressed_resources=content_addressed_resources,
             )
         except ValueError as e:
             raise ValueError(
@@ -109,8 +199,14 @@ class OneNoteClient:
                 "'%s': %s" % (page_id, str(e))
             )
 
-        section_id = self._page_id_to_section_id.get(page_id)
-        info = self._map_page_info(self._api.get_page_info(page_id, section_id))
+        # The page info from the pages list is used instead of retrieving
+        # the actual one, which takes up to 2 more requests per page.
+        # The `check_pages_unchanged` method must be used to ensure that
+        # the pages haven't been changed since the list had been retrieved.
+        info = self._page_id_to_info.get(page_id)
+        if info is None:
+            section_id = self._page_id_to_section_id.get(page_id)
+            info = self._map_page_info(self._api.get_page_info(page_id, section_id))
         try:
             return OneNotePage(
                 info=info,
@@ -215,25 +311,98 @@ class OneNoteClient:
     def _get_pages_of_notebooks(
         self, notebooks: Sequence[OneNoteNotebook]
     ) -> Mapping[OneNoteSectionId, Sequence[OneNotePageInfo]]:
-        section_to_pages = defaultdict(lambda: [])
+        sections = [section for notebook in notebooks for section in notebook.sections]
+        snapshot = self.sections_snapshot
+        if snapshot is None:
+            return self._get_pages_of_sections(sections)
 
-        for notebook in notebooks:
-            for section in notebook.sections:
-                try:
-                    section_to_pages[section.id].extend(
-                        self._api.get_pages_of_section(section.id)
-                    )
-                except EncryptedSectionError:
-                    logger.info("Skipping encrypted section '%s'", section.name)
+        section_to_pages = {
+            section.id: snapshot.get_pages(section) for section in sections
+        }
+        modified_sections = [
+            section for section in sections if section_to_pages[section.id] is None
+        ]
+        logger.info(
+            "Listing pages of %d modified sections out of %d",
+            len(modified_sections),
+            len(sections),
+        )
+        for section_id, pages in self._get_pages_of_sections(modified_sections).items():
+            section_to_pages[section_id] = pages
 
-        return {
-            section_id: [
-                self._map_page_info(page)
-                for page in sorted(pages, key=lambda p: p["order"])
+        for section in modified_sections:
+            snapshot.set_pages(section, section_to_pages[section.id])
+        snapshot.retain_sections(section_to_pages.keys())
+        try:
+            snapshot.save()
+        except OSError as e:
+            logger.warning("Unable to save OneNote sections snapshot: %r", e)
+        return section_to_pages
+
+    def _get_pages_of_sections(
+        self, sections: Sequence[OneNoteSection]
+    ) -> Mapping[OneNoteSectionId, Sequence[OneNotePageInfo]]:
+        # The sections are listed simultaneously, so the total time
+        # is close to the time of the largest section.
+        if self.batch_requests:
+            # Each batch request lists up to `max_batch_size` sections.
+            batch_size = self._api.max_batch_size
+            fn = self._get_pages_of_sections_batch
+            chunks = [
+                sections[i : i + batch_size]
+                for i in range(0, len(sections), batch_size)
             ]
-            for section_id, pages in section_to_pages.items()
+        else:
+            fn = self._get_pages_of_sections_one_by_one
+            chunks = [[section] for section in sections]
+
+        section_to_pages = {}
+        with ThreadPoolExecutor(max_workers=self.section_listing_threads) as pool:
+            futures = [pool.submit(fn, chunk) for chunk in chunks]
+            for future in concurrent.futures.as_completed(futures):
+                section_to_pages.update(future.result())
+
+        # Preserve the order of the sections.
+        return {section.id: section_to_pages[section.id] for section in sections}
+
+    def _get_pages_of_sections_batch(
+        self, sections: Sequence[OneNoteSection]
+    ) -> Mapping[OneNoteSectionId, Sequence[OneNotePageInfo]]:
+        section_to_pages = self._api.get_pages_of_sections(
+            [section.id for section in sections]
+        )
+        return {
+            section.id: self._map_pages_of_section(
+                section, section_to_pages[section.id]
+            )
+            for section in sections
         }
 
+    def _get_pages_of_sections_one_by_one(
+        self, sections: Sequence[OneNoteSection]
+    ) -> Mapping[OneNoteSectionId, Sequence[OneNotePageInfo]]:
+        return {section.id: self._get_pages_of_section(section) for section in sections}
+
+    def _get_pages_of_section(
+        self, section: OneNoteSection
+    ) -> Sequence[OneNotePageInfo]:
+        try:
+            pages = list(self._api.get_pages_of_section(section.id))
+        except EncryptedSectionError:
+            pages = None
+        return self._map_pages_of_section(section, pages)
+
+    def _map_pages_of_section(
+        self, section: OneNoteSection, pages: Optional[Sequence[Dict[str, Any]]]
+    ) -> Sequence[OneNotePageInfo]:
+        if pages is None:
+            logger.info("Skipping encrypted section '%s'", section.name)
+            pages = []
+        return [
+            self._map_page_info(page)
+            for page in sorted(pages, key=lambda p: p["order"])
+        ]
+
     def _map_page_info(self, page: Dict[str, Any]) -> OneNotePageInfo:
         return OneNotePageInfo(
             id=str(page["id"]),
@@ -245,10 +414,13 @@ class OneNoteClient:
 
 class _PageResourceRetrieval(ResourceRetrieval):
     resource_url_pattern = oauth.resource_url_pattern
-    max_threads = 6
 
-    def __init__(self, client: OauthClient) -> None:
+    def __init__(
+        self, client: BaseOauthClient, staging_dir: Optional[Path] = None
+    ) -> None:
         self._client = client
+        # Resources are streamed to the files in this dir when it is set.
+        self._staging_dir = staging_dir
         self.resource_id_to_url = {}  # type: Dict[str, str]
 
     def maybe_queue(self, url: str) -> Optional[str]:
@@ -259,15 +431,11 @@ class _PageResourceRetrieval(ResourceRetrieval):
         self.resource_id_to_url[resource_id] = url
         return resource_id
 
-    def retrieve_all(self) -> Mapping[str, bytes]:
+    def retrieve_all(self) -> Mapping[str, TResourceBody]:
         keys_values = list(zip(*self.resource_id_to_url.items()))
         if not keys_values:
             return {}
 
-        with ThreadPoolExecutor(max_workers=self.max_threads) as pool:
-            resource_ids, urls = keys_values
-            return dict(zip(resource_ids, pool.map(self._retrieve, urls)))
-
-    def _retrieve(self, url: str) -> bytes:
-        r = self._client.get(url)
-        return r.content
+        resource_ids, urls = keys_values
+        bodies = self._client.get_bodies(urls, self._staging_dir)
+        return dict(zip(resource_ids, bodies))
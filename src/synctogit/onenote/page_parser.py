@@ -11,6 +11,7 @@ from cached_property import cached_property
 from requests_toolbelt.multipart import decoder
 
 from synctogit.filename_sanitizer import ext_from_mime_type, normalize_filename
+from synctogit.service.notes.resources import TResourceBody, hash_resource_body
 from synctogit.templates import template_env
 
 from .models import OneNoteResource
@@ -36,7 +37,7 @@ class ResourceRetrieval(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def retrieve_all(self) -> Mapping[str, bytes]:
+    def retrieve_all(self) -> Mapping[str, TResourceBody]:
         pass
 
 
@@ -48,11 +49,13 @@ class PageParser:
         inkml: str,
         resource_retrieval: ResourceRetrieval,
         resources_base: str,
+        content_addressed_resources: bool = False,
     ) -> None:
         self._raw_html = html
         self._raw_inkml = inkml
         self._resource_retrieval = resource_retrieval
         self._resources_base = resources_base
+        self._content_addressed_resources = content_addressed_resources
 
     @classmethod
     def from_multipart(
@@ -61,6 +64,7 @@ class PageParser:
         *,
         resource_retrieval: ResourceRetrieval,
         resources_base: str,
+        content_addressed_resources: bool = False,
     ) -> "PageParser":
         html = None
         inkml = None
@@ -90,6 +94,7 @@ class PageParser:
             inkml=inkml,
             resource_retrieval=resource_retrieval,
             resources_base=resources_base,
+            content_addressed_resources=content_addressed_resources,
         )
 
     @property
@@ -136,16 +141,28 @@ class PageParser:
         return html
 
     def _process_resources(self, soup: bs):
-        p = _ParseResources(self._resource_retrieval, self._resources_base)
+        p = _ParseResources(
+            self._resource_retrieval,
+            self._resources_base,
+            content_addressed=self._content_addressed_resources,
+        )
         return p.parse(soup)
 
 
 class _ParseResources:
+    # The attributes which might contain a link to a resource.
+    url_attrs = ("src", "data", "href")
+
     def __init__(
-        self, resource_retrieval: ResourceRetrieval, resources_base: str
+        self,
+        resource_retrieval: ResourceRetrieval,
+        resources_base: str,
+        *,
+        content_addressed: bool = False,
     ) -> None:
         self._resource_retrieval = resource_retrieval
         self._resources_base = resources_base
+        self._content_addressed = content_addressed
         self.resource_id_to_meta = {}  # type: Mapping[str, Mapping[str, str]]
 
     def parse(self, soup: bs):
@@ -158,6 +175,9 @@ class _ParseResources:
 
         resource_id_to_body = self._resource_retrieval.retrieve_all()
 
+        if self._content_addressed:
+            self._rename_to_content_hashes(soup, resource_id_to_body)
+
         return {
             resource_id: OneNoteResource(
                 body=resource_id_to_body[resource_id],
@@ -167,6 +187,28 @@ class _ParseResources:
             for resource_id, meta in self.resource_id_to_meta.items()
         }
 
+    def _rename_to_content_hashes(
+        self, soup: bs, resource_id_to_body: Mapping[str, TResourceBody]
+    ) -> None:
+        # The bodies are known only after the resources have been
+        # retrieved, so the links which have already been inserted
+        # into the page have to be rewritten.
+        url_to_new_url = {}
+        for resource_id, meta in self.resource_id_to_meta.items():
+            chash = hash_resource_body(resource_id_to_body[resource_id])
+            _, ext = meta["filename"].rsplit(".", 1)
+            filename = normalize_filename(f"{chash}.{ext}")
+
+            url = os.path.join(self._resources_base, meta["filename"])
+            url_to_new_url[url] = os.path.join(self._resources_base, filename)
+            meta["filename"] = filename
+
+        for tag in soup.find_all(True):
+            for attr in self.url_attrs:
+                new_url = url_to_new_url.get(tag.get(attr))
+                if new_url is not None:
+                    tag[attr] = new_url
+
     def _handle_img_tag(self, img_tag: Tag, soup: bs) -> None:
         self._handle_resource(
             img_tag,
@@ -0,0 +1,116 @@
+import threading
+from collections import Counter, deque
+from typing import Callable, Deque, List, Optional, Sequence, TypeVar
+from urllib.parse import urlsplit
+
+T = TypeVar("T")
+
+
+class ResourceExecutor:
+    """A bounded pool of threads retrieving the resources of all pages.
+
+    Each `map` call (i.e. the resources of a single page) is a separate
+    job. The workers take the tasks from the jobs in a round-robin
+    fashion, so a page with hundreds of resources doesn't delay
+    the other pages, and no more than `max_per_host` tasks are
+    running simultaneously for a single host.
+    """
+
+    # Must be threadsafe
+
+    def __init__(self, max_workers: int, max_per_host: int) -> None:
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self._cond = threading.Condition()
+        self._jobs = deque()  # type: Deque[_Job]
+        self._host_running = Counter()  # type: Counter
+        self._threads = []  # type: List[threading.Thread]
+        self._is_shutdown = False
+
+    def map(self, fn: Callable[[str], T], urls: Sequence[str]) -> List[T]:
+        """Call `fn` for each of the `urls` and return the results
+        in the same order. Raises the first exception raised by `fn`.
+        """
+        if not urls:
+            return []
+        job = _Job(fn, urls)
+        with self._cond:
+            if self._is_shutdown:
+                raise RuntimeError("The executor has been shut down")
+            self._ensure_threads()
+            self._jobs.append(job)
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: job.finished == len(urls))
+
+        if job.exception is not None:
+            raise job.exception
+        return job.results
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._is_shutdown = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _ensure_threads(self) -> None:
+        while len(self._threads) < self.max_workers:
+            thread = threading.Thread(
+                target=self._work,
+                name="synctogit-resources-%d" % len(self._threads),
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                # The pending tasks are completed before shutting down.
+                task = self._cond.wait_for(
+                    lambda: self._take_task() or self._is_shutdown
+                )
+                if task is True:
+                    return
+                job, index, host = task
+                self._host_running[host] += 1
+
+            try:
+                result = job.fn(job.urls[index])
+            except BaseException as e:
+                result = None
+                exception = e  # type: Optional[BaseException]
+            else:
+                exception = None
+
+            with self._cond:
+                self._host_running[host] -= 1
+                job.results[index] = result
+                if exception is not None and job.exception is None:
+                    job.exception = exception
+                job.finished += 1
+                self._cond.notify_all()
+
+    def _take_task(self):
+        for _ in range(len(self._jobs)):
+            job = self._jobs[0]
+            self._jobs.rotate(-1)
+            for i, index in enumerate(job.pending):
+                host = job.hosts[index]
+                if self._host_running[host] < self.max_per_host:
+                    del job.pending[i]
+                    if not job.pending:
+                        self._jobs.remove(job)
+                    return job, index, host
+        return None
+
+
+class _Job:
+    def __init__(self, fn: Callable[[str], T], urls: Sequence[str]) -> None:
+        self.fn = fn
+        self.urls = urls
+        self.hosts = [urlsplit(url).netloc for url in urls]
+        self.pending = deque(range(len(urls)))  # type: Deque[int]
+        self.results = [None] * len(urls)  # type: List[Optional[T]]
+        self.finished = 0
+        self.exception = None  # type: Optional[BaseException]
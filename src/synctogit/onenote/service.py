@@ -1,20 +1,36 @@
 import base64
+import functools
 import json
 import logging
-from typing import Any, Dict, Mapping
-
-from synctogit import templates
-from synctogit.config import Config, IntConfigItem, StrConfigItem
-from synctogit.git_config import git_push, git_remote_name
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+
+from synctogit.config import (
+    BoolConfigItem,
+    Config,
+    EnumConfigItem,
+    IntConfigItem,
+    StrConfigItem,
+)
+from synctogit.git_config import git_commit_every_bytes, git_commit_every_notes
+from synctogit.git_factory import local_git_ignored_cache_dir, local_repo_dir
 from synctogit.git_transaction import GitTransaction
 from synctogit.service import BaseAuth, BaseAuthSession, BaseSync, InvalidAuthSession
-from synctogit.service.notes import SyncIteration, WorkingCopy
+from synctogit.service.notes import SyncIteration
+from synctogit.service.notes.config import (
+    checkpoint_interval_seconds,
+    max_inflight_bytes,
+    notes_render_threads,
+    shared_resources,
+    working_copy_metadata_from_git,
+)
 from synctogit.timezone import get_timezone
 
 from . import index_renderer
 from .auth import InteractiveAuth
+from .metadata_snapshot import SectionsSnapshot
 from .models import OneNotePage, OneNotePageId, OneNotePageMetadata
-from .onenote import OneNoteClient
+from .onenote import OneNoteClient, OneNoteHttpEngine
 from .working_copy import OneNoteWorkingCopy
 
 logger = logging.getLogger(__name__)
@@ -44,6 +60,23 @@ microsoft_graph_token = StrConfigItem("microsoft_graph", "token")
 
 # XXX dedup
 notes_download_threads = IntConfigItem("internals", "notes_download_threads", 30)
+# `threads` or `asyncio`. The latter requires the `onenote-async` extra.
+onenote_http_engine = EnumConfigItem(
+    "internals", "onenote_http_engine", OneNoteHttpEngine, OneNoteHttpEngine.threads
+)
+onenote_async_max_concurrency = IntConfigItem(
+    "internals", "onenote_async_max_concurrency", 30
+)
+# The threads engine retrieves the resources of all pages with a single pool.
+onenote_resource_threads = IntConfigItem("internals", "onenote_resource_threads", 12)
+onenote_resource_threads_per_host = IntConfigItem(
+    "internals", "onenote_resource_threads_per_host", 6
+)
+onenote_section_listing_threads = IntConfigItem(
+    "internals", "onenote_section_listing_threads", 8
+)
+# List up to 20 sections with a single Microsoft Graph JSON batch request.
+onenote_batch_requests = BoolConfigItem("internals", "onenote_batch_requests", False)
 
 
 class MicrosoftGraphAuthSession(BaseAuthSession):
@@ -91,13 +124,50 @@ class MicrosoftGraphAuth(BaseAuth[MicrosoftGraphAuthSession]):
 
 
 class OneNoteSync(BaseSync[MicrosoftGraphAuthSession]):
+    rate_limiter_name = "onenote"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # Reused by the subsequent syncs, so the connections are kept alive.
+        self._client = None  # type: Optional[OneNoteClient]
+        self._headers_cache = OneNoteWorkingCopy.create_headers_cache(
+            Path(local_repo_dir(self.git))
+        )
+
     def run_sync(self) -> None:
-        c = OneNoteClient(
+        if self._client is None:
+            self._client = self._create_client()
+        self._sync_loop(self._client)
+
+    def close(self) -> None:
+        client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    def _create_client(self) -> OneNoteClient:
+        sections_snapshot = SectionsSnapshot(
+            Path(local_repo_dir(self.git))
+            / local_git_ignored_cache_dir
+            / "onenote_sections.json"
+        )
+        if not self.force_full_resync:
+            sections_snapshot.load()
+
+        return OneNoteClient(
             client_id=microsoft_graph_client_id.get(self.config),
             client_secret=microsoft_graph_client_secret.get(self.config),
             token=self.auth_session.token,
+            http_engine=onenote_http_engine.get(self.config),
+            async_max_concurrency=onenote_async_max_concurrency.get(self.config),
+            resource_threads=onenote_resource_threads.get(self.config),
+            resource_threads_per_host=onenote_resource_threads_per_host.get(
+                self.config
+            ),
+            section_listing_threads=onenote_section_listing_threads.get(self.config),
+            batch_requests=onenote_batch_requests.get(self.config),
+            sections_snapshot=sections_snapshot,
+            rate_limiter=self.rate_limiter,
         )
-        self._sync_loop(c)
 
     def _sync_loop(self, onenote: OneNoteClient):
         any_fail = False
@@ -108,14 +178,13 @@ class OneNoteSync(BaseSync[MicrosoftGraphAuthSession]):
 
             logger.info("Starting sync iteration...")
 
-            with GitTransaction(
-                self.git,
-                remote_name=git_remote_name.get(self.config),
-                push=git_push.get(self.config),
-            ) as t:
+            with self.git_transaction() as t:
                 wc = OneNoteWorkingCopy(
                     git_transaction=t,
                     timezone=get_timezone(self.config),
+                    metadata_from_git=working_copy_metadata_from_git.get(self.config),
+                    shared_resources=shared_resources.get(self.config),
+                    headers_cache=self._headers_cache,
                 )
 
                 si = _OneNoteSyncIteration(
@@ -124,6 +193,13 @@ class OneNoteSync(BaseSync[MicrosoftGraphAuthSession]):
                     notes_download_threads=notes_download_threads.get(self.config),
                     force_full_resync=self.force_full_resync,
                     git_transaction=t,
+                    max_inflight_bytes=max_inflight_bytes.get(self.config),
+                    notes_render_threads=notes_render_threads.get(self.config),
+                    checkpoint_interval_seconds=checkpoint_interval_seconds.get(
+                        self.config
+                    ),
+                    commit_every_notes=git_commit_every_notes.get(self.config),
+                    commit_every_bytes=git_commit_every_bytes.get(self.config),
                 )
 
                 changeset, update_context = si.run_transaction()
@@ -147,21 +223,8 @@ class OneNoteSync(BaseSync[MicrosoftGraphAuthSession]):
 class _OneNoteSyncIteration(
     SyncIteration[OneNotePageId, OneNotePageMetadata, OneNotePage]
 ):
-    def __init__(
-        self,
-        *,
-        onenote: OneNoteClient,
-        working_copy: WorkingCopy,
-        notes_download_threads: int,
-        force_full_resync: bool,
-        git_transaction: GitTransaction
-    ) -> None:
-        super().__init__(
-            working_copy=working_copy,
-            notes_download_threads=notes_download_threads,
-            force_full_resync=force_full_resync,
-            git_transaction=git_transaction,
-        )
+    def __init__(self, *, onenote: OneNoteClient, **kwargs) -> None:
+        super().__init__(**kwargs)
         self.onenote = onenote
 
     def get_note(
@@ -169,7 +232,13 @@ class _OneNoteSyncIteration(
     ) -> OneNotePage:
         return self.onenote.get_page(
             note_key,
-            self.working_copy.get_relative_resources_url(note_key, note_metadata),
+            self.working_copy.get_relative_resources_url(
+                note_key,
+                note_metadata,
+                shared_resources=self.working_copy.shared_resources,
+            ),
+            content_addressed_resources=self.working_copy.shared_resources,
+            staging_dir=self.working_copy.staging_dir,
         )
 
     def get_service_metadata(self) -> Mapping[OneNotePageId, OneNotePageMetadata]:
@@ -181,16 +250,28 @@ class _OneNoteSyncIteration(
     ) -> bool:
         return note.info.last_modified == note_metadata.last_modified
 
+    def check_updated_notes(
+        self, updated_notes: Sequence[Tuple[OneNotePageId, OneNotePageMetadata]]
+    ) -> bool:
+        # The page info is taken from the pages list retrieved by
+        # `get_service_metadata`, so `is_same_note` is always true.
+        try:
+            return self.onenote.check_pages_unchanged(
+                page_id for page_id, _ in updated_notes
+            )
+        except Exception as e:
+            logger.warning("Unable to check that the pages are up to date: %r", e)
+            return False
+
     def update_index(
         self,
         service_metadata: Mapping[OneNotePageId, OneNotePageMetadata],
         git_transaction: GitTransaction,
     ) -> None:
+        index_path = git_transaction.repo_dir / "index.html"
         index_renderer.render(
             notebooks=self.onenote.notebooks,
             pages=self.onenote.section_to_pages,
             service_metadata=service_metadata,
-            write=templates.file_writer(
-                str(self.git_transaction.repo_dir / "index.html")
-            ),
+            write=functools.partial(git_transaction.write_bytes, index_path),
         )
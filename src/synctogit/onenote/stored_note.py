@@ -1,7 +1,7 @@
 import datetime
 from collections import OrderedDict
 from pathlib import Path
-from typing import Mapping, Tuple
+from typing import Mapping, Optional, Tuple
 
 import dateutil.parser
 import pytz
@@ -28,7 +28,10 @@ class OneNoteStoredNote(StoredNote):
 
     @classmethod
     def get_stored_note_metadata(
-        cls, notes_dir, note_path: Path
+        cls,
+        notes_dir,
+        note_path: Path,
+        header_vars: Optional[Mapping[str, str]] = None,
     ) -> Tuple[OneNotePageId, OneNotePageMetadata]:
         dir_parts = note_path.relative_to(notes_dir).parents[0].parts
         if 2 != len(dir_parts):
@@ -37,7 +40,8 @@ class OneNoteStoredNote(StoredNote):
             )
         file = note_path.name
 
-        header_vars = cls._parse_note_header(note_path)
+        if header_vars is None:
+            header_vars = cls._parse_note_header(note_path)
         try:
             name = (
                 # fmt: off
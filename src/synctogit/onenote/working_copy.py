@@ -1,9 +1,9 @@
 from pathlib import Path
-from typing import Sequence, Tuple
+from typing import Mapping, Sequence, Tuple
 
 import pytz
 
-from synctogit.service.notes import Changeset, NoteResource, WorkingCopy
+from synctogit.service.notes import Changeset, NoteResource, RenderedNote, WorkingCopy
 
 from .models import OneNotePage, OneNotePageId, OneNotePageMetadata
 from .stored_note import OneNoteStoredNote
@@ -39,12 +39,16 @@ class OneNoteWorkingCopy(
         return dt1 != dt2
 
     def _get_stored_note_metadata(
-        self, notes_dir, note_path: Path
+        self, notes_dir, note_path: Path, header_vars: Mapping[str, str]
     ) -> Tuple[OneNotePageId, OneNotePageMetadata]:
-        return OneNoteStoredNote.get_stored_note_metadata(notes_dir, note_path)
+        return OneNoteStoredNote.get_stored_note_metadata(
+            notes_dir, note_path, header_vars
+        )
 
-    def save_note(self, note: OneNotePage, metadata: OneNotePageMetadata):
-        super()._save_note(
+    def render_note(
+        self, note: OneNotePage, metadata: OneNotePageMetadata
+    ) -> RenderedNote:
+        return RenderedNote(
             note_key=note.info.id,
             metadata=metadata,
             html_body=OneNoteStoredNote.note_to_html(note, self.timezone),
@@ -0,0 +1,183 @@
+import contextlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from . import git_config
+from .config import Config, FilesystemConfigReadWriter, StrConfigItem
+from .syncer import Syncer, services
+
+logger = logging.getLogger(__name__)
+
+# The service of an account synced by the scheduler.
+scheduler_service = StrConfigItem("synctogit", "service")
+
+
+class AccountResult(NamedTuple):
+    name: str
+    # None if the sync has succeeded.
+    error: Optional[Exception]
+    duration_seconds: float
+
+    @property
+    def is_ok(self) -> bool:
+        return self.error is None
+
+
+class _Account:
+    def __init__(self, config_path: Path) -> None:
+        self.name = config_path.stem
+        self.config = Config(FilesystemConfigReadWriter(str(config_path)))
+        self.service = scheduler_service.get(self.config)
+        if self.service not in services:
+            raise ValueError(
+                "Unknown service %r in the [synctogit] section of %s"
+                % (self.service, config_path)
+            )
+        self.repo_dir = os.path.realpath(git_config.git_repo_dir.get(self.config))
+        # Created by the first sync, kept by the subsequent ones.
+        self.syncer = None  # type: Optional[Syncer]
+
+
+class Scheduler:
+    """Syncs multiple accounts in a single process. Each account is
+    described by its own config file, which specifies the service
+    (see `scheduler_service`).
+
+    At most `jobs` accounts are synced simultaneously, and at most
+    `max_per_service` of them (0 means no limit) for the same service.
+    Each account has its own rate limiter, because the services throttle
+    each user separately.
+    The accounts synced to the same repo are synced one at a time,
+    because a repo allows a single `GitTransaction`.
+
+    The state of an account is kept between the runs (see the daemon
+    mode), the same as for a single account.
+    """
+
+    def __init__(
+        self,
+        config_paths: Sequence[Path],
+        *,
+        jobs: int = 4,
+        max_per_service: int = 0,
+        force_update: bool = False
+    ) -> None:
+        self.config_paths = config_paths
+        self.jobs = jobs
+        self.max_per_service = max_per_service
+        self.force_update = force_update
+        self._accounts = {}  # type: Dict[Path, _Account]
+        self._locks_lock = threading.Lock()
+        self._repo_locks = {}  # type: Dict[str, threading.Lock]
+        self._service_semaphores = {}  # type: Dict[str, threading.Semaphore]
+
+    @classmethod
+    def from_dir(cls, config_dir: Path, **kwargs) -> "Scheduler":
+        """Sync the accounts of all `*.ini` files in the `config_dir`."""
+        return cls(sorted(config_dir.glob("*.ini")), **kwargs)
+
+    def run(self) -> List[AccountResult]:
+        """Sync all accounts once. The failures are reported in the results
+        instead of being raised.
+        """
+        results = []  # type: List[AccountResult]
+        accounts = []  # type: List[_Account]
+        for path in self.config_paths:
+            # The valid configs are loaded once, the broken ones are
+            # reported by each run.
+            if path not in self._accounts:
+                try:
+                    self._accounts[path] = _Account(path)
+                except Exception as e:
+                    logger.error("Unable to load the %s config: %r", path, e)
+                    results.append(AccountResult(path.stem, e, 0.0))
+                    continue
+            accounts.append(self._accounts[path])
+
+        with ThreadPoolExecutor(
+            max_workers=self.jobs, thread_name_prefix="synctogit-scheduler"
+        ) as executor:
+            results.extend(executor.map(self._sync_account, accounts))
+        results.sort(key=lambda r: r.name)
+        self.print_report(results)
+        return results
+
+    def close(self) -> List[AccountResult]:
+        """Release the clients and flush the pushers of all accounts.
+
+        The results report the accounts which commits couldn't be pushed.
+        """
+        failures = []  # type: List[AccountResult]
+        for account in self._accounts.values():
+            syncer, account.syncer = account.syncer, None
+            if syncer is None:
+                continue
+            try:
+                if not syncer.close():
+                    raise Exception(
+                        "Unable to git push: %s" % syncer.pusher.status().last_error
+                    )
+            except Exception as e:
+                logger.error("Unable to close the %s account: %r", account.name, e)
+                failures.append(AccountResult(account.name, e, 0.0))
+        return failures
+
+    @staticmethod
+    def print_report(results: Sequence[AccountResult]) -> None:
+        logger.info("Synced %d accounts:", len(results))
+        for result in results:
+            if result.is_ok:
+                logger.info(
+                    "  %s: OK in %.1f seconds", result.name, result.duration_seconds
+                )
+            else:
+                logger.error(
+                    "  %s: FAILED in %.1f seconds: %r",
+                    result.name,
+                    result.duration_seconds,
+                    result.error,
+                )
+
+    def _sync_account(self, account: _Account) -> AccountResult:
+        error = None  # type: Optional[Exception]
+        with self._service_slot(account.service), self._repo_lock(account.repo_dir):
+            logger.info("Syncing the %s account (%s)...", account.name, account.service)
+            started_at = time.monotonic()
+            try:
+                if account.syncer is None:
+                    account.syncer = Syncer.create(
+                        account.service,
+                        account.config,
+                        # There's no one to answer the prompts.
+                        batch=True,
+                        force_update=self.force_update,
+                    )
+                account.syncer.sync()
+            except Exception as e:
+                logger.exception("Sync of the %s account has failed", account.name)
+                error = e
+        return AccountResult(account.name, error, time.monotonic() - started_at)
+
+    @contextlib.contextmanager
+    def _service_slot(self, service: str) -> Iterator[None]:
+        if not self.max_per_service:
+            yield
+            return
+        with self._locks_lock:
+            semaphore = self._service_semaphores.setdefault(
+                service, threading.Semaphore(self.max_per_service)
+            )
+        with semaphore:
+            yield
+
+    @contextlib.contextmanager
+    def _repo_lock(self, repo_dir: str) -> Iterator[None]:
+        with self._locks_lock:
+            lock = self._repo_locks.setdefault(repo_dir, threading.Lock())
+        with lock:
+            yield
@@ -14,13 +14,20 @@ from .exc import (
     ServiceUnavailableError,
     UserCancelledError,
 )
-from .retries import retry_ratelimited, retry_unavailable
+from .rate_limiter import RateLimiter
+from .retries import (
+    async_retry_ratelimited,
+    async_retry_unavailable,
+    retry_ratelimited,
+    retry_unavailable,
+)
 
 __all__ = (
     "BaseAuth",
     "BaseAuthSession",
     "BaseSync",
     "InvalidAuthSession",
+    "RateLimiter",
     "ServiceAPIError",
     "ServiceAuthError",
     "ServiceError",
@@ -29,6 +36,8 @@ __all__ = (
     "ServiceTokenExpiredError",
     "ServiceUnavailableError",
     "UserCancelledError",
+    "async_retry_ratelimited",
+    "async_retry_unavailable",
     "retry_ratelimited",
     "retry_unavailable",
 )
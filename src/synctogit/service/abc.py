@@ -1,9 +1,19 @@
 import abc
-from typing import Generic, NamedTuple, Type, TypeVar
+from typing import Generic, NamedTuple, Optional, Type, TypeVar
 
 import git
 
 from synctogit.config import Config
+from synctogit.git_config import (
+    git_backend,
+    git_push,
+    git_remote_name,
+    git_targeted_staging,
+)
+from synctogit.git_pusher import GitPusher
+from synctogit.git_transaction import GitTransaction
+
+from .rate_limiter import RateLimiter
 
 
 class InvalidAuthSession(ValueError):
@@ -36,16 +46,54 @@ class BaseAuth(abc.ABC, Generic[T]):
 
 
 class BaseSync(abc.ABC, Generic[T]):
+    # The name of the service in the rate limiter logs.
+    rate_limiter_name = "service"
+
     def __init__(
-        self, config: Config, auth_session: T, git: git.Repo, force_full_resync: bool
+        self,
+        config: Config,
+        auth_session: T,
+        git: git.Repo,
+        force_full_resync: bool,
+        *,
+        bulk_import: bool = False,
+        pusher: Optional[GitPusher] = None
     ) -> None:
         self.config = config
         self.auth_session = auth_session
         self.git = git
         self.force_full_resync = force_full_resync
+        # See `GitTransaction.bulk_import`.
+        self.bulk_import = bulk_import
+        # See `GitTransaction.pusher`.
+        self.pusher = pusher
+        # Shared by all clients of the account and kept between the syncs.
+        # The accounts synced by the same process are throttled separately.
+        self.rate_limiter = RateLimiter(self.rate_limiter_name)
+
+    def git_transaction(self) -> GitTransaction:
+        """A transaction over the repo, configured by the [git] section."""
+        return GitTransaction(
+            self.git,
+            remote_name=git_remote_name.get(self.config),
+            push=git_push.get(self.config),
+            targeted_staging=git_targeted_staging.get(self.config),
+            bulk_import=self.bulk_import,
+            pusher=self.pusher,
+            backend=git_backend.get(self.config),
+        )
 
     @abc.abstractmethod
     def run_sync(self) -> None:
+        """Sync the service to the repo.
+
+        Might be called multiple times (see the daemon mode): the clients
+        and the caches created by a sync should be kept for the next ones.
+        """
+        pass
+
+    def close(self) -> None:
+        """Release the clients kept between the syncs."""
         pass
 
 
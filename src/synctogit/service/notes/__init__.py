@@ -1,11 +1,12 @@
 from .stored_note import CorruptedNoteError, StoredNote
 from .sync_iteration import SyncIteration, UpdateContext
-from .working_copy import Changeset, NoteResource, WorkingCopy
+from .working_copy import Changeset, NoteResource, RenderedNote, WorkingCopy
 
 __all__ = (
     "Changeset",
     "CorruptedNoteError",
     "NoteResource",
+    "RenderedNote",
     "StoredNote",
     "SyncIteration",
     "UpdateContext",
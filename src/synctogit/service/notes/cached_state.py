@@ -0,0 +1,39 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+def load_cached_state(
+    path: Path, version: int, name: str, load: Callable[[Dict[str, Any]], None]
+) -> bool:
+    """Read a JSON state written by `save_cached_state` and pass it
+    to `load`, which raises if the state is malformed.
+
+    Returns False if the state is missing, corrupted or has been written
+    with a different `version`. The state should be discarded then.
+    """
+    try:
+        with open(str(path), "rt") as f:
+            data = json.load(f)
+        if data["version"] != version:
+            raise ValueError("Unsupported %s version %r" % (name, data["version"]))
+        load(data)
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logger.warning("%s is corrupted and is going to be discarded: %r", name, e)
+        return False
+    return True
+
+
+def save_cached_state(path: Path, version: int, data: Dict[str, Any]) -> None:
+    """Atomically write the `data` along with its `version` as JSON."""
+    os.makedirs(str(path.parents[0]), exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(str(tmp_path), "wt") as f:
+        json.dump(dict(data, version=version), f)
+    os.replace(str(tmp_path), str(path))
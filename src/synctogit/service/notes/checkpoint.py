@@ -0,0 +1,51 @@
+from pathlib import Path
+from typing import Any, Dict, Set
+
+from synctogit.git_transaction import rmfile_silent
+
+from .cached_state import load_cached_state, save_cached_state
+
+
+class SyncCheckpoint:
+    """The progress of a forced resync, persisted along with
+    the checkpoint commits.
+
+    The notes which have been committed during an interrupted forced
+    resync are not downloaded again when the resync is resumed,
+    unless they have been changed in the service since then.
+    """
+
+    version = 1
+
+    def __init__(self, checkpoint_path: Path) -> None:
+        self.checkpoint_path = checkpoint_path
+        self.discard()
+
+    def discard(self) -> None:
+        self.is_force_full_resync = False
+        self.saved_note_keys = set()  # type: Set[str]
+
+    def load(self) -> None:
+        if not load_cached_state(
+            self.checkpoint_path, self.version, "Sync checkpoint", self._load
+        ):
+            self.discard()
+
+    def _load(self, data: Dict[str, Any]) -> None:
+        self.is_force_full_resync = bool(data["force_full_resync"])
+        self.saved_note_keys = set(data["saved_note_keys"])
+
+    def save(self) -> None:
+        save_cached_state(
+            self.checkpoint_path,
+            self.version,
+            dict(
+                force_full_resync=self.is_force_full_resync,
+                saved_note_keys=sorted(self.saved_note_keys),
+            ),
+        )
+
+    def remove(self) -> None:
+        self.discard()
+        if self.checkpoint_path.exists():
+            rmfile_silent(self.checkpoint_path)
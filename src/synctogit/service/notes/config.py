@@ -0,0 +1,15 @@
+from synctogit.config import BoolConfigItem, IntConfigItem
+
+working_copy_metadata_from_git = BoolConfigItem(
+    "internals", "working_copy_metadata_from_git", False
+)
+shared_resources = BoolConfigItem("internals", "shared_resources", False)
+# The approximate limit of memory held by the downloaded but not yet saved
+# notes. 0 means unlimited.
+max_inflight_bytes = IntConfigItem("internals", "max_inflight_bytes", 256 * 1024 * 1024)
+notes_render_threads = IntConfigItem("internals", "notes_render_threads", 2)
+# Commit the notes saved so far every that many seconds, so an interrupted
+# sync doesn't start over. 0 (the default) disables the checkpoints.
+checkpoint_interval_seconds = IntConfigItem(
+    "internals", "checkpoint_interval_seconds", 0
+)
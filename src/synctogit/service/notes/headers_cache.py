@@ -0,0 +1,86 @@
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from .cached_state import load_cached_state, save_cached_state
+
+
+class NoteHeadersCache:
+    """A persistent cache of the parsed note headers.
+
+    Parsing a header requires opening a note file, which becomes slow
+    when there are tens of thousands of notes. This cache maps a note
+    path (relative to the Notes directory) to its parsed header along
+    with a fingerprint of the file, so only the notes which fingerprint
+    has changed have to be parsed again.
+
+    The cache is disposable: it is rebuilt from scratch when it is
+    missing, corrupted or has been written by an incompatible version.
+
+    A long-living instance (see the daemon mode) doesn't parse the file
+    again on `load` unless it has been changed since the last `save`.
+    """
+
+    # This class must be thread-safe
+
+    version = 1
+
+    def __init__(self, cache_path: Path) -> None:
+        self.cache_path = cache_path
+        self._cached = {}  # type: Dict[str, Any]
+        self._fresh = {}  # type: Dict[str, Any]
+        self._lock = threading.Lock()
+        # The entries written by the last `save` along with the stat
+        # of the written file.
+        self._saved = None  # type: Optional[Tuple[Tuple[int, int], Dict[str, Any]]]
+
+    def load(self) -> None:
+        with self._lock:
+            saved = self._saved
+        if saved is not None and saved[0] == _file_stat(self.cache_path):
+            with self._lock:
+                self._cached = saved[1]
+                self._fresh = {}
+            return
+
+        entries = {}  # type: Dict[str, Any]
+
+        def load(data: Dict[str, Any]) -> None:
+            if not isinstance(data["entries"], dict):
+                raise ValueError("Entries are expected to be a dict")
+            entries.update(data["entries"])
+
+        load_cached_state(self.cache_path, self.version, "Note headers cache", load)
+
+        with self._lock:
+            self._cached = entries
+            self._fresh = {}
+
+    def get(self, note_path: str, fingerprint: Any) -> Optional[Mapping[str, str]]:
+        with self._lock:
+            entry = self._cached.get(note_path)
+            if entry is None or entry["fingerprint"] != fingerprint:
+                return None
+            self._fresh[note_path] = entry
+            return entry["header"]
+
+    def set(self, note_path: str, fingerprint: Any, header: Mapping[str, str]) -> None:
+        with self._lock:
+            self._fresh[note_path] = dict(fingerprint=fingerprint, header=dict(header))
+
+    def save(self) -> None:
+        # Only the entries which have been requested since the last `load`
+        # are saved, so the removed notes are naturally pruned.
+        with self._lock:
+            save_cached_state(self.cache_path, self.version, dict(entries=self._fresh))
+            stat = _file_stat(self.cache_path)
+            self._saved = None if stat is None else (stat, dict(self._fresh))
+
+
+def _file_stat(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(str(path))
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Iterable, Optional, Union
+
+from synctogit.git_transaction import rmfile_silent
+from synctogit.git_tree import BaseGitTree
+
+# A resource body might be either the contents itself, a path to
+# a temporary file (see `write_staging_file`) which is moved to
+# the destination, or a file-like object which is copied from.
+TResourceBody = Union[bytes, Path, BinaryIO]
+
+_copy_chunk_size = 1024 * 1024
+
+
+def new_staging_path(staging_dir: Path) -> Path:
+    """Return a path for a new file in the `staging_dir` directory.
+
+    The staging dir should be on the same filesystem as the repo,
+    so the file could be atomically moved into the working copy.
+    """
+    os.makedirs(str(staging_dir), exist_ok=True)
+    return staging_dir / uuid.uuid4().hex
+
+
+def write_staging_file(staging_dir: Path, chunks: Iterable[bytes]) -> Path:
+    """Write the `chunks` to a new file in the `staging_dir` directory
+    and return its path.
+    """
+    path = new_staging_path(staging_dir)
+    try:
+        with open(str(path), "xb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+    except BaseException:
+        rmfile_silent(path)
+        raise
+    return path
+
+
+def store_resource_body(
+    path: Path, body: TResourceBody, *, tree: Optional[BaseGitTree] = None
+) -> None:
+    """Atomically write the resource `body` to `path`, or to the `tree`
+    of a bare repo if it is given.
+    """
+    if tree is not None:
+        tree.write(path, body)
+        discard_resource_body(body)
+        return
+
+    if isinstance(body, Path):
+        try:
+            os.replace(str(body), str(path))
+            return
+        except OSError:
+            # Probably a different filesystem.
+            with open(str(body), "rb") as f:
+                store_resource_body(path, f)
+            rmfile_silent(body)
+            return
+
+    tmp_path = path.with_name(".%s.%s.tmp" % (path.name, uuid.uuid4().hex))
+    try:
+        with open(str(tmp_path), "wb") as f:
+            if isinstance(body, bytes):
+                f.write(body)
+            else:
+                shutil.copyfileobj(body, f, _copy_chunk_size)
+        os.replace(str(tmp_path), str(path))
+    except BaseException:
+        if tmp_path.exists():
+            rmfile_silent(tmp_path)
+        raise
+
+
+def resource_body_size(body: TResourceBody) -> int:
+    if isinstance(body, bytes):
+        return len(body)
+    if isinstance(body, Path):
+        return body.stat().st_size
+    try:
+        return os.fstat(body.fileno()).st_size
+    except (AttributeError, OSError):
+        return 0
+
+
+def discard_resource_body(body: TResourceBody) -> None:
+    """Release the resources held by a body which is not going to be stored."""
+    if isinstance(body, Path):
+        rmfile_silent(body)
+
+
+def hash_resource_body(body: TResourceBody) -> str:
+    """Return the hex md5 digest of the resource `body`."""
+    if isinstance(body, bytes):
+        return hashlib.md5(body).hexdigest()
+    if isinstance(body, Path):
+        with open(str(body), "rb") as f:
+            return hash_resource_body(f)
+
+    h = hashlib.md5()
+    pos = body.tell()
+    for chunk in iter(lambda: body.read(_copy_chunk_size), b""):
+        h.update(chunk)
+    body.seek(pos)
+    return h.hexdigest()
+
+
+def clean_staging_dir(staging_dir: Path) -> None:
+    shutil.rmtree(str(staging_dir), ignore_errors=True)
@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from synctogit.git_transaction import rmfile_silent
+from synctogit.git_tree import BaseGitTree
+
+from .resources import TResourceBody, discard_resource_body, store_resource_body
+
+logger = logging.getLogger(__name__)
+
+
+class SharedResourceStore:
+    """A content-addressed store of resources shared by all notes.
+
+    Each resource is stored once as `<objects_dir>/<hash>.<ext>`, no matter
+    how many notes refer to it. The list of resources referred by each
+    note is kept in the `refs_path` file, which is committed along with
+    the notes. Objects which are no longer referred by any note are
+    removed by `collect_garbage`, which is called once all the notes
+    have been saved, so an object dropped by one note might still be
+    reused by another one within the same sync.
+
+    The files are kept in the `tree` instead of the filesystem when
+    it is given (i.e. for a bare repo).
+    """
+
+    # This class must be thread-safe
+
+    def __init__(
+        self, objects_dir: Path, refs_path: Path, *, tree: Optional[BaseGitTree] = None
+    ) -> None:
+        self.objects_dir = objects_dir
+        self.refs_path = refs_path
+        self.tree = tree
+        self._lock = threading.Lock()
+        self._refs = {}  # type: Dict[str, Set[str]]
+        self._counts = Counter()  # type: Counter
+        self._objects = set()  # type: Set[str]
+        # Objects are allowed to be removed only when the refs are known
+        # for sure, otherwise some note might lose its resources.
+        self._is_refs_complete = False
+        self._is_dirty = False
+
+    def load(self) -> None:
+        if self.tree is not None:
+            objects = self.tree.listdir(self.objects_dir)
+        else:
+            try:
+                objects = set(os.listdir(str(self.objects_dir)))
+            except FileNotFoundError:
+                objects = set()
+
+        try:
+            refs = {k: set(v) for k, v in json.loads(self._read_refs()).items()}
+            is_refs_complete = True
+        except FileNotFoundError:
+            refs = {}
+            is_refs_complete = not objects
+        except Exception as e:
+            logger.warning(
+                "Shared resources refs file is corrupted, unreferenced "
+                "resources will not be removed until it is rebuilt "
+                "with a forced update: %r",
+                e,
+            )
+            refs = {}
+            is_refs_complete = False
+
+        with self._lock:
+            self._objects = objects
+            self._refs = refs
+            self._counts = Counter(
+                filename for filenames in refs.values() for filename in filenames
+            )
+            self._is_refs_complete = is_refs_complete
+            self._is_dirty = False
+
+    def __contains__(self, filename: str) -> bool:
+        with self._lock:
+            return filename in self._objects
+
+    def set_note_refs(self, note_key: str, filenames: Iterable[str]) -> None:
+        filenames = set(filenames)
+        with self._lock:
+            old_filenames = self._refs.pop(note_key, set())
+            if filenames:
+                self._refs[note_key] = filenames
+            self._counts.update(filenames)
+            self._unref(old_filenames)
+            self._is_dirty = self._is_dirty or filenames != old_filenames
+
+    def retain_notes(self, note_keys: Iterable[str]) -> Set[str]:
+        """Drop the refs of all notes except the `note_keys` ones.
+        Returns the keys of the dropped notes.
+        """
+        note_keys = set(note_keys)
+        with self._lock:
+            dropped = set(self._refs) - note_keys
+            for note_key in dropped:
+                self._unref(self._refs.pop(note_key))
+                self._is_dirty = True
+        return dropped
+
+    def write_object(self, filename: str, body: TResourceBody) -> None:
+        with self._lock:
+            is_stored = filename in self._objects
+        if is_stored:
+            # The name is derived from the contents, so it is the same.
+            discard_resource_body(body)
+            return
+        if self.tree is None:
+            os.makedirs(str(self.objects_dir), exist_ok=True)
+        # Leftovers of an interrupted write are removed by `collect_garbage`.
+        store_resource_body(self.objects_dir / filename, body, tree=self.tree)
+        with self._lock:
+            self._objects.add(filename)
+
+    def mark_refs_complete(self) -> None:
+        """Should be called when the refs of all existing notes have been
+        set since `load`, which makes the refs trustworthy again.
+        """
+        with self._lock:
+            self._is_refs_complete = True
+            self._is_dirty = True
+
+    def collect_garbage(self) -> List[str]:
+        """Remove the unreferenced objects. Returns their filenames."""
+        with self._lock:
+            if not self._is_refs_complete:
+                return []
+            removed = [
+                filename
+                for filename in sorted(self._objects)
+                if self._counts[filename] <= 0
+            ]
+            for filename in removed:
+                self._remove_object(filename)
+            return removed
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._is_refs_complete or not self._is_dirty:
+                # Incomplete refs are not saved, so they would be
+                # considered incomplete on the next `load` as well.
+                return
+            refs = {k: sorted(v) for k, v in sorted(self._refs.items())}
+            self._write_refs((json.dumps(refs, indent=1) + "\n").encode())
+            self._is_dirty = False
+
+    def _read_refs(self) -> bytes:
+        if self.tree is not None:
+            return self.tree.read_bytes(self.refs_path)
+        return self.refs_path.read_bytes()
+
+    def _write_refs(self, data: bytes) -> None:
+        if self.tree is not None:
+            self.tree.write(self.refs_path, data)
+            return
+        os.makedirs(str(self.refs_path.parents[0]), exist_ok=True)
+        tmp_path = self.refs_path.with_name(self.refs_path.name + ".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(str(tmp_path), str(self.refs_path))
+
+    def _unref(self, filenames: Iterable[str]) -> None:
+        for filename in filenames:
+            self._counts[filename] -= 1
+            if self._counts[filename] <= 0:
+                del self._counts[filename]
+
+    def _remove_object(self, filename: str) -> None:
+        if self.tree is not None:
+            self.tree.remove(self.objects_dir / filename)
+        else:
+            rmfile_silent(self.objects_dir / filename)
+        self._objects.discard(filename)
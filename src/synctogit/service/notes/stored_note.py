@@ -1,7 +1,7 @@
 import abc
 import re
 from pathlib import Path
-from typing import Dict, Mapping
+from typing import BinaryIO, Dict, Mapping
 
 
 class StoredNote(abc.ABC):
@@ -36,6 +36,11 @@ class StoredNote(abc.ABC):
 
     @classmethod
     def _parse_note_header(cls, note_path: Path) -> Dict[str, str]:
+        with open(str(note_path), "rb") as f:
+            return cls._parse_note_header_stream(f, note_path)
+
+    @classmethod
+    def _parse_note_header_stream(cls, f: BinaryIO, note_path: Path) -> Dict[str, str]:
         start_mark, end_mark = cls.note_html_header_fields_marks
         # We will compare them with the readline() output, which
         # lines end with a newline.
@@ -44,40 +49,39 @@ class StoredNote(abc.ABC):
 
         line = b"start"  # I'm waiting for PEP-572 eagerly
         result = {}
-        with open(str(note_path), "rb") as f:
-            # Skip lines before the starting mark
-            while line != start_mark and line != b"":
-                line = f.readline()
+        # Skip lines before the starting mark
+        while line != start_mark and line != b"":
+            line = f.readline()
 
-            if line == b"":  # EOF
+        if line == b"":  # EOF
+            raise CorruptedNoteError(
+                "Unable to find the starting mark of the note metadata "
+                "header for %s" % note_path,
+                note_path,
+            )
+
+        # Read the actual vars
+        line = f.readline()
+        while line != end_mark and line != b"":
+            g = re.search(b"^<!-- ([a-zA-Z_]+): (.+) -->$", line)
+            if g is None:
                 raise CorruptedNoteError(
-                    "Unable to find the starting mark of the note metadata "
-                    "header for %s" % note_path,
+                    "Expected a metadata variable in the header, but "
+                    'it hasn\'t been found in the line "%s" of the note '
+                    "%s" % (line.decode().strip(), note_path),
                     note_path,
                 )
-
-            # Read the actual vars
+            key = g.group(1).decode()
+            value = g.group(2).decode()
+            result[key] = value
             line = f.readline()
-            while line != end_mark and line != b"":
-                g = re.search(b"^<!-- ([a-zA-Z_]+): (.+) -->$", line)
-                if g is None:
-                    raise CorruptedNoteError(
-                        "Expected a metadata variable in the header, but "
-                        'it hasn\'t been found in the line "%s" of the note '
-                        "%s" % (line.decode().strip(), note_path),
-                        note_path,
-                    )
-                key = g.group(1).decode()
-                value = g.group(2).decode()
-                result[key] = value
-                line = f.readline()
 
-            if line == b"":  # EOF
-                raise CorruptedNoteError(
-                    "Unable to find the end mark of the note metadata "
-                    "header for %s" % note_path,
-                    note_path,
-                )
+        if line == b"":  # EOF
+            raise CorruptedNoteError(
+                "Unable to find the end mark of the note metadata "
+                "header for %s" % note_path,
+                note_path,
+            )
         return result
 
 
@@ -1,24 +1,71 @@
 import abc
+import contextlib
 import logging
+import queue
 import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
-from typing import Generic, List, Mapping, Tuple
+from typing import Callable, Dict, Generic, List, Mapping, Optional, Sequence, Tuple
 
+from synctogit.git_factory import local_git_ignored_cache_dir
 from synctogit.git_transaction import GitTransaction
 
+from .checkpoint import SyncCheckpoint
+from .resources import resource_body_size
 from .types import TNote, TNoteKey, TNoteMetadata
-from .working_copy import Changeset, WorkingCopy
+from .working_copy import Changeset, RenderedNote, WorkingCopy
 
 logger = logging.getLogger(__name__)
 
 
+class StageStats:
+    """Throughput of a single stage of the notes update pipeline."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.busy_seconds = 0.0
+        self.first_started = None  # type: Optional[float]
+        self.last_finished = None  # type: Optional[float]
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def measure(self):
+        started = time.monotonic()
+        yield
+        finished = time.monotonic()
+        with self.lock:
+            self.count += 1
+            self.busy_seconds += finished - started
+            if self.first_started is None:
+                self.first_started = started
+            self.last_finished = finished
+
+    @property
+    def wall_seconds(self) -> float:
+        if self.first_started is None:
+            return 0.0
+        return self.last_finished - self.first_started
+
+    @property
+    def per_second(self) -> float:
+        if not self.wall_seconds:
+            return 0.0
+        return self.count / self.wall_seconds
+
+
 class UpdateContext:
+    stage_names = ("fetch", "render", "write")
+
     def __init__(self, total: int):
         self.started = 0
         self.total = total
         self.updated_notes = []  # type: List[Tuple[TNoteKey, TNoteMetadata]]
         self.failed_notes = []  # type: List[Tuple[TNoteKey, TNoteMetadata]]
         self.is_converged = True
+        self.stages = {name: StageStats() for name in self.stage_names}
+        self.last_checkpoint = time.monotonic()
+        self.notes_since_checkpoint = 0
+        self.bytes_since_checkpoint = 0
         self.lock = threading.Lock()
 
     def start(self):
@@ -40,24 +87,85 @@ class UpdateContext:
             self.failed_notes.append((note_key, note_metadata))
 
 
+class InflightBytesBudget:
+    """Limits the memory held by the notes which have been downloaded
+    but haven't been saved yet.
+
+    A note is allowed to be downloaded only while the budget is not
+    exhausted. The note's size is known only after it has been
+    downloaded, so the budget might be exceeded by at most the sizes
+    of the notes which are being downloaded simultaneously.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes  # 0 means unlimited
+        self.inflight = 0
+        self._cond = threading.Condition()
+
+    def wait(self, is_exempt: Callable[[], bool] = lambda: False) -> None:
+        # `is_exempt` is checked along with the budget, so it must change
+        # before a `release` call, which wakes up the waiters.
+        if not self.max_bytes:
+            return
+        with self._cond:
+            self._cond.wait_for(lambda: self.inflight < self.max_bytes or is_exempt())
+
+    def acquire(self, size: int) -> None:
+        with self._cond:
+            self.inflight += size
+
+    def release(self, size: int) -> None:
+        with self._cond:
+            self.inflight -= size
+            self._cond.notify_all()
+
+
 class SyncIteration(abc.ABC, Generic[TNoteKey, TNoteMetadata, TNote]):
+    checkpoint_file_name = "sync_checkpoint.json"
+
     def __init__(
         self,
         *,
         working_copy: WorkingCopy,
         notes_download_threads: int,
         force_full_resync: bool,
-        git_transaction: GitTransaction
+        git_transaction: GitTransaction,
+        max_inflight_bytes: int = 0,
+        notes_render_threads: int = 2,
+        checkpoint_interval_seconds: int = 0,
+        commit_every_notes: int = 0,
+        commit_every_bytes: int = 0
     ) -> None:
         self.working_copy = working_copy
         self.notes_download_threads = notes_download_threads
+        self.notes_render_threads = notes_render_threads
         self.force_full_resync = force_full_resync
         self.git_transaction = git_transaction
+        self.inflight_budget = InflightBytesBudget(max_inflight_bytes)
+        # The notes saved so far are committed every that many seconds,
+        # so they are not lost if the sync fails. 0 disables checkpoints.
+        self.checkpoint_interval_seconds = checkpoint_interval_seconds
+        # Also commit every that many saved notes or bytes, so a huge
+        # import doesn't end up with a single enormous commit.
+        self.commit_every_notes = commit_every_notes
+        self.commit_every_bytes = commit_every_bytes
+        self.checkpoint = None  # type: Optional[SyncCheckpoint]
 
     @abc.abstractmethod
     def get_note(self, note_key: TNoteKey, note_metadata: TNoteMetadata) -> TNote:
         pass
 
+    def get_note_size(self, note: TNote) -> int:
+        """Returns the amount of memory held by a downloaded note, in bytes.
+
+        The note is expected to have the `html` body and the `resources`
+        mapping, which values have the `body`. Override it otherwise.
+        """
+        # Resources which have been streamed to files don't count.
+        return len(note.html) + sum(
+            len(r.body) for r in note.resources.values() if isinstance(r.body, bytes)
+        )
+
     @abc.abstractmethod
     def get_service_metadata(self) -> Mapping[TNoteKey, TNoteMetadata]:
         pass
@@ -66,6 +174,17 @@ class SyncIteration(abc.ABC, Generic[TNoteKey, TNoteMetadata, TNote]):
     def is_same_note(self, note: TNote, note_metadata: TNoteMetadata) -> bool:
         pass
 
+    def check_updated_notes(
+        self, updated_notes: Sequence[Tuple[TNoteKey, TNoteMetadata]]
+    ) -> bool:
+        """Returns False if any of the updated notes might have been
+        changed in the service while they were being saved.
+
+        The services which can't tell it from a single note's response
+        should override this method.
+        """
+        return True
+
     @abc.abstractmethod
     def update_index(
         self,
@@ -75,6 +194,25 @@ class SyncIteration(abc.ABC, Generic[TNoteKey, TNoteMetadata, TNote]):
         pass
 
     def run_transaction(self):
+        self.checkpoint = SyncCheckpoint(
+            self.git_transaction.repo_dir
+            / local_git_ignored_cache_dir
+            / self.checkpoint_file_name
+        )
+        self.checkpoint.load()
+        # An interrupted forced resync is continued even if it is not
+        # forced this time.
+        force_full_resync = (
+            self.force_full_resync or self.checkpoint.is_force_full_resync
+        )
+        if self.checkpoint.is_force_full_resync:
+            logger.info(
+                "Resuming the interrupted forced resync, %d notes "
+                "have been saved already",
+                len(self.checkpoint.saved_note_keys),
+            )
+        self.checkpoint.is_force_full_resync = force_full_resync
+
         logger.info("Retrieving actual metadata...")
         working_copy_metadata, service_metadata = self._retrieve_metadata()
 
@@ -82,18 +220,67 @@ class SyncIteration(abc.ABC, Generic[TNoteKey, TNoteMetadata, TNote]):
         changeset = self.working_copy.calculate_changes(
             working_copy_metadata=working_copy_metadata,
             service_metadata=service_metadata,
-            force_update=self.force_full_resync,
+            force_update=force_full_resync,
+        )
+        is_resumed = force_full_resync and self._skip_checkpointed_notes(
+            changeset, working_copy_metadata, service_metadata
         )
 
         logger.info("Applying changes...")
         self.working_copy.delete_notes(changeset.delete.values())
         update_context = self._update_notes(changeset)
+        if update_context.updated_notes and not self.check_updated_notes(
+            update_context.updated_notes
+        ):
+            update_context.set_not_converged()
+        is_complete = update_context.is_converged and not update_context.failed_notes
+        self.working_copy.finalize(
+            service_metadata.keys(),
+            # A forced resync saves every note, unless some of them fail
+            # or had been saved by the interrupted one.
+            is_refs_rebuilt=force_full_resync and is_complete and not is_resumed,
+        )
 
         logger.info("Updating index...")
         self.update_index(service_metadata, self.git_transaction)
 
+        if force_full_resync and not is_complete:
+            # The next iteration would save the rest of the notes.
+            self._save_checkpoint(update_context)
+        else:
+            self.checkpoint.remove()
+
         return changeset, update_context
 
+    def _skip_checkpointed_notes(
+        self,
+        changeset: Changeset,
+        working_copy_metadata: Mapping[TNoteKey, TNoteMetadata],
+        service_metadata: Mapping[TNoteKey, TNoteMetadata],
+    ) -> bool:
+        """Remove the notes saved by the interrupted forced resync
+        from the `changeset`, unless they have been changed since then.
+        Returns True if any notes have been skipped.
+        """
+        regular_changeset = self.working_copy.calculate_changes(
+            working_copy_metadata=working_copy_metadata,
+            service_metadata=service_metadata,
+            force_update=False,
+        )
+        skipped = [
+            note_key
+            for note_key in changeset.update
+            if note_key in self.checkpoint.saved_note_keys
+            and note_key not in regular_changeset.update
+        ]
+        for note_key in skipped:
+            del changeset.update[note_key]
+        if skipped:
+            logger.info(
+                "Skipping %d notes saved by the interrupted resync", len(skipped)
+            )
+        return bool(skipped)
+
     @classmethod
     def print_report(cls, changeset, update_context):
         logger.info(
@@ -107,6 +294,15 @@ class SyncIteration(abc.ABC, Generic[TNoteKey, TNoteMetadata, TNote]):
             len(update_context.updated_notes),
             len(update_context.failed_notes),
         )
+        for name, stats in update_context.stages.items():
+            logger.info(
+                "Stage %s: %d notes in %.1fs (%.1f notes/s), busy for %.1fs",
+                name,
+                stats.count,
+                stats.wall_seconds,
+                stats.per_second,
+                stats.busy_seconds,
+            )
 
     def _retrieve_metadata(self):
         # Gather metadata from both the service and the git repo simultaneously.
@@ -126,58 +322,249 @@ class SyncIteration(abc.ABC, Generic[TNoteKey, TNoteMetadata, TNote]):
         ]
         update_context = UpdateContext(total=len(notes_to_update))
 
-        with ThreadPoolExecutor(max_workers=self.notes_download_threads) as pool:
-            for note_key, note_metadata in notes_to_update:
-                pool.submit(self._update_note, note_key, note_metadata, update_context)
+        # The notes are processed by a pipeline:
+        # - the fetch pool downloads the notes,
+        # - the render pool converts them to HTML,
+        # - the single writer thread saves them to the working copy
+        #   in the order they have been submitted in,
+        # so the network threads are not blocked by the disk and the CPU.
+        #
+        # Don't let more notes in than the pipeline is able to process
+        # soon, so the pending work doesn't pile up in memory. Every
+        # submitted item reaches the writer, even if it has failed,
+        # and the writer returns its slot.
+        window = threading.BoundedSemaphore(self.notes_download_threads * 2)
+        write_queue = queue.Queue()  # type: queue.Queue
+        write_order = _WriteOrder()
+        writer = threading.Thread(
+            target=self._write_notes,
+            args=(write_queue, update_context, window, write_order),
+            name="synctogit-notes-writer",
+        )
+        writer.start()
+        try:
+            # The fetch pool is shut down first, because it submits
+            # the notes to the render pool.
+            with ThreadPoolExecutor(max_workers=self.notes_render_threads) as render:
+                with ThreadPoolExecutor(
+                    max_workers=self.notes_download_threads
+                ) as fetch:
+                    for index, (note_key, note_metadata) in enumerate(notes_to_update):
+                        window.acquire()
+                        fetch.submit(
+                            self._fetch_note,
+                            _PipelineItem(index, note_key, note_metadata),
+                            update_context,
+                            render,
+                            write_queue,
+                            write_order,
+                        )
+        finally:
+            write_queue.put(None)
+            writer.join()
         return update_context
 
-    def _update_note(
+    def _fetch_note(
         self,
-        note_key: TNoteKey,
-        note_metadata: TNoteMetadata,
+        item: "_PipelineItem",
         update_context: UpdateContext,
+        render: ThreadPoolExecutor,
+        write_queue: queue.Queue,
+        write_order: "_WriteOrder",
     ) -> None:
-        current = update_context.start()
-
-        logger.info(
-            "Getting note (%d/%d) contents: %s...",
-            current,
-            update_context.total,
-            note_key,
-        )
-
         try:
-            note = self.get_note(note_key, note_metadata)
-        except Exception as e:
-            logger.warning("Unable to get the note %s: %s", note_key, repr(e))
-            update_context.add_failed(note_key, note_metadata)
-            return
+            item.current = update_context.start()
 
-        if self.is_same_note(note, note_metadata):
             logger.info(
-                "Saving note (%d/%d) contents: %s...",
-                current,
+                "Getting note (%d/%d) contents: %s...",
+                item.current,
                 update_context.total,
-                note_key,
+                item.note_key,
             )
-            try:
-                self.working_copy.save_note(note, note_metadata)
-                update_context.add_updated(note_key, note_metadata)
-            except Exception:
+
+            # The writer might be holding the budget in the notes which
+            # wait for this one, so the next note to be written is let in
+            # regardless of the budget.
+            self.inflight_budget.wait(lambda: write_order.next_index == item.index)
+            with update_context.stages["fetch"].measure():
+                note = self.get_note(item.note_key, item.note_metadata)
+
+            if not self.is_same_note(note, item.note_metadata):
                 logger.info(
-                    "Unable to save note (%d/%d) %s",
-                    current,
+                    "Skipping note (%d/%d) because it has changed during sync: %s...",
+                    item.current,
                     update_context.total,
-                    note_key,
-                    exc_info=True,
+                    item.note_key,
                 )
-                update_context.add_failed(note_key, note_metadata)
+                update_context.set_not_converged()
+                item.is_skipped = True
+                write_queue.put(item)
                 return
+
+            size = self.get_note_size(note)
+            self.inflight_budget.acquire(size)
+            item.size = size
+            render.submit(self._render_note, item, note, update_context, write_queue)
+        except Exception as e:
+            logger.warning("Unable to get the note %s: %s", item.note_key, repr(e))
+            # The writer marks it as failed.
+            item.rendered = None
+            write_queue.put(item)
+
+    def _render_note(
+        self,
+        item: "_PipelineItem",
+        note: TNote,
+        update_context: UpdateContext,
+        write_queue: queue.Queue,
+    ) -> None:
+        try:
+            with update_context.stages["render"].measure():
+                item.rendered = self.working_copy.render_note(note, item.note_metadata)
+        except Exception:
+            logger.info(
+                "Unable to render note (%d/%d) %s",
+                item.current,
+                update_context.total,
+                item.note_key,
+                exc_info=True,
+            )
+            item.rendered = None
+        write_queue.put(item)
+
+    def _write_notes(
+        self,
+        write_queue: queue.Queue,
+        update_context: UpdateContext,
+        window: threading.BoundedSemaphore,
+        write_order: "_WriteOrder",
+    ) -> None:
+        # The items arrive in the completion order and are written in
+        # the submission order, so the result doesn't depend on the timing
+        # of the threads: e.g. the notes with the same path are resolved
+        # the same way as by a sequential sync. The items waiting for
+        # their turn hold their window slots, which bounds this buffer.
+        pending = {}  # type: Dict[int, _PipelineItem]
+        is_done = False
+        while not is_done:
+            item = write_queue.get()
+            if item is None:
+                is_done = True
+            else:
+                pending[item.index] = item
+            while pending and (is_done or write_order.next_index in pending):
+                item = pending.pop(min(pending) if is_done else write_order.next_index)
+                write_order.next_index = item.index + 1
+                try:
+                    self._write_note(item, update_context)
+                finally:
+                    self.inflight_budget.release(item.size)
+                    window.release()
+                self._maybe_checkpoint(update_context)
+
+    def _maybe_checkpoint(self, update_context: UpdateContext) -> None:
+        # Called by the writer thread only, so nothing is being written
+        # to the working copy at the moment.
+        now = time.monotonic()
+        is_due = (
+            (
+                self.checkpoint_interval_seconds
+                and now - update_context.last_checkpoint
+                >= self.checkpoint_interval_seconds
+            )
+            or (
+                self.commit_every_notes
+                and update_context.notes_since_checkpoint >= self.commit_every_notes
+            )
+            or (
+                self.commit_every_bytes
+                and update_context.bytes_since_checkpoint >= self.commit_every_bytes
+            )
+        )
+        if not is_due:
+            return
+        update_context.last_checkpoint = now
+        update_context.notes_since_checkpoint = 0
+        update_context.bytes_since_checkpoint = 0
+
+        logger.info(
+            "Committing a checkpoint of %d saved notes...",
+            len(update_context.updated_notes),
+        )
+        try:
+            self.working_copy.checkpoint()
+            self.git_transaction.checkpoint()
+            if self.checkpoint is not None and self.checkpoint.is_force_full_resync:
+                self._save_checkpoint(update_context)
+        except Exception:
+            logger.warning("Unable to commit a sync checkpoint", exc_info=True)
+
+    def _save_checkpoint(self, update_context: UpdateContext) -> None:
+        with update_context.lock:
+            updated_note_keys = [
+                note_key for note_key, _ in update_context.updated_notes
+            ]
+        self.checkpoint.saved_note_keys.update(updated_note_keys)
+        self.checkpoint.save()
+
+    def _write_note(self, item: "_PipelineItem", update_context: UpdateContext) -> None:
+        if item.is_skipped:
+            return
+        if item.rendered is None:
+            update_context.add_failed(item.note_key, item.note_metadata)
+            return
+
+        logger.info(
+            "Saving note (%d/%d) contents: %s...",
+            item.current,
+            update_context.total,
+            item.note_key,
+        )
+        if self.commit_every_bytes:
+            # Must be computed before the resources are moved.
+            size = _rendered_note_size(item.rendered)
         else:
+            size = 0
+        try:
+            with update_context.stages["write"].measure():
+                self.working_copy.write_note(item.rendered)
+            update_context.add_updated(item.note_key, item.note_metadata)
+            update_context.notes_since_checkpoint += 1
+            update_context.bytes_since_checkpoint += size
+        except Exception:
             logger.info(
-                "Skipping note (%d/%d) because it has changed during sync: %s...",
-                current,
+                "Unable to save note (%d/%d) %s",
+                item.current,
                 update_context.total,
-                note_key,
+                item.note_key,
+                exc_info=True,
             )
-            update_context.set_not_converged()
+            update_context.add_failed(item.note_key, item.note_metadata)
+
+
+class _PipelineItem:
+    def __init__(
+        self, index: int, note_key: TNoteKey, note_metadata: TNoteMetadata
+    ) -> None:
+        # The submission order.
+        self.index = index
+        self.note_key = note_key
+        self.note_metadata = note_metadata
+        self.current = 0
+        self.size = 0
+        self.rendered = None  # type: Optional[RenderedNote]
+        # The note has been changed in the service during the sync.
+        self.is_skipped = False
+
+
+class _WriteOrder:
+    def __init__(self) -> None:
+        # The index of the item which the writer is waiting for.
+        # Changed by the writer thread only.
+        self.next_index = 0
+
+
+def _rendered_note_size(rendered: RenderedNote) -> int:
+    return len(rendered.html_body) + sum(
+        resource_body_size(m.body) for m in rendered.resources if m.body is not None
+    )
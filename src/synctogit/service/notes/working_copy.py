@@ -1,17 +1,32 @@
 import abc
 import concurrent.futures
+import io
 import logging
 import os
-import shutil
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Generic, Iterable, Mapping, NamedTuple, Sequence, Tuple, TypeVar
+from typing import (
+    Container,
+    Generic,
+    Iterable,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
 import pytz
 
-from synctogit.git_transaction import GitTransaction, rmfile_silent
+from synctogit.git_factory import local_git_ignored_cache_dir
+from synctogit.git_transaction import GitTransaction
 
-from .stored_note import CorruptedNoteError
+from .headers_cache import NoteHeadersCache
+from .resources import TResourceBody, clean_staging_dir, store_resource_body
+from .shared_resources import SharedResourceStore
+from .stored_note import CorruptedNoteError, StoredNote
 from .types import TNoteKey, TNoteMetadata
 
 logger = logging.getLogger(__name__)
@@ -27,7 +42,15 @@ def _seq_to_path(parts: Sequence[str]) -> Path:
 
 class NoteResource(NamedTuple):
     filename: str
-    body: bytes
+    # None means that the resource is already stored and should be kept as is.
+    body: Optional[TResourceBody]
+
+
+class RenderedNote(NamedTuple):
+    note_key: str
+    metadata: object
+    html_body: bytes
+    resources: Sequence[NoteResource]
 
 
 # TODO: replace with a dataclass
@@ -65,17 +88,58 @@ class WorkingCopy(abc.ABC, Generic[TNoteKey, TNoteMetadata, TChangeset]):
     # This class must be thread-safe
     notes_dir_name = "Notes"
     resources_dir_name = "Resources"
+    headers_cache_file_name = "note_headers.json"
+    shared_objects_dir_name = "objects"
+    shared_refs_file_name = "objects.json"
+    staging_dir_name = "staging"
 
     changeset_cls = Changeset
 
     def __init__(
-        self, git_transaction: GitTransaction, timezone: pytz.BaseTzInfo
+        self,
+        git_transaction: GitTransaction,
+        timezone: pytz.BaseTzInfo,
+        *,
+        metadata_from_git: bool = False,
+        shared_resources: bool = False,
+        headers_cache: Optional[NoteHeadersCache] = None,
     ) -> None:
         self.git_transaction = git_transaction
         self.repo_dir = git_transaction.repo_dir
         self.notes_dir = self.repo_dir / self.notes_dir_name
         self.resources_dir = self.repo_dir / self.resources_dir_name
         self.timezone = timezone
+        # Read the notes list from the committed git tree instead of
+        # walking the filesystem. The working copy is guaranteed to match
+        # HEAD at the beginning of a transaction, because all uncommitted
+        # changes are stashed. There's nothing to walk when the files
+        # are written to the git tree directly (a bare repo or a bulk import).
+        self.metadata_from_git = metadata_from_git or git_transaction.tree is not None
+        # A cache might be passed to be reused by the subsequent syncs.
+        if headers_cache is None:
+            headers_cache = self.create_headers_cache(self.repo_dir)
+        self.headers_cache = headers_cache
+        # Large resources are downloaded to the temporary files in this dir
+        # and then moved to their final location.
+        self.staging_dir = (
+            self.repo_dir / local_git_ignored_cache_dir / self.staging_dir_name
+        )
+        # Store the resources once in a content-addressed directory shared
+        # by all notes instead of a separate directory per note.
+        self.shared_resources = shared_resources
+        self.shared_store = None  # type: Optional[SharedResourceStore]
+        if shared_resources:
+            self.shared_store = SharedResourceStore(
+                self.resources_dir / self.shared_objects_dir_name,
+                self.resources_dir / self.shared_refs_file_name,
+                tree=git_transaction.tree,
+            )
+
+    @classmethod
+    def create_headers_cache(cls, repo_dir: Path) -> NoteHeadersCache:
+        return NoteHeadersCache(
+            repo_dir / local_git_ignored_cache_dir / cls.headers_cache_file_name
+        )
 
     @classmethod
     @abc.abstractmethod
@@ -97,21 +161,46 @@ class WorkingCopy(abc.ABC, Generic[TNoteKey, TNoteMetadata, TChangeset]):
     def _is_updated_note(cls, m1: TNoteMetadata, m2: TNoteMetadata) -> bool:
         pass
 
+    @abc.abstractmethod
+    def render_note(self, note, metadata: TNoteMetadata) -> RenderedNote:
+        """Prepare a downloaded note to be written to the working copy.
+        Doesn't touch the filesystem.
+        """
+        pass
+
+    def save_note(self, note, metadata: TNoteMetadata) -> None:
+        self.write_note(self.render_note(note, metadata))
+
+    def write_note(self, rendered: RenderedNote) -> None:
+        self._save_note(
+            note_key=rendered.note_key,
+            metadata=rendered.metadata,
+            html_body=rendered.html_body,
+            resources=rendered.resources,
+        )
+
     @abc.abstractmethod
     def _get_stored_note_metadata(
-        self, notes_dir, note_path: Path
+        self, notes_dir, note_path: Path, header_vars: Mapping[str, str]
     ) -> Tuple[TNoteKey, TNoteMetadata]:
         pass
 
     @classmethod
     def get_relative_resources_url(
-        cls, note_key: TNoteKey, metadata: TNoteMetadata
+        cls,
+        note_key: TNoteKey,
+        metadata: TNoteMetadata,
+        *,
+        shared_resources: bool = False,
     ) -> str:
         """Returns a relative URL from a Note to its Resources directory.
         Intended to be used in the generated HTML pages of the notes.
         """
         ups = [".."] * (len(cls._metadata_dir(metadata)) + 1)
-        path = [cls.resources_dir_name, note_key, ""]
+        if shared_resources:
+            path = [cls.resources_dir_name, cls.shared_objects_dir_name, ""]
+        else:
+            path = [cls.resources_dir_name, note_key, ""]
         return "/".join(ups + path)
 
     @classmethod
@@ -157,26 +246,85 @@ class WorkingCopy(abc.ABC, Generic[TNoteKey, TNoteMetadata, TChangeset]):
     ):
         note_dir = self.notes_dir / _seq_to_path(self._metadata_dir(metadata))
         resources_dir = self.resources_dir / note_key
-        os.makedirs(str(note_dir), exist_ok=True)
 
         note_path = note_dir / self._metadata_file(metadata)
-        note_path.write_bytes(html_body)
+        self.git_transaction.write_bytes(note_path, html_body)
+        # The resources are written bypassing the transaction.
+        self.git_transaction.touch(resources_dir)
+
+        resources = list(resources)
+        if self.shared_store is not None:
+            self._save_shared_resources(note_key, resources)
+            # The note might have been saved before the shared resources
+            # have been enabled.
+            self.git_transaction.remove_path(resources_dir)
+            return
 
-        if resources_dir.is_dir():
-            shutil.rmtree(str(resources_dir))
+        filenames = {m.filename for m in resources}
+        for stale_filename in self._get_note_resource_filenames(note_key) - filenames:
+            self.git_transaction.remove_path(resources_dir / stale_filename)
 
         if resources:
-            os.makedirs(str(resources_dir), exist_ok=True)
+            self.git_transaction.makedirs(resources_dir)
 
             for m in resources:
                 resource_path = resources_dir / m.filename
-                resource_path.write_bytes(m.body)
+                if m.body is None:
+                    if not self.git_transaction.is_file(resource_path):
+                        raise ValueError(
+                            "Resource %s was expected to be already stored"
+                            % resource_path
+                        )
+                    continue
+                store_resource_body(
+                    resource_path, m.body, tree=self.git_transaction.tree
+                )
+        else:
+            self.git_transaction.remove_dirs_until_not_empty(resources_dir)
+
+    def _save_shared_resources(
+        self, note_key: TNoteKey, resources: Sequence[NoteResource]
+    ) -> None:
+        # The refs are set first, so the objects referred by this note
+        # are kept by the garbage collection.
+        self.shared_store.set_note_refs(note_key, (m.filename for m in resources))
+        for m in resources:
+            if m.body is None:
+                if m.filename not in self.shared_store:
+                    raise ValueError(
+                        "Resource %s was expected to be already stored"
+                        % (self.shared_store.objects_dir / m.filename)
+                    )
+                continue
+            self.shared_store.write_object(m.filename, m.body)
+            self.git_transaction.touch(self.shared_store.objects_dir / m.filename)
+
+    def get_stored_resource_filenames(self, note_key: TNoteKey) -> Container[str]:
+        """Returns the filenames of the resources which are already stored
+        and are available to the note with the `note_key` key.
+        """
+        if self.shared_store is not None:
+            return self.shared_store
+        return self._get_note_resource_filenames(note_key)
+
+    def _get_note_resource_filenames(self, note_key: TNoteKey) -> Set[str]:
+        return self.git_transaction.listdir(self.resources_dir / note_key)
 
     def get_working_copy_metadata(
         self,
         worker_threads: int = 20,
     ) -> Mapping[TNoteKey, TNoteMetadata]:
+        # Leftovers of an interrupted sync.
+        clean_staging_dir(self.staging_dir)
+
+        if self.shared_store is not None:
+            self.shared_store.load()
+
+        if self.metadata_from_git:
+            return self._get_git_tree_metadata(worker_threads)
+
         note_metadata_futures = []
+        self.headers_cache.load()
 
         with ThreadPoolExecutor(max_workers=worker_threads) as pool:
             for root, _, files in os.walk(str(self.notes_dir)):
@@ -187,15 +335,82 @@ class WorkingCopy(abc.ABC, Generic[TNoteKey, TNoteMetadata, TChangeset]):
                         continue
 
                     note_path = Path(root) / fn
+                    fut = pool.submit(self._get_cached_stored_note_metadata, note_path)
+                    note_metadata_futures.append((note_path, fut))
+
+        self._save_headers_cache()
+        return self._process_note_metadata_futures(note_metadata_futures)
+
+    def _get_git_tree_metadata(
+        self,
+        worker_threads: int,
+    ) -> Mapping[TNoteKey, TNoteMetadata]:
+        note_metadata_futures = []
+        self.headers_cache.load()
+
+        uncached = {}  # blob oid -> note paths
+        with ThreadPoolExecutor(max_workers=worker_threads) as pool:
+            for file_path, oid in self.git_transaction.list_tree_blobs(
+                self.notes_dir_name
+            ):
+                _, ext = os.path.splitext(file_path)
+                if ext != ".html":
+                    continue
+
+                note_path = self.repo_dir / file_path
+                cache_key = note_path.relative_to(self.notes_dir).as_posix()
+                header_vars = self.headers_cache.get(cache_key, oid)
+                if header_vars is None:
+                    uncached.setdefault(oid, []).append(note_path)
+                    continue
+                fut = pool.submit(
+                    self._get_stored_note_metadata,
+                    self.notes_dir,
+                    note_path,
+                    header_vars,
+                )
+                note_metadata_futures.append((note_path, fut))
+
+            # Only the blobs which haven't been seen before are read.
+            for oid, contents in self.git_transaction.read_blobs(list(uncached)):
+                for note_path in uncached[oid]:
                     fut = pool.submit(
-                        self._get_stored_note_metadata,
-                        self.notes_dir,
-                        note_path,
+                        self._get_blob_stored_note_metadata, note_path, oid, contents
                     )
                     note_metadata_futures.append((note_path, fut))
 
+        self._save_headers_cache()
         return self._process_note_metadata_futures(note_metadata_futures)
 
+    def _get_blob_stored_note_metadata(
+        self, note_path: Path, oid: str, contents: bytes
+    ) -> Tuple[TNoteKey, TNoteMetadata]:
+        header_vars = StoredNote._parse_note_header_stream(
+            io.BytesIO(contents), note_path
+        )
+        cache_key = note_path.relative_to(self.notes_dir).as_posix()
+        self.headers_cache.set(cache_key, oid, header_vars)
+        return self._get_stored_note_metadata(self.notes_dir, note_path, header_vars)
+
+    def _save_headers_cache(self) -> None:
+        try:
+            self.headers_cache.save()
+        except OSError as e:
+            logger.warning("Unable to save the note headers cache: %r", e)
+
+    def _get_cached_stored_note_metadata(
+        self, note_path: Path
+    ) -> Tuple[TNoteKey, TNoteMetadata]:
+        st = note_path.stat()
+        fingerprint = [st.st_mtime_ns, st.st_size, st.st_ino]
+        cache_key = note_path.relative_to(self.notes_dir).as_posix()
+
+        header_vars = self.headers_cache.get(cache_key, fingerprint)
+        if header_vars is None:
+            header_vars = StoredNote._parse_note_header(note_path)
+            self.headers_cache.set(cache_key, fingerprint, header_vars)
+        return self._get_stored_note_metadata(self.notes_dir, note_path, header_vars)
+
     def _process_note_metadata_futures(
         self,
         note_metadata_futures: Sequence[concurrent.futures.Future],
@@ -240,19 +455,59 @@ class WorkingCopy(abc.ABC, Generic[TNoteKey, TNoteMetadata, TChangeset]):
         self,
         metadata: Mapping[TNoteKey, TNoteMetadata],
     ) -> None:
-        try:
-            root, dirs, _ = next(os.walk(str(self.resources_dir)))
-        except StopIteration:
-            # Resources dir doesn't exist -- no resources to delete, great.
-            return
-
-        for note_key in dirs:
+        # A missing Resources dir means no resources to delete, great.
+        for note_key in sorted(self.git_transaction.listdir(self.resources_dir)):
+            if note_key == self.shared_objects_dir_name:
+                continue
+            resources_dir = self.resources_dir / note_key
+            if not self.git_transaction.is_dir(resources_dir):
+                continue
             if note_key not in metadata:
                 logger.warning(
                     "Resources for a non-existing note %s are going to be removed.",
                     note_key,
                 )
-                shutil.rmtree(os.path.join(root, note_key))
+                self.git_transaction.remove_path(resources_dir)
+
+        if self.shared_store is not None:
+            for note_key in self.shared_store.retain_notes(metadata.keys()):
+                logger.warning(
+                    "Shared resources refs of a non-existing note %s "
+                    "are going to be removed.",
+                    note_key,
+                )
+
+    def checkpoint(self) -> None:
+        """Should be called before the notes saved so far are committed
+        in the middle of a transaction.
+        """
+        if self.shared_store is not None:
+            # The refs must be committed along with the objects,
+            # otherwise the objects would be collected as garbage.
+            self.shared_store.save()
+            self.git_transaction.touch(self.shared_store.refs_path)
+
+    def finalize(
+        self, note_keys: Iterable[TNoteKey], *, is_refs_rebuilt: bool = False
+    ) -> None:
+        """Should be called after all the changes have been applied.
+
+        `note_keys` are the keys of all notes which should exist
+        in the working copy. `is_refs_rebuilt` means that all of these
+        notes have been saved during this transaction.
+        """
+        # Resources of the notes which have failed to be saved.
+        clean_staging_dir(self.staging_dir)
+
+        if self.shared_store is None:
+            return
+        if is_refs_rebuilt:
+            self.shared_store.mark_refs_complete()
+        self.shared_store.retain_notes(note_keys)
+        for filename in self.shared_store.collect_garbage():
+            self.git_transaction.touch(self.shared_store.objects_dir / filename)
+        self.shared_store.save()
+        self.git_transaction.touch(self.shared_store.refs_path)
 
     def delete_notes(self, notes: Iterable[TNoteMetadata]) -> None:
         for note in notes:
@@ -261,7 +516,7 @@ class WorkingCopy(abc.ABC, Generic[TNoteKey, TNoteMetadata, TChangeset]):
             self._delete_note(note_path)
 
     def _delete_note(self, note_path: Path) -> None:
-        rmfile_silent(note_path)
+        self.git_transaction.remove_path(note_path)
         note_dir = note_path.parents[0]
         # XXX Remove note's resources
         self.git_transaction.remove_dirs_until_not_empty(note_dir)
@@ -0,0 +1,116 @@
+import contextlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """A token bucket limiting the rate of requests to a service.
+
+    A single limiter is shared by all the clients and threads of
+    an account (see `BaseSync.rate_limiter`), because the services
+    throttle each user separately. The rate is adjusted with AIMD:
+    it is increased by `increase_step` requests per second after each
+    successful request and is halved once per throttling episode.
+
+    When a request is throttled, the thread which has received
+    the rate limit error pauses all the callers of `acquire` until
+    it is done waiting (see `paused`), so the other threads don't keep
+    on hammering the service while it is throttling.
+    """
+
+    # Must be threadsafe
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        max_rate: float = 100.0,
+        min_rate: float = 0.1,
+        increase_step: float = 0.1,
+        decrease_factor: float = 0.5
+    ) -> None:
+        self.name = name
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self._cond = threading.Condition()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the learned rate and any pending throttling."""
+        with self._cond:
+            self._rate = self.max_rate
+            self._tokens = self.max_rate
+            self._updated_at = time.monotonic()
+            self._pauses = 0
+            self._paused_until = 0.0
+            self._cond.notify_all()
+
+    @property
+    def rate(self) -> float:
+        with self._cond:
+            return self._rate
+
+    def acquire(self) -> None:
+        """Block until a request is allowed to be sent."""
+        with self._cond:
+            while True:
+                delay = self._try_acquire()
+                if delay <= 0:
+                    return
+                self._cond.wait(delay)
+
+    def try_acquire(self) -> float:
+        """Take a token without blocking. Returns 0 on success, otherwise
+        the number of seconds to wait before trying again.
+        """
+        with self._cond:
+            return self._try_acquire()
+
+    def on_success(self) -> None:
+        with self._cond:
+            self._rate = min(self.max_rate, self._rate + self.increase_step)
+
+    @contextlib.contextmanager
+    def paused(self, seconds: float):
+        """Pause all the callers of `acquire` for the duration of the block,
+        which is expected to last for about `seconds`.
+        """
+        with self._cond:
+            if not self._pauses:
+                # Simultaneously throttled requests decrease the rate once.
+                self._rate = max(self.min_rate, self._rate * self.decrease_factor)
+                logger.info(
+                    "Decreasing %s requests rate to %.2f per second",
+                    self.name,
+                    self._rate,
+                )
+            self._pauses += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._pauses -= 1
+                if not self._pauses:
+                    self._paused_until = 0.0
+                self._cond.notify_all()
+
+    def _try_acquire(self) -> float:
+        now = time.monotonic()
+        if self._pauses and self._paused_until > now:
+            return self._paused_until - now
+
+        capacity = max(1.0, self._rate)
+        self._tokens = min(
+            capacity, self._tokens + (now - self._updated_at) * self._rate
+        )
+        self._updated_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self._rate
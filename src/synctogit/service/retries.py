@@ -1,8 +1,13 @@
+import contextlib
+import functools
 import logging
+from asyncio import sleep as asyncio_sleep
 from functools import wraps
 from time import sleep
+from typing import Any, Callable, Optional, Union
 
 from .exc import ServiceRateLimitError, ServiceUnavailableError
+from .rate_limiter import RateLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -10,20 +15,43 @@ _RETRIES_RATELIMITED = 10
 _RETRIES_UNAVAILABLE = 3
 _DELAY_UNAVAILABLE_SECONDS = 5
 
+# Either a limiter, or a function returning the limiter of the decorated
+# method's `self` (e.g. `operator.attrgetter("rate_limiter")`).
+TLimiter = Union[RateLimiter, Callable[[Any], RateLimiter], None]
+
+
+def retry_ratelimited(f=None, *, limiter: TLimiter = None):
+    """Retry the calls of `f` which have failed with `ServiceRateLimitError`.
+
+    When the `limiter` is passed, each call waits for the limiter,
+    and a rate limit error pauses all of the limiter's callers for
+    the time this call is waiting to retry.
+    """
+    if f is None:
+        return functools.partial(retry_ratelimited, limiter=limiter)
 
-def retry_ratelimited(f):
     # XXX make it configurable
     @wraps(f)
     def f_with_retries(*args, **kwargs):
+        rate_limiter = _get_limiter(limiter, args)
         for i in range(_RETRIES_RATELIMITED, 0, -1):
+            # A retry right after the pause is not delayed: it is the one
+            # probing whether the service is available again.
+            if rate_limiter is not None and i == _RETRIES_RATELIMITED:
+                rate_limiter.acquire()
             try:
-                return f(*args, **kwargs)
+                res = f(*args, **kwargs)
             except ServiceRateLimitError as e:
                 if i <= 1:
                     raise
                 s = e.rate_limit_duration_seconds
                 logger.warning("Rate limit reached. Waiting %d seconds..." % s)
-                sleep(s)
+                with _paused(rate_limiter, s):
+                    sleep(s)
+            else:
+                if rate_limiter is not None:
+                    rate_limiter.on_success()
+                return res
         raise RuntimeError("Should not have been reached")
 
     return f_with_retries
@@ -47,3 +75,68 @@ def retry_unavailable(f):
         raise RuntimeError("Should not have been reached")
 
     return f_with_retries
+
+
+def async_retry_ratelimited(f=None, *, limiter: TLimiter = None):
+    """The same as `retry_ratelimited`, but for coroutine functions."""
+    if f is None:
+        return functools.partial(async_retry_ratelimited, limiter=limiter)
+
+    @wraps(f)
+    async def f_with_retries(*args, **kwargs):
+        rate_limiter = _get_limiter(limiter, args)
+        for i in range(_RETRIES_RATELIMITED, 0, -1):
+            if rate_limiter is not None and i == _RETRIES_RATELIMITED:
+                delay = rate_limiter.try_acquire()
+                while delay > 0:
+                    await asyncio_sleep(delay)
+                    delay = rate_limiter.try_acquire()
+            try:
+                res = await f(*args, **kwargs)
+            except ServiceRateLimitError as e:
+                if i <= 1:
+                    raise
+                s = e.rate_limit_duration_seconds
+                logger.warning("Rate limit reached. Waiting %d seconds..." % s)
+                with _paused(rate_limiter, s):
+                    await asyncio_sleep(s)
+            else:
+                if rate_limiter is not None:
+                    rate_limiter.on_success()
+                return res
+        raise RuntimeError("Should not have been reached")
+
+    return f_with_retries
+
+
+def async_retry_unavailable(f):
+    """The same as `retry_unavailable`, but for coroutine functions."""
+
+    @wraps(f)
+    async def f_with_retries(*args, **kwargs):
+        for i in range(_RETRIES_UNAVAILABLE, 0, -1):
+            try:
+                return await f(*args, **kwargs)
+            except ServiceUnavailableError as e:
+                if i <= 1:
+                    raise
+                s = _DELAY_UNAVAILABLE_SECONDS
+                logger.warning(
+                    "Service unavailable: %s. Waiting %d seconds..." % (e, s)
+                )
+                await asyncio_sleep(s)
+        raise RuntimeError("Should not have been reached")
+
+    return f_with_retries
+
+
+def _get_limiter(limiter: TLimiter, args) -> Optional[RateLimiter]:
+    if limiter is None or isinstance(limiter, RateLimiter):
+        return limiter
+    return limiter(args[0])
+
+
+def _paused(limiter: Optional[RateLimiter], seconds: float):
+    if limiter is None:
+        return contextlib.nullcontext()
+    return limiter.paused(seconds)
@@ -0,0 +1,153 @@
+import logging
+from typing import Optional
+
+from . import evernote, git_config, onenote, todoist
+from .config import Config
+from .git_factory import git_factory
+from .git_pusher import GitPusher
+from .service import (
+    BaseAuthSession,
+    BaseSync,
+    InvalidAuthSession,
+    ServiceImplementation,
+    ServiceTokenExpiredError,
+    UserCancelledError,
+)
+
+logger = logging.getLogger(__name__)
+
+services = {
+    "evernote": evernote,
+    "onenote": onenote,
+    "todoist": todoist,
+}
+
+
+class Syncer:
+    """Runs the syncs of a service to a repo.
+
+    The `Sync` instance is kept between the syncs of a daemon along
+    with its clients and caches, until the auth session expires.
+    """
+
+    def __init__(
+        self,
+        service_implementation: ServiceImplementation,
+        *,
+        git,
+        config: Config,
+        batch: bool,
+        force_update: bool,
+        bulk_import: bool = False,
+        pusher: Optional[GitPusher] = None
+    ) -> None:
+        self.service_implementation = service_implementation
+        self.git = git
+        self.config = config
+        self.batch = batch
+        self.force_update = force_update
+        self.bulk_import = bulk_import
+        self.pusher = pusher
+        self._sync = None  # type: Optional[BaseSync]
+
+    @classmethod
+    def create(
+        cls,
+        service: str,
+        config: Config,
+        *,
+        batch: bool,
+        force_update: bool,
+        bulk_import: bool = False
+    ) -> "Syncer":
+        """Open (or init) the repo of the `config` and start its pusher."""
+        service_implementation = services[service].get_service_implementation()
+
+        git = git_factory(
+            repo_dir=git_config.git_repo_dir.get(config),
+            branch=git_config.git_branch.get(config),
+            remote_name=git_config.git_remote_name.get(config),
+            remote=git_config.git_remote.get(config),
+            bare=git_config.git_bare.get(config),
+            fast_status=git_config.git_fast_status.get(config),
+        )
+
+        pusher = None
+        if git_config.git_push.get(config) and git_config.git_background_push.get(
+            config
+        ):
+            pusher = GitPusher(git, remote_name=git_config.git_remote_name.get(config))
+            pusher.start()
+
+        return cls(
+            service_implementation,
+            git=git,
+            config=config,
+            batch=batch,
+            force_update=force_update,
+            bulk_import=bulk_import,
+            pusher=pusher,
+        )
+
+    def sync(self) -> None:
+        while True:
+            if self._sync is None:
+                session = self._load_session()
+                if session is None:
+                    return
+                logger.info("Authenticating...")
+                self._sync = self.service_implementation.sync(
+                    config=self.config,
+                    auth_session=session,
+                    git=self.git,
+                    force_full_resync=self.force_update,
+                    bulk_import=self.bulk_import,
+                    pusher=self.pusher,
+                )
+
+            try:
+                self._sync.run_sync()
+            except ServiceTokenExpiredError:
+                logger.warning("Auth token expired.")
+                self._sync.auth_session.remove_session_from_config(self.config)
+                self._close_sync()
+                continue
+
+            # The forced resync and the bulk import are done once.
+            self.force_update = False
+            self.bulk_import = False
+            self._sync.force_full_resync = False
+            self._sync.bulk_import = False
+            return
+
+    def close(self) -> bool:
+        """Release the clients and flush the pusher.
+
+        Returns False if some commits couldn't be pushed.
+        """
+        self._close_sync()
+        return self.pusher is None or self.pusher.close()
+
+    def _close_sync(self) -> None:
+        sync, self._sync = self._sync, None
+        if sync is not None:
+            sync.close()
+
+    def _load_session(self) -> Optional[BaseAuthSession]:
+        AuthSession = self.service_implementation.auth_session
+        Auth = self.service_implementation.auth
+
+        try:
+            return AuthSession.load_from_config(self.config)
+        except InvalidAuthSession as e:
+            logger.info("Invalid auth session: %s", str(e))
+            if self.batch:
+                raise Exception("Unable to proceed due to running batch mode.", e)
+
+        try:
+            session = Auth.interactive_auth(self.config)
+        except UserCancelledError as e:
+            logger.info(str(e))
+            return None
+        session.save_to_config(self.config)
+        return session
@@ -21,6 +21,12 @@ class SyncTokenExpiredError(SyncError):
     pass
 
 
+class SyncRateLimitError(SyncError):
+    def __init__(self, *args, retry_after):
+        super().__init__(*args)
+        self.retry_after = retry_after
+
+
 class TodoistAPI:
     def __init__(self, token, cache):
         self.token = token
@@ -65,11 +71,26 @@ class TodoistAPI:
 
         kwargs.setdefault("headers", {})["Authorization"] = f"Bearer {self.token}"
         response = self.session.post(url + call, **kwargs)
+        if response.status_code == 429:
+            raise SyncRateLimitError(
+                response.text, retry_after=self._get_retry_after(response)
+            )
         try:
             return response.json()
         except ValueError as e:
             raise SyncError(response.text) from e
 
+    def _get_retry_after(self, response):
+        # {"error_extra": {"retry_after": 5}, ...}
+        try:
+            return int(response.json()["error_extra"]["retry_after"])
+        except Exception:
+            pass
+        try:
+            return int(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return 60
+
 
 class Cache:
     def __init__(self, base, name):
@@ -1,11 +1,10 @@
 import logging
 import os
 from pathlib import Path
+from typing import Optional
 
 from synctogit.config import Config, StrConfigItem
-from synctogit.git_config import git_push, git_remote_name
-from synctogit.git_factory import gitignore_synctogit_files_prefix
-from synctogit.git_transaction import GitTransaction
+from synctogit.git_factory import gitignore_synctogit_files_prefix, local_repo_dir
 from synctogit.service import BaseAuth, BaseAuthSession, BaseSync, InvalidAuthSession
 from synctogit.timezone import get_timezone
 
@@ -57,22 +56,31 @@ class TodoistAuth(BaseAuth[TodoistAuthSession]):
 
 
 class TodoistSync(BaseSync[TodoistAuthSession]):
+    rate_limiter_name = "todoist"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # Reused by the subsequent syncs.
+        self._todoist = None  # type: Optional[Todoist]
+
     def run_sync(self) -> None:
         logger.info("Starting sync...")
 
-        cache_dir = "%s.todoist" % gitignore_synctogit_files_prefix
-        cache_path = Path(self.git.working_tree_dir) / cache_dir
-        os.makedirs(str(cache_path), exist_ok=True)
+        if self._todoist is None:
+            cache_dir = "%s.todoist" % gitignore_synctogit_files_prefix
+            cache_path = Path(local_repo_dir(self.git)) / cache_dir
+            os.makedirs(str(cache_path), exist_ok=True)
 
-        todoist = Todoist(str(cache_path), self.auth_session.token)
+            self._todoist = Todoist(
+                str(cache_path),
+                self.auth_session.token,
+                rate_limiter=self.rate_limiter,
+            )
+        todoist = self._todoist
 
         # XXX respect force_update (delete cache)
 
-        with GitTransaction(
-            self.git,
-            remote_name=git_remote_name.get(self.config),
-            push=git_push.get(self.config),
-        ) as t:
+        with self.git_transaction() as t:
             todoist.sync()
 
             pr = ProjectsRenderer(
@@ -1,4 +1,5 @@
 import datetime
+import operator
 import os
 from collections import defaultdict
 from logging import getLogger
@@ -9,29 +10,51 @@ import pytz
 from cached_property import cached_property
 
 import synctogit.todoist.client as todoist
-from synctogit.service import ServiceAPIError, ServiceTokenExpiredError
+from synctogit.service import (
+    RateLimiter,
+    ServiceAPIError,
+    ServiceRateLimitError,
+    ServiceTokenExpiredError,
+    retry_ratelimited,
+)
 
 from . import models
 
 logger = getLogger(__name__)
 
+# The requests quota is per account, so each client has its own limiter.
+_rate_limiter = operator.attrgetter("rate_limiter")
+
 
 class Todoist:
-    def __init__(self, cache_dir: str, auth_token: str) -> None:
+    def __init__(
+        self,
+        cache_dir: str,
+        auth_token: str,
+        rate_limiter: Optional[RateLimiter] = None,
+    ) -> None:
         cache_dir = cache_dir.rstrip(os.sep) + os.sep
         self.api = self._create_api(cache_dir, auth_token)
+        self.rate_limiter = rate_limiter or RateLimiter("todoist")
 
     def _create_api(self, cache_dir, auth_token):
         assert auth_token
         return todoist.TodoistAPI(cache=cache_dir, token=auth_token)
 
+    @retry_ratelimited(limiter=_rate_limiter)
     def sync(self):
         try:
             self.api.sync()
         except todoist.SyncTokenExpiredError as e:
             raise ServiceTokenExpiredError(str(e)) from e
+        except todoist.SyncRateLimitError as e:
+            raise ServiceRateLimitError(
+                str(e), rate_limit_duration_seconds=e.retry_after
+            ) from e
         except todoist.SyncError as e:
             raise ServiceAPIError(str(e)) from e
+        # The user settings might have been changed since the previous sync.
+        self.__dict__.pop("_timezone", None)
 
     def get_projects(self) -> Sequence[models.TodoistProject]:
         def key(p):
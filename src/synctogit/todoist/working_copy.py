@@ -3,7 +3,7 @@ import os
 from typing import Mapping, NamedTuple, Optional, Sequence, Tuple
 
 from synctogit.filename_sanitizer import normalize_filename
-from synctogit.git_transaction import GitTransaction, rmfile_silent
+from synctogit.git_transaction import GitTransaction
 
 from .models import TodoistProject, TodoistProjectId
 from .projects_renderer import ProjectsRenderer
@@ -41,23 +41,22 @@ class TodoistWorkingCopy:
 
     def _read_working_tree_projects(self) -> Mapping[str, bytes]:
         working_tree_projects = {}
-        for root, _, files in os.walk(str(self.projects_dir)):
-            for fn in files:
-                project_path = self.projects_dir / fn
-                _, ext = os.path.splitext(fn)
-                if ext != ".html":
-                    logger.warning(
-                        "Removing an extraneous file in the Projects directory: %s", fn
-                    )
-                    rmfile_silent(project_path)
-                    continue
-                working_tree_projects[fn] = project_path.read_bytes()
+        for fn in sorted(self.git_transaction.listdir(self.projects_dir)):
+            project_path = self.projects_dir / fn
+            _, ext = os.path.splitext(fn)
+            if ext != ".html" or not self.git_transaction.is_file(project_path):
+                logger.warning(
+                    "Removing an extraneous file in the Projects directory: %s", fn
+                )
+                self.git_transaction.remove_path(project_path)
+                continue
+            working_tree_projects[fn] = self.git_transaction.read_bytes(project_path)
         return working_tree_projects
 
     def _read_working_tree_index(self) -> Optional[bytes]:
         index_path = self.repo_dir / "index.html"
-        if index_path.is_file():
-            return index_path.read_bytes()
+        if self.git_transaction.is_file(index_path):
+            return self.git_transaction.read_bytes(index_path)
         return None
 
     def _render_actual_projects(self) -> Mapping[str, Tuple[bytes, TodoistProject]]:
@@ -100,10 +99,10 @@ class TodoistWorkingCopy:
         return changeset
 
     def apply_changes(self, changeset: "Changeset") -> None:
-        os.makedirs(str(self.projects_dir), exist_ok=True)
+        self.git_transaction.makedirs(self.projects_dir)
 
         for fn in changeset.delete:
-            rmfile_silent(self.projects_dir / fn)
+            self.git_transaction.remove_path(self.projects_dir / fn)
 
         for op in ("new", "update"):
             id_to_project = getattr(changeset, op)
@@ -111,11 +110,12 @@ class TodoistWorkingCopy:
                 fn = self._project_filename(project)
                 project_path = self.projects_dir / fn
                 html = self.projects_renderer.render_project(project.id)
-                project_path.write_bytes(html)
+                self.git_transaction.write_bytes(project_path, html)
 
         if changeset.index:
             html = self.projects_renderer.render_index()
-            (self.repo_dir / "index.html").write_bytes(html)
+            index_path = self.repo_dir / "index.html"
+            self.git_transaction.write_bytes(index_path, html)
 
 
 class Changeset(NamedTuple):
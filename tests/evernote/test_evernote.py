@@ -1,5 +1,6 @@
 import os
 from datetime import datetime
+from pathlib import Path
 from unittest.mock import Mock
 from uuid import uuid4
 
@@ -7,7 +8,7 @@ import pytest
 import pytz
 import vcr
 from evernote.api.client import EvernoteClient
-from evernote.edam.notestore.ttypes import NoteMetadata
+from evernote.edam.notestore.ttypes import NoteMetadata, SyncChunk, SyncState
 from evernote.edam.type.ttypes import (
     Accounting,
     Data,
@@ -22,6 +23,7 @@ from evernote.edam.type.ttypes import (
 
 from synctogit.evernote import models
 from synctogit.evernote.evernote import Evernote
+from synctogit.evernote.metadata_snapshot import MetadataSnapshot
 
 vcr_dtd = vcr.VCR(cassette_library_dir=os.path.dirname(__file__))
 
@@ -410,3 +412,105 @@ def test_map_to_note_with_resources(evernote, evernote_user_timezone):
 
     got_note = evernote._map_to_note(note, resources_base)
     assert got_note == expected_note
+
+
+def test_incremental_metadata(evernote, temp_dir):
+    snapshot_path = Path(temp_dir) / "snapshot.json"
+    evernote.metadata_snapshot = MetadataSnapshot(snapshot_path)
+    note_store = evernote.client.get_note_store()
+
+    notebook = Notebook(guid="nb1", name="Eleven", updateSequenceNum=1, stack=None)
+    note1 = Note(
+        guid="n1",
+        title="Haircut",
+        notebookGuid="nb1",
+        updateSequenceNum=2,
+        created=1538162492000,
+        updated=1538163219000,
+        active=True,
+    )
+    note2 = Note(**{**note1.__dict__, "guid": "n2", "updateSequenceNum": 3})
+
+    # Initial sync: chunks from the very beginning.
+    note_store.getSyncState.return_value = SyncState(
+        currentTime=1, fullSyncBefore=0, updateCount=3
+    )
+    note_store.getFilteredSyncChunk.side_effect = [
+        SyncChunk(
+            currentTime=1,
+            chunkHighUSN=2,
+            updateCount=3,
+            notes=[note1],
+            notebooks=[notebook],
+        ),
+        SyncChunk(currentTime=1, chunkHighUSN=3, updateCount=3, notes=[note2]),
+    ]
+    metadata = evernote.get_actual_metadata()
+    assert list(metadata.keys()) == ["n2", "n1"]
+    assert note_store.getFilteredSyncChunk.call_count == 2
+    assert note_store.getFilteredSyncChunk.call_args_list[1][0][0] == 2
+
+    # Nothing has changed: a single call.
+    evernote.metadata_snapshot = MetadataSnapshot(snapshot_path)
+    evernote.metadata_snapshot.load()
+    assert evernote.get_actual_metadata() == metadata
+    assert note_store.getSyncState.call_count == 2
+    assert note_store.getFilteredSyncChunk.call_count == 2
+
+    # n1 is moved to the trash, n2 is expunged.
+    note_store.getSyncState.return_value = SyncState(
+        currentTime=2, fullSyncBefore=0, updateCount=5
+    )
+    note_store.getFilteredSyncChunk.side_effect = [
+        SyncChunk(
+            currentTime=2,
+            chunkHighUSN=5,
+            updateCount=5,
+            notes=[Note(**{**note1.__dict__, "active": False})],
+            expungedNotes=["n2"],
+        ),
+    ]
+    assert evernote.get_actual_metadata() == {}
+    assert note_store.getFilteredSyncChunk.call_args[0][0] == 3
+
+
+@vcr_dtd.use_cassette("cassette_dtd")
+def test_get_note_skips_stored_resources(evernote, temp_dir):
+    note_store = evernote.client.get_note_store()
+
+    def resource(body_hash):
+        return Resource(
+            guid="r-%s" % body_hash.hex(),
+            mime="image/png",
+            data=Data(bodyHash=body_hash, size=4, body=None),
+        )
+
+    note_store.getNote.return_value = Note(
+        guid="n1",
+        title="Haircut",
+        content=(
+            '<!DOCTYPE en-note SYSTEM "http://xml.evernote.com/pub/enml2.dtd">'
+            "<en-note><div>1</div></en-note>"
+        ),
+        updateSequenceNum=2,
+        created=1538162492000,
+        updated=1538163219000,
+        resources=[resource(b"\xaa\xaa"), resource(b"\xbb\xbb")],
+    )
+    note_store.getResourceData.return_value = b"body"
+
+    note = evernote.get_note("n1", "../Resources/n1/", stored_resources={"aaaa.png"})
+
+    assert note_store.getNote.call_args[0][2] is False  # withResourcesData
+    assert note_store.getResourceData.call_count == 1
+    assert note_store.getResourceData.call_args[0][0] == "r-bbbb"
+    assert note.resources["aaaa"].body is None
+    assert note.resources["bbbb"].body == b"body"
+
+    staging_dir = Path(temp_dir) / "staging"
+    note = evernote.get_note(
+        "n1", "../Resources/n1/", stored_resources={"aaaa.png"}, staging_dir=staging_dir
+    )
+    assert note.resources["aaaa"].body is None
+    assert note.resources["bbbb"].body.parent == staging_dir
+    assert note.resources["bbbb"].body.read_bytes() == b"body"
@@ -0,0 +1,163 @@
+import json
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from synctogit.service import ServiceAPIError
+
+httpx = pytest.importorskip("httpx")
+
+from synctogit.onenote.async_client import AsyncOauthClient  # noqa: E402
+from synctogit.onenote.client import OneNoteAPI  # noqa: E402
+
+
+def make_client(handler, token=None):
+    return AsyncOauthClient(
+        client_id="id",
+        client_secret="secret",
+        token=token or {"access_token": "a1", "refresh_token": "r1"},
+        max_concurrency=2,
+        transport=httpx.MockTransport(handler),
+    )
+
+
+def test_get_refreshes_token_once():
+    requests_log = []
+
+    def handler(request):
+        requests_log.append((request.url.path, request.headers.get("authorization")))
+        if request.url.path.endswith("/token"):
+            return httpx.Response(200, json={"access_token": "a2", "expires_in": 3600})
+        if request.headers["authorization"] == "Bearer a1":
+            return httpx.Response(401)
+        return httpx.Response(200, json={"value": []})
+
+    client = make_client(handler)
+    try:
+        assert client.get("https://example.org/pages", params={"a": 1}).json() == {
+            "value": []
+        }
+        assert client.get_token()["access_token"] == "a2"
+        assert client.get_token()["refresh_token"] == "r1"
+        assert client.get_token()["expires_at"] > time.time()
+    finally:
+        client.close()
+
+    assert [path for path, _ in requests_log] == [
+        "/pages",
+        "/common/oauth2/v2.0/token",
+        "/pages",
+    ]
+
+
+def test_get_bodies(temp_dir):
+    def handler(request):
+        return httpx.Response(200, content=request.url.path.encode() * 3)
+
+    client = make_client(handler)
+    try:
+        urls = ["https://example.org/r%d" % i for i in range(5)]
+        assert client.get_bodies(urls, None) == [
+            ("/r%d" % i).encode() * 3 for i in range(5)
+        ]
+
+        staging_dir = Path(temp_dir) / "staging"
+        paths = client.get_bodies(urls, staging_dir)
+        assert [p.read_bytes() for p in paths] == [
+            ("/r%d" % i).encode() * 3 for i in range(5)
+        ]
+        assert all(p.parent == staging_dir for p in paths)
+    finally:
+        client.close()
+
+
+def test_get_to_file_broken_stream_is_retried(temp_dir):
+    class BrokenStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield b"aaa"
+            raise httpx.ReadError("Connection broken")
+
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            return httpx.Response(200, stream=BrokenStream())
+        return httpx.Response(200, content=b"aaabbb")
+
+    async def sleep(s):
+        pass
+
+    staging_dir = Path(temp_dir) / "staging"
+    client = make_client(handler)
+    try:
+        with patch("synctogit.service.retries.asyncio_sleep", sleep):
+            path = client.get_to_file("https://example.org/r", staging_dir)
+    finally:
+        client.close()
+
+    assert path.read_bytes() == b"aaabbb"
+    assert len(attempts) == 2
+    assert list(staging_dir.iterdir()) == [path]
+
+
+def test_ratelimit_retries_norecover():
+    sleeps = []
+
+    async def sleep(s):
+        sleeps.append(s)
+
+    def handler(request):
+        return httpx.Response(429)
+
+    client = make_client(handler)
+    try:
+        with patch("synctogit.service.retries.asyncio_sleep", sleep):
+            with pytest.raises(ServiceAPIError):
+                client.get("https://example.org/pages")
+    finally:
+        client.close()
+    assert len(sleeps) == 9
+
+
+def test_batch_requests():
+    batches = []
+
+    def handler(request):
+        assert request.url.path == "/v1.0/$batch"
+        batch = json.loads(request.content)["requests"]
+        batches.append(batch)
+        if len(batches) == 1:
+            # Throttled
+            return httpx.Response(
+                200,
+                json={
+                    "responses": [
+                        {"id": r["id"], "status": 429, "headers": {"Retry-After": "1"}}
+                        for r in batch
+                    ]
+                },
+            )
+        return httpx.Response(
+            200,
+            json={
+                "responses": [
+                    {"id": r["id"], "status": 200, "body": {"value": [r["url"]]}}
+                    for r in batch
+                ]
+            },
+        )
+
+    client = make_client(handler)
+    try:
+        with patch("synctogit.service.retries.sleep"):
+            pages = OneNoteAPI(client).get_pages_of_sections(["s1"])
+    finally:
+        client.close()
+
+    assert list(pages) == ["s1"]
+    assert pages["s1"][0].startswith("/me/onenote/sections/s1/pages")
+    # The throttled batch is retried once, by the batch itself.
+    assert len(batches) == 2
@@ -1,3 +1,4 @@
+from pathlib import Path
 from unittest.mock import MagicMock, call, patch, sentinel
 
 import pytest
@@ -169,3 +170,145 @@ def test_onenote_api_notebooks():
     ]
     client.get.reset_mock()
     assert [sentinel.nb1, sentinel.nb2] == list(api.get_notebooks())
+
+
+@patch.object(OauthClient, "_get_client")
+def test_oauth_client_get_to_file(mock_get_client, temp_dir):
+    client = MagicMock()
+    response = MagicMock()
+    response.iter_content.return_value = iter([b"aaa", b"bbb"])
+    client.get.return_value = response
+    mock_get_client.return_value = client
+
+    oauth_client = OauthClient(client_id="", client_secret="", token={})
+    path = oauth_client.get_to_file(sentinel.url, Path(temp_dir) / "staging")
+
+    assert client.get.call_args == call(sentinel.url, stream=True)
+    assert path.read_bytes() == b"aaabbb"
+    assert response.close.call_count == 1
+
+
+@patch.object(OauthClient, "_get_client")
+def test_oauth_client_get_to_file_broken_stream_is_retried(mock_get_client, temp_dir):
+    def iter_broken(chunk_size):
+        yield b"aaa"
+        raise requests.exceptions.ChunkedEncodingError("Connection broken")
+
+    broken = MagicMock()
+    broken.iter_content.side_effect = iter_broken
+    response = MagicMock()
+    response.iter_content.return_value = iter([b"aaa", b"bbb"])
+    client = MagicMock()
+    client.get.side_effect = [broken, response]
+    mock_get_client.return_value = client
+
+    staging_dir = Path(temp_dir) / "staging"
+    oauth_client = OauthClient(client_id="", client_secret="", token={})
+    with patch("synctogit.service.retries.sleep") as mock_sleep:
+        path = oauth_client.get_to_file(sentinel.url, staging_dir)
+
+    assert path.read_bytes() == b"aaabbb"
+    assert mock_sleep.call_count == 1
+    # The partially downloaded file has been removed.
+    assert [p.name for p in staging_dir.iterdir()] == [path.name]
+    assert broken.close.call_count == 1
+
+
+def test_onenote_api_batch_get():
+    client = OauthClient(client_id="", client_secret="", token={})
+    client.request_once = MagicMock()
+    api = OneNoteAPI(client=client)
+    base = "https://graph.microsoft.com/v1.0/me/onenote"
+    urls = [base + "/sections/%s/pages" % i for i in range(22)]
+
+    def batch_response(*responses):
+        r = MagicMock()
+        r.json.return_value = {"responses": list(responses)}
+        return r
+
+    def ok(i):
+        return {"id": str(i), "status": 200, "body": {"value": [i]}}
+
+    client.request_once.side_effect = [
+        batch_response(
+            *[ok(i) for i in range(20) if i != 3],
+            {"id": "3", "status": 429, "headers": {"Retry-After": "10"}},
+        ),
+        batch_response(ok(3)),
+        batch_response(
+            {"id": "21", "status": 404, "body": {"error": {"code": "20102"}}},
+            ok(20),
+        ),
+    ]
+    with patch("synctogit.service.retries.sleep") as mock_sleep:
+        responses = api.batch_get(urls)
+
+    assert [r.json()["value"] for r in responses[:21]] == [[i] for i in range(21)]
+    assert responses[21].status_code == 404
+    with pytest.raises(ServiceAPIError):
+        with client.translate_exceptions():
+            responses[21].raise_for_status()
+
+    assert mock_sleep.call_args_list == [call(20)]
+    assert client.request_once.call_count == 3
+    assert {c[0][0] for c in client.request_once.call_args_list} == {"post"}
+    requests_1, requests_2, requests_3 = (
+        c[1]["json"]["requests"] for c in client.request_once.call_args_list
+    )
+    assert len(requests_1) == 20
+    assert requests_1[0] == {
+        "id": "0",
+        "method": "GET",
+        "url": "/me/onenote/sections/0/pages",
+    }
+    # Only the throttled request is retried.
+    assert requests_2 == [
+        {"id": "3", "method": "GET", "url": "/me/onenote/sections/3/pages"}
+    ]
+    assert [r["id"] for r in requests_3] == ["20", "21"]
+
+
+def test_onenote_api_pages_of_sections():
+    client = OauthClient(client_id="", client_secret="", token={})
+    client.request_once = MagicMock()
+    client.get = MagicMock()
+    api = OneNoteAPI(client=client)
+    base = "https://graph.microsoft.com/v1.0/me/onenote"
+
+    client.request_once().json.return_value = {
+        "responses": [
+            {
+                "id": "1",
+                "status": 403,
+                "body": {
+                    "error": {
+                        "code": "20185",
+                        "message": "Encrypted sections are not accessible.",
+                    }
+                },
+            },
+            {
+                "id": "0",
+                "status": 200,
+                "body": {
+                    "value": ["page1"],
+                    "@odata.nextLink": base + "/sections/S1/pages?$skip=1",
+                },
+            },
+        ]
+    }
+    client.request_once.reset_mock()
+    client.get().json.return_value = {"value": ["page2"]}
+    client.get.reset_mock()
+
+    assert api.get_pages_of_sections(["S1", "S2"]) == {
+        "S1": ["page1", "page2"],
+        "S2": None,
+    }
+    assert client.request_once.call_count == 1
+    assert client.request_once.call_args[1]["json"]["requests"][0]["url"] == (
+        "/me/onenote/sections/S1/pages"
+        "?$select=id,title,createdDateTime,lastModifiedDateTime,"
+        "parentSection,level,order&pagelevel=true"
+    )
+    assert client.get.call_args_list == [call(base + "/sections/S1/pages?$skip=1")]
@@ -0,0 +1,186 @@
+import threading
+from pathlib import Path
+from unittest.mock import Mock
+
+from synctogit.onenote.exc import EncryptedSectionError
+from synctogit.onenote.metadata_snapshot import SectionsSnapshot
+from synctogit.onenote.onenote import OneNoteClient
+
+
+def page(page_id, last_modified):
+    return {
+        "id": page_id,
+        "title": "Page %s" % page_id,
+        "createdDateTime": "2018-09-22T16:42:29.61Z",
+        "lastModifiedDateTime": last_modified,
+        "order": int(page_id[1:]),
+    }
+
+
+def section(section_id, last_modified="2018-09-22T16:42:29.61Z"):
+    return {
+        "id": section_id,
+        "displayName": "Section %s" % section_id,
+        "createdDateTime": "2018-09-22T16:42:29.61Z",
+        "lastModifiedDateTime": last_modified,
+        "isDefault": False,
+    }
+
+
+def test_check_pages_unchanged():
+    c = OneNoteClient(client_id="", client_secret="", token={})
+    c._api = Mock()
+    c._api.get_notebooks.return_value = [
+        {
+            "id": "n1",
+            "displayName": "Notebook",
+            "createdDateTime": "2018-09-22T16:42:29.61Z",
+            "lastModifiedDateTime": "2018-09-22T16:42:29.61Z",
+            "isDefault": True,
+            "sections": [section("s1"), section("s2")],
+        }
+    ]
+    pages = {
+        "s1": [page("p1", "2018-09-22T16:42:29Z"), page("p2", "2018-09-22T16:42:29Z")],
+        "s2": [page("p3", "2018-09-22T16:42:29Z")],
+    }
+    c._api.get_pages_of_section.side_effect = lambda section_id: pages[section_id]
+    c.sync_metadata()
+    c._api.get_pages_of_section.reset_mock()
+
+    assert c.check_pages_unchanged(["p1", "p2"])
+    assert c._api.get_pages_of_section.call_count == 1
+
+    pages["s2"] = [page("p3", "2018-09-23T16:42:29Z")]
+    assert c.check_pages_unchanged(["p1"])
+    assert not c.check_pages_unchanged(["p1", "p3"])
+    assert not c.check_pages_unchanged(["p4"])
+
+
+def test_sections_are_listed_concurrently():
+    c = OneNoteClient(client_id="", client_secret="", token={})
+    c._api = Mock()
+    c._api.get_notebooks.return_value = [
+        {
+            "id": "n1",
+            "displayName": "Notebook",
+            "createdDateTime": "2018-09-22T16:42:29.61Z",
+            "lastModifiedDateTime": "2018-09-22T16:42:29.61Z",
+            "isDefault": True,
+            "sections": [section("s1"), section("s2"), section("s3")],
+        }
+    ]
+    # Both sections must be listed at the same time to pass the barrier.
+    barrier = threading.Barrier(2, timeout=10)
+
+    def get_pages_of_section(section_id):
+        if section_id == "s3":
+            raise EncryptedSectionError()
+        barrier.wait()
+        return [page("p%s" % section_id[1:], "2018-09-22T16:42:29Z")]
+
+    c._api.get_pages_of_section.side_effect = get_pages_of_section
+    c.sync_metadata()
+
+    assert list(c.section_to_pages.keys()) == ["s1", "s2", "s3"]
+    assert [p.id for p in c.section_to_pages["s2"]] == ["p2"]
+    assert c.section_to_pages["s3"] == []
+
+
+def test_sections_are_listed_with_batches():
+    c = OneNoteClient(client_id="", client_secret="", token={}, batch_requests=True)
+    c._api = Mock()
+    c._api.max_batch_size = 2
+    c._api.get_notebooks.return_value = [
+        {
+            "id": "n1",
+            "displayName": "Notebook",
+            "createdDateTime": "2018-09-22T16:42:29.61Z",
+            "lastModifiedDateTime": "2018-09-22T16:42:29.61Z",
+            "isDefault": True,
+            "sections": [section("s1"), section("s2"), section("s3")],
+        }
+    ]
+
+    def get_pages_of_sections(section_ids):
+        return {
+            section_id: (
+                None  # encrypted
+                if section_id == "s3"
+                else [page("p%s" % section_id[1:], "2018-09-22T16:42:29Z")]
+            )
+            for section_id in section_ids
+        }
+
+    c._api.get_pages_of_sections.side_effect = get_pages_of_sections
+    c.sync_metadata()
+
+    assert sorted(
+        call_args[0][0] for call_args in c._api.get_pages_of_sections.call_args_list
+    ) == [["s1", "s2"], ["s3"]]
+    assert c._api.get_pages_of_section.call_count == 0
+    assert list(c.section_to_pages.keys()) == ["s1", "s2", "s3"]
+    assert [p.id for p in c.section_to_pages["s2"]] == ["p2"]
+    assert c.section_to_pages["s3"] == []
+
+
+def test_sections_snapshot(temp_dir):
+    snapshot_path = Path(temp_dir) / "onenote_sections.json"
+    sections = [section("s1"), section("s2"), section("s3")]
+    pages = {
+        "s1": [page("p1", "2018-09-22T16:42:29Z")],
+        "s2": [page("p2", "2018-09-22T16:42:29Z")],
+        "s3": [page("p3", "2018-09-22T16:42:29Z")],
+    }
+
+    def sync():
+        snapshot = SectionsSnapshot(snapshot_path)
+        snapshot.load()
+        c = OneNoteClient(
+            client_id="", client_secret="", token={}, sections_snapshot=snapshot
+        )
+        c._api = Mock()
+        c._api.get_notebooks.return_value = [
+            {
+                "id": "n1",
+                "displayName": "Notebook",
+                "createdDateTime": "2018-09-22T16:42:29.61Z",
+                "lastModifiedDateTime": "2018-09-22T16:42:29.61Z",
+                "isDefault": True,
+                "sections": list(sections),
+            }
+        ]
+        c._api.get_pages_of_section.side_effect = lambda section_id: pages[section_id]
+        c.sync_metadata()
+        listed = sorted(
+            call_args[0][0] for call_args in c._api.get_pages_of_section.call_args_list
+        )
+        return c, listed
+
+    c1, listed = sync()
+    assert listed == ["s1", "s2", "s3"]
+
+    c2, listed = sync()
+    assert listed == []
+    assert c2.section_to_pages == c1.section_to_pages
+    assert c2.metadata == c1.metadata
+
+    pages["s2"] = [
+        page("p2", "2018-09-23T16:42:29Z"),
+        page("p4", "2018-09-23T16:42:29Z"),
+    ]
+    sections[1] = section("s2", "2018-09-23T16:42:29Z")
+    del sections[2]
+    c3, listed = sync()
+    assert listed == ["s2"]
+    assert [p.id for p in c3.section_to_pages["s2"]] == ["p2", "p4"]
+    assert c3.section_to_pages["s1"] == c1.section_to_pages["s1"]
+    assert set(c3.metadata.keys()) == {"p1", "p2", "p4"}
+
+    snapshot = SectionsSnapshot(snapshot_path)
+    snapshot.load()
+    assert set(snapshot.sections.keys()) == {"s1", "s2"}
+
+    snapshot_path.write_text("{")
+    _, listed = sync()
+    assert listed == ["s1", "s2"]
@@ -1,3 +1,4 @@
+import hashlib
 from pathlib import Path
 from typing import Mapping, Optional
 
@@ -106,3 +107,33 @@ def test_full_html():  # without inkml
             ),
         ),
     }
+
+
+def test_content_addressed_resources():
+    input_html = (data_path / "page_parser_full_input.html").read_text()
+    resources_base = "../../Resources/objects/"
+
+    rr = DummyResourceRetrieval()
+    p = PageParser(
+        html=input_html,
+        inkml=None,
+        resource_retrieval=rr,
+        resources_base=resources_base,
+        content_addressed_resources=True,
+    )
+
+    plain = PageParser(
+        html=input_html,
+        inkml=None,
+        resource_retrieval=rr,
+        resources_base=resources_base,
+    )
+
+    html = p.html.decode()
+    assert "0-aaaaaaaaaaaaaaaaaaaaaaaaaaaaa" not in html
+    assert p.resources.keys() == plain.resources.keys()
+    for resource_id, resource in p.resources.items():
+        name, ext = resource.filename.split(".")
+        assert name == hashlib.md5(resource.body).hexdigest()
+        assert plain.resources[resource_id].filename.endswith("." + ext)
+        assert resources_base + resource.filename in html
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from synctogit.onenote.resource_executor import ResourceExecutor
+
+
+def test_map_results_and_errors():
+    executor = ResourceExecutor(max_workers=3, max_per_host=2)
+    try:
+        urls = ["https://h%d/r%d" % (i % 2, i) for i in range(10)]
+        assert executor.map(lambda url: url.upper(), urls) == [u.upper() for u in urls]
+        assert executor.map(lambda url: url, []) == []
+
+        def fn(url):
+            if url.endswith("r3"):
+                raise ValueError(url)
+            return url
+
+        with pytest.raises(ValueError):
+            executor.map(fn, urls)
+    finally:
+        executor.shutdown()
+
+
+def test_per_host_limit():
+    executor = ResourceExecutor(max_workers=8, max_per_host=2)
+    lock = threading.Lock()
+    running = {"a": 0, "b": 0}
+    max_running = {"a": 0, "b": 0}
+
+    def fn(url):
+        host = url.split("/")[2]
+        with lock:
+            running[host] += 1
+            max_running[host] = max(max_running[host], running[host])
+        time.sleep(0.01)
+        with lock:
+            running[host] -= 1
+
+    try:
+        executor.map(fn, ["https://%s/%d" % ("ab"[i % 2], i) for i in range(20)])
+    finally:
+        executor.shutdown()
+    assert max_running == {"a": 2, "b": 2}
+
+
+def test_jobs_are_interleaved():
+    executor = ResourceExecutor(max_workers=1, max_per_host=1)
+    order = []
+    first_started = threading.Event()
+    second_submitted = threading.Event()
+
+    def fn(url):
+        order.append(url)
+        if url == "https://h/a0":
+            first_started.set()
+            second_submitted.wait(timeout=10)
+
+    try:
+        t = threading.Thread(
+            target=executor.map, args=(fn, ["https://h/a%d" % i for i in range(3)])
+        )
+        t.start()
+        first_started.wait(timeout=10)
+
+        t2 = threading.Thread(
+            target=executor.map, args=(fn, ["https://h/b%d" % i for i in range(3)])
+        )
+        t2.start()
+        while not executor._jobs or len(executor._jobs) < 2:
+            time.sleep(0.001)
+        second_submitted.set()
+        t.join()
+        t2.join()
+    finally:
+        executor.shutdown()
+
+    assert [url.rsplit("/", 1)[1] for url in order] == [
+        "a0",
+        "a1",
+        "b0",
+        "a2",
+        "b1",
+        "b2",
+    ]
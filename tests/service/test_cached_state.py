@@ -0,0 +1,27 @@
+import os
+from pathlib import Path
+
+from synctogit.service.notes.cached_state import load_cached_state, save_cached_state
+
+
+def test_cached_state(temp_dir):
+    path = Path(temp_dir) / "cache" / "state.json"
+    loaded = []
+    assert not load_cached_state(path, 1, "State", loaded.append)
+
+    save_cached_state(path, 1, dict(a=[1, 2]))
+    assert load_cached_state(path, 1, "State", loaded.append)
+    assert loaded == [dict(version=1, a=[1, 2])]
+    assert os.listdir(str(path.parents[0])) == ["state.json"]
+
+    # Written by an incompatible version
+    assert not load_cached_state(path, 2, "State", loaded.append)
+
+    def load(data):
+        raise KeyError("b")
+
+    assert not load_cached_state(path, 1, "State", load)
+
+    path.write_text("{corrupted")
+    assert not load_cached_state(path, 1, "State", loaded.append)
+    assert len(loaded) == 1
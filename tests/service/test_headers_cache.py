@@ -0,0 +1,143 @@
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+import pytz
+
+from synctogit.evernote.working_copy import EvernoteWorkingCopy
+from synctogit.git_factory import git_factory
+from synctogit.git_transaction import GitTransaction
+from synctogit.service.notes.headers_cache import NoteHeadersCache
+from synctogit.service.notes.stored_note import StoredNote
+
+note_html = (
+    "<!doctype html>\n"
+    "<!--+++++++++++++-->\n"
+    "<!-- guid: eaaaaaae-1797-4b92-ad11-f3f6e7ada8d7 -->\n"
+    "<!-- updateSequenceNum: 12345 -->\n"
+    "<!-- title: Haircut -->\n"
+    "<!----------------->\n"
+    "<html>\n"
+)
+
+
+def test_cache_roundtrip(temp_dir):
+    cache_path = Path(temp_dir) / "cache" / "headers.json"
+    header = {"guid": "123", "title": "Eleven"}
+
+    cache = NoteHeadersCache(cache_path)
+    cache.load()
+    assert cache.get("a/b.html", [1, 2, 3]) is None
+    cache.set("a/b.html", [1, 2, 3], header)
+    cache.set("a/c.html", [4, 5, 6], header)
+    cache.save()
+
+    cache = NoteHeadersCache(cache_path)
+    cache.load()
+    assert cache.get("a/b.html", [1, 2, 3]) == header
+    assert cache.get("a/b.html", [1, 2, 4]) is None
+    cache.save()
+
+    # Entries which haven't been requested are pruned on save.
+    cache = NoteHeadersCache(cache_path)
+    cache.load()
+    assert cache.get("a/b.html", [1, 2, 3]) == header
+    assert cache.get("a/c.html", [4, 5, 6]) is None
+
+
+def test_corrupted_cache_is_rebuilt(temp_dir):
+    cache_path = Path(temp_dir) / "headers.json"
+    cache_path.write_text("{not a json")
+
+    cache = NoteHeadersCache(cache_path)
+    cache.load()
+    assert cache.get("a/b.html", [1, 2, 3]) is None
+    cache.set("a/b.html", [1, 2, 3], {"guid": "123"})
+    cache.save()
+
+    cache = NoteHeadersCache(cache_path)
+    cache.load()
+    assert cache.get("a/b.html", [1, 2, 3]) == {"guid": "123"}
+
+
+def test_saved_cache_is_not_parsed_again(temp_dir):
+    cache_path = Path(temp_dir) / "headers.json"
+    header = {"guid": "123"}
+
+    cache = NoteHeadersCache(cache_path)
+    cache.load()
+    cache.set("a/b.html", [1, 2, 3], header)
+    cache.save()
+
+    with patch("json.load", side_effect=AssertionError):
+        cache.load()
+    assert cache.get("a/b.html", [1, 2, 3]) == header
+    cache.save()
+
+    # Changed by someone else.
+    other = NoteHeadersCache(cache_path)
+    other.load()
+    other.set("a/b.html", [1, 2, 4], header)
+    other.save()
+
+    cache.load()
+    assert cache.get("a/b.html", [1, 2, 3]) is None
+    assert cache.get("a/b.html", [1, 2, 4]) == header
+
+
+def test_working_copy_metadata_uses_cache(temp_dir):
+    repo_dir = Path(temp_dir) / "myrepo"
+    os.mkdir(str(repo_dir))
+    git = git_factory(str(repo_dir))
+
+    note_path = repo_dir / "Notes" / "Eleven" / "Haircut.html"
+
+    with GitTransaction(git) as t:
+        os.makedirs(str(note_path.parents[0]))
+        note_path.write_text(note_html)
+
+        wc = EvernoteWorkingCopy(git_transaction=t, timezone=pytz.utc)
+        with patch.object(
+            StoredNote, "_parse_note_header", wraps=StoredNote._parse_note_header
+        ) as mock_parse:
+            metadata = wc.get_working_copy_metadata()
+            assert mock_parse.call_count == 1
+
+            assert wc.get_working_copy_metadata() == metadata
+            assert mock_parse.call_count == 1
+
+            note_path.write_text(note_html.replace("12345", "123456"))
+            metadata = wc.get_working_copy_metadata()
+            assert mock_parse.call_count == 2
+
+    (note,) = metadata.values()
+    assert note.update_sequence_num == 123456
+
+
+def test_working_copy_metadata_from_git(temp_dir):
+    repo_dir = Path(temp_dir) / "myrepo"
+    os.mkdir(str(repo_dir))
+    git = git_factory(str(repo_dir))
+
+    note_path = repo_dir / "Notes" / "Eleven" / "Haircut.html"
+    with GitTransaction(git) as t:
+        t.write_bytes(note_path, note_html.encode())
+
+    with GitTransaction(git) as t:
+        wc = EvernoteWorkingCopy(
+            git_transaction=t, timezone=pytz.utc, metadata_from_git=True
+        )
+        with patch.object(
+            StoredNote,
+            "_parse_note_header_stream",
+            wraps=StoredNote._parse_note_header_stream,
+        ) as mock_parse:
+            metadata = wc.get_working_copy_metadata()
+            assert mock_parse.call_count == 1
+
+            assert wc.get_working_copy_metadata() == metadata
+            assert mock_parse.call_count == 1
+
+    (note_key,) = metadata.keys()
+    assert note_key == "eaaaaaae-1797-4b92-ad11-f3f6e7ada8d7"
+    assert metadata[note_key].dir == ("Eleven",)
@@ -0,0 +1,85 @@
+import threading
+import time
+from unittest.mock import Mock, call, patch
+
+import pytest
+
+from synctogit.service import RateLimiter, ServiceRateLimitError, retry_ratelimited
+
+
+def test_token_bucket():
+    limiter = RateLimiter("test", max_rate=2.0)
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == 0
+    delay = limiter.try_acquire()
+    assert 0 < delay <= 0.5
+
+
+def test_aimd():
+    limiter = RateLimiter("test", max_rate=10.0, min_rate=2.0, increase_step=1.0)
+
+    # Simultaneously throttled requests decrease the rate once.
+    with limiter.paused(0):
+        with limiter.paused(0):
+            pass
+    assert limiter.rate == 5.0
+
+    limiter.on_success()
+    assert limiter.rate == 6.0
+
+    for _ in range(3):
+        with limiter.paused(0):
+            pass
+    assert limiter.rate == 2.0
+
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.rate == 10.0
+
+
+def test_pause_blocks_all_callers():
+    limiter = RateLimiter("test")
+    acquired = threading.Event()
+
+    def acquire():
+        limiter.acquire()
+        acquired.set()
+
+    with limiter.paused(60):
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        assert not acquired.wait(0.1)
+    # The pause is lifted by the throttled thread, not by the timer.
+    assert acquired.wait(5)
+    thread.join()
+
+
+def test_pause_expires():
+    limiter = RateLimiter("test")
+    with limiter.paused(0.05):
+        t0 = time.monotonic()
+        limiter.acquire()
+        assert time.monotonic() - t0 >= 0.04
+
+
+@patch("synctogit.service.retries.sleep")
+def test_retry_ratelimited_with_limiter(mock_sleep):
+    limiter = RateLimiter("test", max_rate=8.0)
+    f = Mock(
+        side_effect=[
+            ServiceRateLimitError(rate_limit_duration_seconds=3),
+            ServiceRateLimitError(rate_limit_duration_seconds=4),
+            "result",
+        ]
+    )
+    f.__name__ = "f"
+
+    def sleep(s):
+        # Other callers are paused while the throttled one is waiting.
+        assert limiter.try_acquire() > 0
+
+    mock_sleep.side_effect = sleep
+    assert retry_ratelimited(limiter=limiter)(f)() == "result"
+    assert mock_sleep.call_args_list == [call(3), call(4)]
+    assert limiter.rate == pytest.approx(2.0 + limiter.increase_step)
+    assert limiter.try_acquire() == 0
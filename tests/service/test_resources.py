@@ -0,0 +1,31 @@
+import hashlib
+import io
+from pathlib import Path
+
+import pytest
+
+from synctogit.service.notes.resources import (
+    hash_resource_body,
+    store_resource_body,
+    write_staging_file,
+)
+
+
+@pytest.mark.parametrize("kind", ["bytes", "path", "file"])
+def test_store_resource_body(temp_dir, kind):
+    staging_dir = Path(temp_dir) / "staging"
+    if kind == "bytes":
+        body = b"aaabbb"
+    elif kind == "path":
+        body = write_staging_file(staging_dir, [b"aaa", b"bbb"])
+    else:
+        body = io.BytesIO(b"aaabbb")
+
+    assert hash_resource_body(body) == hashlib.md5(b"aaabbb").hexdigest()
+
+    path = Path(temp_dir) / "resource.png"
+    store_resource_body(path, body)
+    assert path.read_bytes() == b"aaabbb"
+    assert [p.name for p in Path(temp_dir).iterdir() if p.is_file()] == ["resource.png"]
+    if kind == "path":
+        assert not body.exists()
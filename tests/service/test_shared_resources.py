@@ -0,0 +1,133 @@
+import os
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+import pytz
+
+from synctogit.evernote.models import NoteMetadata
+from synctogit.evernote.working_copy import EvernoteWorkingCopy
+from synctogit.git_factory import git_factory
+from synctogit.git_transaction import GitTransaction
+from synctogit.service.notes import NoteResource
+from synctogit.service.notes.shared_resources import SharedResourceStore
+
+
+def test_store_refcounting(temp_dir):
+    objects_dir = Path(temp_dir) / "objects"
+    refs_path = Path(temp_dir) / "objects.json"
+
+    store = SharedResourceStore(objects_dir, refs_path)
+    store.load()
+    store.set_note_refs("n1", ["a.png", "b.png"])
+    store.set_note_refs("n2", ["a.png"])
+    store.write_object("a.png", b"a")
+    store.write_object("b.png", b"b")
+    store.write_object("b.png", b"b")
+    assert sorted(os.listdir(str(objects_dir))) == ["a.png", "b.png"]
+
+    store.set_note_refs("n1", ["c.png"])
+    store.write_object("c.png", b"c")
+    # The objects are removed only by the garbage collection.
+    assert "b.png" in store
+    store.collect_garbage()
+    store.save()
+    assert sorted(os.listdir(str(objects_dir))) == ["a.png", "c.png"]
+
+    store = SharedResourceStore(objects_dir, refs_path)
+    store.load()
+    assert store.retain_notes(["n1"]) == {"n2"}
+    store.collect_garbage()
+    store.save()
+    assert sorted(os.listdir(str(objects_dir))) == ["c.png"]
+
+
+def test_store_incomplete_refs_keep_objects(temp_dir):
+    objects_dir = Path(temp_dir) / "objects"
+    refs_path = Path(temp_dir) / "objects.json"
+
+    store = SharedResourceStore(objects_dir, refs_path)
+    store.load()
+    store.set_note_refs("n1", ["a.png"])
+    store.write_object("a.png", b"a")
+    store.write_object("b.png", b"b")
+    store.save()
+
+    refs_path.write_text("{not a json")
+
+    store = SharedResourceStore(objects_dir, refs_path)
+    store.load()
+    store.set_note_refs("n2", ["b.png"])
+    store.collect_garbage()
+    store.save()
+    # Nothing can be removed until all the refs are rebuilt.
+    assert sorted(os.listdir(str(objects_dir))) == ["a.png", "b.png"]
+    assert refs_path.read_text() == "{not a json"
+
+    store.mark_refs_complete()
+    store.collect_garbage()
+    store.save()
+    assert sorted(os.listdir(str(objects_dir))) == ["b.png"]
+
+
+def test_working_copy_shared_resources(temp_dir):
+    repo_dir = Path(temp_dir) / "myrepo"
+    os.mkdir(str(repo_dir))
+    git = git_factory(str(repo_dir))
+
+    guid1, guid2 = str(uuid4()), str(uuid4())
+    metadata1, metadata2 = (
+        NoteMetadata(
+            dir=("aaa",),
+            file="ccc.%s.html" % guid,
+            name=("aaa", "ccc", guid),
+            update_sequence_num=42,
+        )
+        for guid in (guid1, guid2)
+    )
+    objects_dir = repo_dir / "Resources" / "objects"
+
+    with GitTransaction(git) as t:
+        wc = EvernoteWorkingCopy(
+            git_transaction=t, timezone=pytz.utc, shared_resources=True
+        )
+        assert wc.get_working_copy_metadata() == {}
+        wc._save_note(
+            guid1,
+            metadata1,
+            b"html",
+            [NoteResource("a.png", b"a"), NoteResource("b.png", b"b")],
+        )
+        stored = wc.get_stored_resource_filenames(guid2)
+        assert "a.png" in stored
+        wc._save_note(guid2, metadata2, b"html", [NoteResource("a.png", None)])
+
+        with pytest.raises(ValueError):
+            wc._save_note(guid2, metadata2, b"html", [NoteResource("d.png", None)])
+        wc._save_note(guid2, metadata2, b"html", [NoteResource("a.png", None)])
+
+        wc.finalize([guid1, guid2])
+        assert sorted(os.listdir(str(objects_dir))) == ["a.png", "b.png"]
+        assert not (repo_dir / "Resources" / guid1).exists()
+
+    with GitTransaction(git) as t:
+        wc = EvernoteWorkingCopy(
+            git_transaction=t, timezone=pytz.utc, shared_resources=True
+        )
+        wc.shared_store.load()
+        wc.delete_notes([metadata1])
+        wc.finalize([guid2])
+        assert sorted(os.listdir(str(objects_dir))) == ["a.png"]
+
+
+def test_relative_shared_resources_url():
+    metadata = NoteMetadata(
+        dir=("aaa", "bbb"),
+        file="ccc.html",
+        name=("aaa", "bbb", "ccc"),
+        update_sequence_num=42,
+    )
+    url = EvernoteWorkingCopy.get_relative_resources_url(
+        "guid", metadata, shared_resources=True
+    )
+    assert url == "../../../Resources/objects/"
@@ -0,0 +1,260 @@
+import itertools
+import threading
+import time
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+from synctogit.git_factory import local_git_ignored_cache_dir
+from synctogit.service.notes import Changeset, NoteResource, RenderedNote, SyncIteration
+from synctogit.service.notes.checkpoint import SyncCheckpoint
+from synctogit.service.notes.sync_iteration import InflightBytesBudget
+
+
+class DummySyncIteration(SyncIteration):
+    def __init__(self, force_full_resync=False, **kwargs):
+        super().__init__(
+            working_copy=Mock(),
+            force_full_resync=force_full_resync,
+            git_transaction=Mock(),
+            **kwargs
+        )
+
+    def get_note(self, note_key, note_metadata):
+        return note_key
+
+    def get_note_size(self, note):
+        return 10
+
+    def get_service_metadata(self):
+        return {}
+
+    def is_same_note(self, note, note_metadata):
+        return True
+
+    def update_index(self, service_metadata, git_transaction):
+        pass
+
+
+def test_inflight_bytes_budget():
+    budget = InflightBytesBudget(25)
+    budget.acquire(30)
+
+    waited = threading.Event()
+
+    def wait():
+        budget.wait()
+        waited.set()
+
+    t = threading.Thread(target=wait)
+    t.start()
+    assert not waited.wait(timeout=0.1)
+
+    budget.release(10)
+    assert waited.wait(timeout=10)
+    t.join()
+
+    # Unlimited
+    budget = InflightBytesBudget(0)
+    budget.acquire(30)
+    budget.wait()
+
+
+def test_update_notes_within_inflight_budget():
+    si = DummySyncIteration(notes_download_threads=8, max_inflight_bytes=25)
+    changeset = Changeset(new={str(i): i for i in range(50)}, update={}, delete={})
+
+    peak = 0
+    acquire = si.inflight_budget.acquire
+
+    def record_peak(size):
+        nonlocal peak
+        acquire(size)
+        peak = max(peak, si.inflight_budget.inflight)
+
+    si.inflight_budget.acquire = record_peak
+    update_context = si._update_notes(changeset)
+
+    # The budget might be exceeded by the notes which are being downloaded
+    # simultaneously (10 bytes each).
+    assert 0 < peak <= 25 + 8 * 10
+
+    assert si.working_copy.render_note.call_count == 50
+    assert si.working_copy.write_note.call_count == 50
+    assert len(update_context.updated_notes) == 50
+    assert si.inflight_budget.inflight == 0
+    assert update_context.stages["fetch"].count == 50
+    assert update_context.stages["write"].count == 50
+
+
+def test_get_note_size():
+    si = DummySyncIteration(notes_download_threads=1)
+    note = Mock(
+        html=b"x" * 6,
+        resources={
+            "a": Mock(body=b"yyyy"),
+            # Streamed to a file
+            "b": Mock(body=Path("b")),
+            # Already stored
+            "c": Mock(body=None),
+        },
+    )
+    assert SyncIteration.get_note_size(si, note) == 10
+
+
+def test_update_notes_pipeline_failures():
+    si = DummySyncIteration(notes_download_threads=4, notes_render_threads=2)
+    si.working_copy.render_note.side_effect = lambda note, metadata: (
+        note if note != "1" else 1 / 0
+    )
+    si.working_copy.write_note.side_effect = lambda rendered: (
+        None if rendered != "2" else 1 / 0
+    )
+    changeset = Changeset(new={str(i): i for i in range(5)}, update={}, delete={})
+
+    update_context = si._update_notes(changeset)
+
+    assert sorted(update_context.updated_notes) == [("0", 0), ("3", 3), ("4", 4)]
+    assert sorted(update_context.failed_notes) == [("1", 1), ("2", 2)]
+    assert update_context.stages["render"].count == 4
+    assert si.inflight_budget.inflight == 0
+
+
+def test_update_notes_fetch_failures_release_the_window():
+    si = DummySyncIteration(notes_download_threads=2)
+    si.is_same_note = Mock(side_effect=ValueError("Some random exception"))
+    changeset = Changeset(new={str(i): i for i in range(10)}, update={}, delete={})
+
+    update_context = si._update_notes(changeset)
+
+    assert len(update_context.failed_notes) == 10
+    assert update_context.updated_notes == []
+    assert si.working_copy.write_note.call_count == 0
+    assert si.inflight_budget.inflight == 0
+
+
+def test_update_notes_are_written_in_order():
+    si = DummySyncIteration(notes_download_threads=4, max_inflight_bytes=25)
+
+    def get_note(note_key, note_metadata):
+        # The first notes are downloaded the slowest.
+        time.sleep(0.02 / (1 + note_metadata))
+        return note_key
+
+    si.get_note = get_note
+    si.working_copy.render_note.side_effect = lambda note, metadata: note
+    changeset = Changeset(new={str(i): i for i in range(20)}, update={}, delete={})
+
+    update_context = si._update_notes(changeset)
+
+    written = [c.args[0] for c in si.working_copy.write_note.call_args_list]
+    assert written == [str(i) for i in range(20)]
+    assert [key for key, _ in update_context.updated_notes] == written
+    assert si.inflight_budget.inflight == 0
+
+
+def test_update_notes_checkpoints():
+    si = DummySyncIteration(notes_download_threads=4, checkpoint_interval_seconds=1)
+    changeset = Changeset(new={str(i): i for i in range(3)}, update={}, delete={})
+
+    with patch("synctogit.service.notes.sync_iteration.time.monotonic") as monotonic:
+        # Each note is written 1 second after the previous one.
+        monotonic.side_effect = itertools.count()
+        si._update_notes(changeset)
+
+    assert si.git_transaction.checkpoint.call_count >= 1
+    assert (
+        si.working_copy.checkpoint.call_count
+        == si.git_transaction.checkpoint.call_count
+    )
+
+
+def checkpointed_sync_iteration(temp_dir, force_full_resync):
+    si = DummySyncIteration(
+        notes_download_threads=4, force_full_resync=force_full_resync
+    )
+    si.git_transaction.repo_dir = Path(temp_dir)
+    si.get_service_metadata = lambda: {"1": 1, "2": 2, "3": 3}
+
+    def calculate_changes(working_copy_metadata, service_metadata, force_update):
+        # Note 2 has been changed since it was saved.
+        update = {"1": 1, "2": 2, "3": 3} if force_update else {"2": 2}
+        return Changeset(new={}, update=update, delete={})
+
+    si.working_copy.calculate_changes.side_effect = calculate_changes
+    si.working_copy.render_note.side_effect = lambda note, metadata: note
+    return si
+
+
+def test_forced_resync_is_resumed(temp_dir):
+    checkpoint_path = (
+        Path(temp_dir)
+        / local_git_ignored_cache_dir
+        / (SyncIteration.checkpoint_file_name)
+    )
+    checkpoint = SyncCheckpoint(checkpoint_path)
+    checkpoint.is_force_full_resync = True
+    checkpoint.saved_note_keys = {"1", "2"}
+    checkpoint.save()
+
+    # Note 3 fails this time.
+    si = checkpointed_sync_iteration(temp_dir, force_full_resync=False)
+    si.working_copy.write_note.side_effect = lambda rendered: (
+        1 / 0 if rendered == "3" else None
+    )
+    _, update_context = si.run_transaction()
+
+    assert update_context.updated_notes == [("2", 2)]
+    assert update_context.failed_notes == [("3", 3)]
+    assert si.working_copy.finalize.call_args[1] == {"is_refs_rebuilt": False}
+    checkpoint.load()
+    assert checkpoint.is_force_full_resync
+    assert checkpoint.saved_note_keys == {"1", "2"}
+
+    # Note 2 has been saved already.
+    si = checkpointed_sync_iteration(temp_dir, force_full_resync=False)
+    si.working_copy.calculate_changes.side_effect = (
+        lambda working_copy_metadata, service_metadata, force_update: Changeset(
+            new={},
+            update={"1": 1, "2": 2, "3": 3} if force_update else {},
+            delete={},
+        )
+    )
+    _, update_context = si.run_transaction()
+
+    assert update_context.updated_notes == [("3", 3)]
+    assert not checkpoint_path.exists()
+
+
+def test_forced_resync_without_checkpoint(temp_dir):
+    si = checkpointed_sync_iteration(temp_dir, force_full_resync=True)
+    _, update_context = si.run_transaction()
+
+    assert sorted(update_context.updated_notes) == [("1", 1), ("2", 2), ("3", 3)]
+    assert si.working_copy.finalize.call_args[1] == {"is_refs_rebuilt": True}
+
+
+def test_update_notes_commit_every_notes():
+    si = DummySyncIteration(
+        notes_download_threads=4, checkpoint_interval_seconds=0, commit_every_notes=2
+    )
+    changeset = Changeset(new={str(i): i for i in range(5)}, update={}, delete={})
+    si._update_notes(changeset)
+    assert si.git_transaction.checkpoint.call_count == 2
+
+
+def test_update_notes_commit_every_bytes():
+    si = DummySyncIteration(
+        notes_download_threads=4, checkpoint_interval_seconds=0, commit_every_bytes=25
+    )
+    si.working_copy.render_note.side_effect = lambda note, metadata: RenderedNote(
+        note_key=note,
+        metadata=metadata,
+        html_body=b"x" * 6,
+        resources=[
+            NoteResource(filename="a", body=b"yyyy"),
+            NoteResource(filename="b", body=None),
+        ],
+    )
+    changeset = Changeset(new={str(i): i for i in range(6)}, update={}, delete={})
+    si._update_notes(changeset)
+    assert si.git_transaction.checkpoint.call_count == 2
@@ -1,9 +1,15 @@
+import os
+from pathlib import Path
 from uuid import uuid4
 
 import pytest
+import pytz
 
 from synctogit.evernote.models import NoteMetadata
 from synctogit.evernote.working_copy import EvernoteChangeset, EvernoteWorkingCopy
+from synctogit.git_factory import git_factory
+from synctogit.git_transaction import GitTransaction
+from synctogit.service.notes import NoteResource
 
 
 @pytest.mark.parametrize("force_update", [False, True])
@@ -115,3 +121,146 @@ def test_calculate_changes_detects_moves(force_update, change):
 
 
 # XXX !!!!!!! also remove files in resources dir and dirs in the notes dir?
+
+
+def test_save_note_reconciles_resources(temp_dir):
+    repo_dir = Path(temp_dir) / "myrepo"
+    os.mkdir(str(repo_dir))
+    git = git_factory(str(repo_dir))
+
+    guid = str(uuid4())
+    metadata = NoteMetadata(
+        dir=("aaa",),
+        file="ccc.%s.html" % guid,
+        name=("aaa", "ccc"),
+        update_sequence_num=42,
+    )
+    resources_dir = repo_dir / "Resources" / guid
+
+    with GitTransaction(git) as t:
+        wc = EvernoteWorkingCopy(git_transaction=t, timezone=pytz.utc)
+        wc._save_note(
+            guid,
+            metadata,
+            b"html",
+            [NoteResource("a.png", b"a"), NoteResource("b.png", b"b")],
+        )
+        assert wc.get_stored_resource_filenames(guid) == {"a.png", "b.png"}
+
+        wc._save_note(
+            guid,
+            metadata,
+            b"html",
+            [NoteResource("a.png", None), NoteResource("c.png", b"c")],
+        )
+        assert wc.get_stored_resource_filenames(guid) == {"a.png", "c.png"}
+        assert (resources_dir / "a.png").read_bytes() == b"a"
+
+        with pytest.raises(ValueError):
+            wc._save_note(guid, metadata, b"html", [NoteResource("d.png", None)])
+
+        wc._save_note(guid, metadata, b"html", [])
+        assert not resources_dir.exists()
+
+
+def test_targeted_staging_commits_all_changes(temp_dir, call_git):
+    repo_dir = Path(temp_dir) / "myrepo"
+    os.mkdir(str(repo_dir))
+    git = git_factory(str(repo_dir))
+
+    guid = str(uuid4())
+    metadata = NoteMetadata(
+        dir=("aaa",),
+        file="ccc.%s.html" % guid,
+        name=("aaa", "ccc"),
+        update_sequence_num=42,
+    )
+
+    with GitTransaction(git, targeted_staging=True) as t:
+        wc = EvernoteWorkingCopy(
+            git_transaction=t, timezone=pytz.utc, shared_resources=True
+        )
+        wc.shared_store.load()
+        wc._save_note(guid, metadata, b"html", [NoteResource("a.png", b"a")])
+        wc.finalize([guid], is_refs_rebuilt=True)
+    assert call_git("git status --porcelain", cwd=str(repo_dir)) == ""
+    assert call_git("git ls-files", cwd=str(repo_dir)).split("\n") == [
+        ".gitignore",
+        "Notes/aaa/ccc.%s.html" % guid,
+        "Resources/objects.json",
+        "Resources/objects/a.png",
+    ]
+
+    with GitTransaction(git, targeted_staging=True) as t:
+        wc = EvernoteWorkingCopy(
+            git_transaction=t, timezone=pytz.utc, shared_resources=True
+        )
+        wc.shared_store.load()
+        wc.delete_notes([metadata])
+        wc.finalize([])
+    assert call_git("git status --porcelain", cwd=str(repo_dir)) == ""
+    assert call_git("git ls-files", cwd=str(repo_dir)).split("\n") == [
+        ".gitignore",
+        "Resources/objects.json",
+    ]
+
+
+@pytest.mark.parametrize("shared_resources", [False, True])
+def test_bare_repo_working_copy(temp_dir, call_git, shared_resources):
+    repo_dir = Path(temp_dir) / "myrepo"
+    os.mkdir(str(repo_dir))
+    git = git_factory(str(repo_dir), bare=True)
+
+    guid = str(uuid4())
+    metadata = NoteMetadata(
+        dir=("aaa",),
+        file="ccc.%s.html" % guid,
+        name=("aaa", "ccc"),
+        update_sequence_num=42,
+    )
+    if shared_resources:
+        resources = ["Resources/objects.json", "Resources/objects/a.png"]
+    else:
+        resources = ["Resources/%s/a.png" % guid]
+
+    def ls_files():
+        return call_git("git ls-tree -r --name-only HEAD", cwd=str(repo_dir))
+
+    with GitTransaction(git) as t:
+        wc = EvernoteWorkingCopy(
+            git_transaction=t, timezone=pytz.utc, shared_resources=shared_resources
+        )
+        assert wc.get_working_copy_metadata() == {}
+        wc._save_note(
+            guid,
+            metadata,
+            b"html",
+            [NoteResource("a.png", b"a"), NoteResource("b.png", b"b")],
+        )
+        wc._save_note(
+            guid,
+            metadata,
+            b"html",
+            [NoteResource("a.png", None)],
+        )
+        assert "a.png" in wc.get_stored_resource_filenames(guid)
+        wc.finalize([guid], is_refs_rebuilt=True)
+    assert ls_files().split("\n") == ["Notes/aaa/ccc.%s.html" % guid] + resources
+    # Nothing is written outside of the git dir.
+    assert not (repo_dir / "Notes").exists()
+    assert not (repo_dir / "Resources").exists()
+
+    with GitTransaction(git) as t:
+        wc = EvernoteWorkingCopy(
+            git_transaction=t, timezone=pytz.utc, shared_resources=shared_resources
+        )
+        if shared_resources:
+            wc.shared_store.load()
+            assert "a.png" in wc.shared_store
+        wc.delete_notes([metadata])
+        wc._delete_non_existing_resources({})
+        wc.finalize([])
+    if shared_resources:
+        assert ls_files() == "Resources/objects.json"
+    else:
+        assert ls_files() == ""
@@ -1,4 +1,5 @@
 import contextlib
+import enum
 import io
 from typing import ContextManager, TextIO
 
@@ -106,6 +107,32 @@ i = None
         assert config.BoolConfigItem("git", "i").get(conf) is False
 
 
+def test_enum():
+    class Color(enum.Enum):
+        red = "red"
+        green = "green"
+
+    conf = """
+[paint]
+a = red
+b = blue
+"""
+    read_writer = MemoryConfigReadWriter(conf)
+    conf = config.Config(read_writer)
+    assert config.EnumConfigItem("paint", "a", Color).get(conf) is Color.red
+    assert config.EnumConfigItem("paint", "c", Color, Color.green).get(conf) is (
+        Color.green
+    )
+
+    with pytest.raises(
+        ValueError, match=r"paint\.b: 'blue'. Expected one of: red, green"
+    ):
+        config.EnumConfigItem("paint", "b", Color).get(conf)
+
+    config.EnumConfigItem("paint", "b", Color).set(conf, Color.green)
+    assert "b = green" in read_writer.text()
+
+
 def test_write():
     conf = """
 [git]
@@ -0,0 +1,40 @@
+import os
+import signal
+from unittest.mock import Mock
+
+import pytest
+
+from synctogit.daemon import Daemon
+
+
+def test_failures_dont_stop_the_daemon():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError("Some random exception")
+        daemon.stop()
+
+    daemon = Daemon(fn, interval_seconds=0.01)
+    daemon.run()
+    assert len(calls) == 2
+    assert daemon.is_stopped
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGTERM"), reason="No SIGTERM")
+def test_signal_stops_after_the_current_call():
+    fn = Mock(side_effect=lambda: os.kill(os.getpid(), signal.SIGTERM))
+    previous_handler = signal.getsignal(signal.SIGTERM)
+
+    daemon = Daemon(fn, interval_seconds=3600)
+    daemon.run()
+    assert fn.call_count == 1
+    assert signal.getsignal(signal.SIGTERM) is previous_handler
+
+
+def test_next_delay_jitter():
+    daemon = Daemon(Mock(), interval_seconds=100, jitter=0.1)
+    delays = [daemon.next_delay() for _ in range(100)]
+    assert all(90 <= d <= 110 for d in delays)
+    assert len(set(delays)) > 1
@@ -232,3 +232,46 @@ def test_gitignore_update_with_dirty_repo(
     else:
         prefix = "M  " if is_dirty_staged else " M "
     assert git_status.startswith(prefix)
+
+
+def test_git_bare(call_git, temp_dir):
+    d = str(Path(temp_dir) / "myrepo")
+    os.mkdir(d)
+    git = git_factory(d, branch="spooky", bare=True)
+    assert git.bare
+
+    assert call_git("git rev-parse --is-bare-repository", cwd=d) == "true"
+    git_commits = call_git(r'git log --all --pretty=format:"%D %s"', cwd=d)
+    assert git_commits == (
+        "HEAD -> spooky Initial commit (automated commit by synctogit)"
+    )
+    assert call_git("git ls-tree -r HEAD", cwd=d) == ""
+
+    git = git_factory(d, branch="spooky", bare=True)
+    assert git.bare
+
+    with pytest.raises(GitError):  # Not a non-bare repo
+        git_factory(d, branch="spooky")
+
+
+def test_git_bare_requested_for_non_bare(temp_dir):
+    d = str(Path(temp_dir) / "myrepo")
+    os.mkdir(d)
+    git_factory(d)
+
+    with pytest.raises(GitError):
+        git_factory(d, bare=True)
+
+
+def test_git_fast_status(call_git, temp_dir):
+    d = str(Path(temp_dir) / "myrepo")
+    os.mkdir(d)
+    git_factory(d)
+    config = call_git("git config --local --list", cwd=d).split("\n")
+    assert "core.untrackedcache=true" not in config
+
+    git_factory(d, fast_status=True)
+    config = call_git("git config --local --list", cwd=d).split("\n")
+    assert "core.untrackedcache=true" in config
+    # The repo must stay clean for the transactions.
+    assert call_git("git status --porcelain", cwd=d) == ""
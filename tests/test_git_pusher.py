@@ -0,0 +1,62 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from synctogit.git_factory import git_factory
+from synctogit.git_pusher import GitPusher
+
+
+@pytest.fixture
+def pusher(temp_dir):
+    pusher = GitPusher(
+        git_factory(temp_dir),
+        min_retry_delay_seconds=0.01,
+        max_retry_delay_seconds=0.02,
+    )
+    yield pusher
+    pusher.close(timeout=5)
+
+
+def test_push_requests_are_coalesced(pusher):
+    started = threading.Event()
+    release = threading.Event()
+
+    def push(remote_name):
+        started.set()
+        assert release.wait(5)
+
+    with patch.object(pusher.backend, "push", side_effect=push) as mock_push:
+        pusher.start()
+        pusher.request_push()
+        assert started.wait(5)
+        # Requested while the first push is in progress.
+        for _ in range(3):
+            pusher.request_push()
+        assert pusher.status().is_pushing
+        release.set()
+        assert pusher.flush(timeout=5)
+    assert mock_push.call_count == 2
+
+
+def test_failed_push_is_retried_with_backoff(pusher):
+    side_effect = [ValueError("remote is down")] * 3 + [None]
+    with patch.object(pusher.backend, "push", side_effect=side_effect) as mock_push:
+        pusher.start()
+        pusher.request_push()
+        with pusher._cond:
+            assert pusher._cond.wait_for(lambda: pusher._attempts == 4, timeout=5)
+    assert mock_push.call_count == 4
+    status = pusher.status()
+    assert not status.is_pending
+    assert status.failed_attempts == 0
+    assert status.last_error is None
+    assert status.last_pushed_at is not None
+
+
+def test_nothing_to_flush(pusher):
+    with patch.object(pusher.backend, "push") as mock_push:
+        pusher.start()
+        assert pusher.flush()
+        assert pusher.close()
+    assert mock_push.call_count == 0
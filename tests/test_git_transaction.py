@@ -1,13 +1,18 @@
 import contextlib
 import datetime
+import io
 import os
 import re
 from pathlib import Path
 from unittest.mock import patch
 
+import git
 import pytest
 
-from synctogit.git_factory import git_factory
+from synctogit.git_backend import GitBackendType, create_git_backend
+from synctogit.git_factory import GitError, git_factory
+from synctogit.git_fast_import import FastImportTree
+from synctogit.git_pusher import GitPusher
 from synctogit.git_transaction import (
     GitPushError,
     GitSimultaneousTransaction,
@@ -17,6 +22,13 @@ from synctogit.git_transaction import (
 initial_commit = "Update .gitignore (automated commit by synctogit)"
 
 
+@pytest.fixture(params=list(GitBackendType), ids=lambda b: b.value)
+def backend(request):
+    if request.param == GitBackendType.pygit2:
+        pytest.importorskip("pygit2")
+    return request.param
+
+
 @pytest.fixture
 def git_repo(temp_dir):
     d = str(Path(temp_dir) / "myrepo")
@@ -84,7 +96,7 @@ def test_existing_lockfile_raises(git_repo):
     assert lockfile.exists()
 
 
-def test_dirty_changes_are_stashed(git_repo, call_git):
+def test_dirty_changes_are_stashed(git_repo, call_git, backend):
     wd = git_repo.working_tree_dir
     mystaged = Path(wd) / "mystaged"
     myunstaged = Path(wd) / "myunstaged"
@@ -93,7 +105,7 @@ def test_dirty_changes_are_stashed(git_repo, call_git):
     call_git("git add mystaged", cwd=wd)
     myunstaged.write_text("in the upside down")
 
-    with GitTransaction(git_repo):
+    with GitTransaction(git_repo, backend=backend):
         assert not mystaged.exists()
         assert not myunstaged.exists()
     assert not mystaged.exists()
@@ -149,6 +161,163 @@ def test_changes_on_exception_are_stashed(git_repo, call_git):
     assert git_stashed_unstaged_files == "myfile"
 
 
+@patch(
+    "synctogit.git_transaction._datetime_now",
+    return_value=datetime.datetime(2018, 9, 22, 16, 42, 29),
+)
+def test_checkpoint_survives_exception(_, git_repo, call_git, backend):
+    wd = git_repo.working_tree_dir
+    removed = Path(wd) / "dir" / "removed"
+    saved = Path(wd) / "dir" / "saved"
+    untouched = Path(wd) / "untouched"
+    unsaved = Path(wd) / "unsaved"
+
+    with GitTransaction(git_repo, backend=backend) as t:
+        t.write_bytes(removed, b"removed")
+
+    with pytest.raises(ValueError):
+        with GitTransaction(git_repo, backend=backend) as t:
+            removed.unlink()
+            saved.write_text("saved")
+            untouched.write_text("untouched")
+            t.touch(removed, saved, Path(wd) / "never-existed")
+            t.checkpoint()
+            t.checkpoint()  # Nothing to commit
+            unsaved.write_text("unsaved")
+            t.touch(unsaved)
+            raise ValueError("Some random exception")
+    assert saved.exists()
+    assert not removed.exists()
+    assert not untouched.exists()
+    assert not unsaved.exists()
+
+    git_commits = call_git(r'git log --pretty=format:"%s" -n 3', cwd=wd)
+    assert git_commits.split("\n") == [
+        "Sync checkpoint at 2018-09-22 16:42:29",
+        "Sync at 2018-09-22 16:42:29",
+        initial_commit,
+    ]
+    assert call_git("git show --name-status --pretty= HEAD", cwd=wd).split("\n") == [
+        "D\tdir/removed",
+        "A\tdir/saved",
+    ]
+
+
+@pytest.mark.parametrize("targeted_staging", [False, True])
+def test_recorded_changes_skip_status_scan(git_repo, call_git, targeted_staging):
+    wd = Path(git_repo.working_tree_dir)
+
+    with GitTransaction(git_repo, targeted_staging=targeted_staging) as t:
+        with patch.object(t.backend, "is_dirty", side_effect=AssertionError):
+            t.write_bytes(wd / "dir" / "written", b"written")
+    assert call_git("git ls-files", cwd=str(wd)).split("\n") == [
+        ".gitignore",
+        "dir/written",
+    ]
+
+    with pytest.raises(ValueError):
+        with GitTransaction(git_repo, targeted_staging=targeted_staging) as t:
+            with patch.object(t.backend, "is_dirty", side_effect=AssertionError):
+                t.remove_path(wd / "dir")
+                raise ValueError("Some random exception")
+    assert (wd / "dir" / "written").exists()
+    assert call_git("git status --porcelain", cwd=str(wd)) == ""
+    assert call_git("git stash list", cwd=str(wd)) != ""
+
+
+def test_clean_transaction_skips_status_scan(git_repo, call_git, backend):
+    wd = Path(git_repo.working_tree_dir)
+
+    # The working tree is scanned on entering the first transaction,
+    # so only the touched paths have to be staged on leaving it.
+    t = GitTransaction(git_repo, backend=backend)
+    with patch.object(t.backend, "stage_all", side_effect=AssertionError):
+        with t:
+            t.write_bytes(wd / "written", b"written")
+
+    # The last transaction has ended clean, so the working tree is
+    # not scanned, and the changes made since then are committed.
+    (wd / "external").write_text("external")
+    t = GitTransaction(git_repo, backend=backend)
+    with patch.object(t.backend, "is_dirty", side_effect=AssertionError):
+        with t:
+            pass
+    assert call_git("git ls-files", cwd=str(wd)).split("\n") == [
+        ".gitignore",
+        "external",
+        "written",
+    ]
+
+    # A failed transaction makes the next one scan the working tree.
+    with pytest.raises(ValueError):
+        with GitTransaction(git_repo, backend=backend):
+            raise ValueError("Some random exception")
+    (wd / "leftover").write_text("leftover")
+    with GitTransaction(git_repo, backend=backend):
+        pass
+    assert not (wd / "leftover").exists()
+    assert call_git("git stash list", cwd=str(wd)) != ""
+
+
+@patch("synctogit.git_backend._MAX_ARGV_CHARS", 10)
+def test_targeted_staging(git_repo, call_git, backend):
+    wd = Path(git_repo.working_tree_dir)
+    touched = [wd / ("touched%d" % i) for i in range(5)]
+    untouched = wd / "untouched"
+
+    with GitTransaction(git_repo, targeted_staging=True, backend=backend) as t:
+        for path in touched:
+            path.write_text("touched")
+        untouched.write_text("untouched")
+        t.touch(*touched)
+    assert call_git("git ls-files", cwd=str(wd)).split("\n") == [
+        ".gitignore",
+        "touched0",
+        "touched1",
+        "touched2",
+        "touched3",
+        "touched4",
+    ]
+    assert call_git("git status --porcelain", cwd=str(wd)) == "?? untouched"
+    untouched.unlink()
+
+    with GitTransaction(git_repo, targeted_staging=True, backend=backend) as t:
+        for path in touched[1:]:
+            path.unlink()
+        t.touch(*touched)
+    assert call_git("git ls-files", cwd=str(wd)).split("\n") == [
+        ".gitignore",
+        "touched0",
+    ]
+
+    # The changes made via the transaction are touched automatically.
+    with GitTransaction(git_repo, targeted_staging=True, backend=backend) as t:
+        t.write_bytes(wd / "written", b"written")
+        t.remove_path(wd / "touched0")
+    assert call_git("git ls-files", cwd=str(wd)).split("\n") == [
+        ".gitignore",
+        "written",
+    ]
+
+    # The ignored files of a touched dir are not staged.
+    with GitTransaction(git_repo, targeted_staging=True, backend=backend) as t:
+        (wd / "dir").mkdir()
+        (wd / "dir" / "file").write_text("file")
+        (wd / "dir" / ".synctogit.tmp").write_text("ignored")
+        t.touch(wd / "dir")
+    assert call_git("git ls-files", cwd=str(wd)).split("\n") == [
+        ".gitignore",
+        "dir/file",
+        "written",
+    ]
+
+    # Nothing has been touched
+    head = call_git("git rev-parse HEAD", cwd=str(wd))
+    with GitTransaction(git_repo, targeted_staging=True, backend=backend):
+        pass
+    assert call_git("git rev-parse HEAD", cwd=str(wd)) == head
+
+
 def test_remove_dirs_until_not_empty(git_repo):
     wd = git_repo.working_tree_dir
     d = Path(wd) / "a" / "b" / "c"
@@ -185,7 +354,9 @@ def test_remove_dirs_until_not_empty(git_repo):
     "synctogit.git_transaction._datetime_now",
     lambda: datetime.datetime(2018, 9, 25, 23, 30, 57),
 )
-def test_changes_are_committed(push, commit_message, git_repo_with_remote, call_git):
+def test_changes_are_committed(
+    push, commit_message, git_repo_with_remote, call_git, backend
+):
     git_repo = git_repo_with_remote["git_repo"]
     remote_git_repo = git_repo_with_remote["remote_git_repo"]
     remote_name = git_repo_with_remote["remote_name"]
@@ -195,8 +366,10 @@ def test_changes_are_committed(push, commit_message, git_repo_with_remote, call_
     wd = git_repo.working_tree_dir
     myfile = Path(wd) / "myfile"
 
-    with GitTransaction(git_repo, push=push, remote_name=remote_name) as t:
-        myfile.write_text("which is quite awesome")
+    with GitTransaction(
+        git_repo, push=push, remote_name=remote_name, backend=backend
+    ) as t:
+        t.write_bytes(myfile, "which is quite awesome".encode())
         if commit_message:
             t.transaction_commit_message = commit_message
 
@@ -237,7 +410,7 @@ def test_git_push_with_conflicts(git_repo_with_remote, call_git):
     with pytest.raises(GitPushError):
         with GitTransaction(git_repo, push=True, remote_name=remote_name) as t:
             t.transaction_commit_message = new_commit_message
-            myfile.write_text("cats are the best, dont @ me")
+            t.write_bytes(myfile, b"cats are the best, dont @ me")
 
     assert myfile.exists()
 
@@ -254,3 +427,210 @@ def test_git_push_with_conflicts(git_repo_with_remote, call_git):
         r'git log --pretty=format:"%s" -n 3', cwd=remote_git_repo.working_tree_dir
     )
     assert git_remote_commits == "empty\n%s" % initial_commit
+
+
+def test_background_push_is_retried(git_repo_with_remote, call_git):
+    git_repo = git_repo_with_remote["git_repo"]
+    remote_git_repo = git_repo_with_remote["remote_git_repo"]
+    remote_name = git_repo_with_remote["remote_name"]
+    remote_wd = remote_git_repo.working_tree_dir
+
+    initial_oid = call_git("git rev-parse HEAD", cwd=remote_wd)
+    with git_unbare_repo(remote_wd, call_git):
+        call_git('git commit --allow-empty -m "empty"', cwd=remote_wd)
+
+    pusher = GitPusher(git_repo, remote_name=remote_name, min_retry_delay_seconds=3600)
+    pusher.start()
+    try:
+        for i in range(2):
+            with GitTransaction(
+                git_repo, push=True, remote_name=remote_name, pusher=pusher
+            ) as t:
+                t.transaction_commit_message = "commit %d" % i
+                t.write_bytes(Path(git_repo.working_tree_dir) / "myfile", b"%d" % i)
+
+        # The push error is not raised by the transaction.
+        assert not pusher.flush()
+        status = pusher.status()
+        assert status.is_pending
+        assert status.failed_attempts >= 1
+        assert status.last_error
+        assert status.last_pushed_at is None
+
+        # Resolve the conflict. Both commits are pushed at once.
+        call_git("git update-ref HEAD %s" % initial_oid, cwd=remote_wd)
+        assert pusher.flush()
+        status = pusher.status()
+        assert not status.is_pending
+        assert status.failed_attempts == 0
+        assert status.last_error is None
+        assert status.last_pushed_at is not None
+    finally:
+        assert pusher.close()
+
+    git_remote_commits = call_git(r'git log --pretty=format:"%s" -n 3', cwd=remote_wd)
+    assert git_remote_commits == "commit 1\ncommit 0\n%s" % initial_commit
+
+
+def test_list_tree_and_read_blobs(git_repo, backend):
+    wd = Path(git_repo.working_tree_dir)
+
+    with GitTransaction(git_repo, backend=backend) as t:
+        t.write_bytes(wd / "a" / "b" / "файл", b"first\n")
+        t.write_bytes(wd / "a" / "second", b"second")
+        t.write_bytes(wd / "third", b"third")
+
+    with GitTransaction(git_repo, backend=backend) as t:
+        blobs = dict(t.list_tree_blobs("a"))
+        assert sorted(blobs.keys()) == ["a/b/файл", "a/second"]
+
+        contents = dict(t.read_blobs(blobs.values()))
+        assert contents == {
+            blobs["a/b/файл"]: b"first\n",
+            blobs["a/second"]: b"second",
+        }
+
+
+def test_bare_repo(temp_dir, call_git):
+    d = Path(temp_dir) / "myrepo"
+    os.mkdir(str(d))
+    git = git_factory(str(d), bare=True)
+
+    def ls_files():
+        return call_git("git ls-tree -r --name-only HEAD", cwd=str(d)).split("\n")
+
+    with GitTransaction(git) as t:
+        root = t.repo_dir
+        assert root == d
+        t.write_bytes(root / "a" / "b" / "c", b"c")
+        t.write_bytes(root / "a" / "d", b"d")
+        t.write_bytes(root / "e", b"e")
+        assert t.listdir(root) == {"a", "e"}
+        assert t.listdir(root / "a") == {"b", "d"}
+        assert t.listdir(root / "missing") == set()
+        assert t.is_dir(root / "a" / "b")
+        assert t.is_file(root / "a" / "d")
+        assert t.read_bytes(root / "a" / "b" / "c") == b"c"
+        t.checkpoint()
+
+        assert ls_files() == ["a/b/c", "a/d", "e"]
+        t.remove_path(root / "a" / "b")
+        assert not t.is_dir(root / "a" / "b")
+        t.transaction_commit_message = "Bare sync"
+    assert ls_files() == ["a/d", "e"]
+    log = call_git("git log --pretty=format:%s", cwd=str(d)).split("\n")
+    assert len(log) == 3
+    assert log[0] == "Bare sync"
+    assert log[1].startswith("Sync checkpoint at ")
+    assert log[2] == "Initial commit (automated commit by synctogit)"
+    # No working tree has been created.
+    assert not (d / "a").exists()
+    assert not (d / "e").exists()
+
+    with GitTransaction(git) as t:
+        # Files and dirs replace each other.
+        t.write_bytes(root / "a" / "d" / "f", b"f")
+        t.write_bytes(root / "e", b"ee")
+        t.remove_path(root / "a" / "b")
+        t.remove_path(root / "missing")
+    assert ls_files() == ["a/d/f", "e"]
+    assert call_git("git show HEAD:e", cwd=str(d)) == "ee"
+
+    head = call_git("git rev-parse HEAD", cwd=str(d))
+    with GitTransaction(git) as t:
+        # Nothing has changed.
+        t.write_bytes(root / "e", b"ee")
+    assert call_git("git rev-parse HEAD", cwd=str(d)) == head
+
+    with pytest.raises(ValueError):
+        with GitTransaction(git) as t:
+            t.write_bytes(root / "e", b"failed")
+            raise ValueError()
+    assert call_git("git rev-parse HEAD", cwd=str(d)) == head
+    assert not t.lockfile_path.exists()
+    assert call_git("git fsck --no-dangling", cwd=str(d)) == ""
+
+
+@pytest.mark.parametrize("bare", [False, True])
+def test_bulk_import(temp_dir, call_git, bare):
+    d = Path(temp_dir) / "myrepo"
+    os.mkdir(str(d))
+    git = git_factory(str(d), bare=bare)
+    base_files = [] if bare else [".gitignore"]
+
+    def ls_files():
+        output = call_git("git ls-tree -r -z --name-only HEAD", cwd=str(d))
+        return [line for line in output.split("\0") if line]
+
+    with GitTransaction(git, bulk_import=True) as t:
+        root = t.repo_dir
+        t.write_bytes(root / "a" / "b c", b"b")
+        t.write_bytes(root / 'q"uote', b"q")
+        assert t.read_bytes(root / "a" / "b c") == b"b"
+        t.checkpoint()
+        assert ls_files() == base_files + ["a/b c", 'q"uote']
+
+        t.write_bytes(root / "a", b"a")
+        # The working tree is not touched until the end of the transaction.
+        assert not (root / "a").exists()
+    assert ls_files() == base_files + ["a", 'q"uote']
+    assert call_git("git show HEAD:a", cwd=str(d)) == "a"
+    if not bare:
+        assert (d / "a").read_bytes() == b"a"
+        assert call_git("git status --porcelain", cwd=str(d)) == ""
+
+    with pytest.raises(ValueError):
+        with GitTransaction(git, bulk_import=True) as t:
+            t.remove_path(root / "a")
+            t.checkpoint()
+            t.write_bytes(root / "failed", b"failed")
+            raise ValueError()
+    assert ls_files() == base_files + ['q"uote']
+    if not bare:
+        # The working tree follows the checkpoint.
+        assert not (d / "a").exists()
+        assert call_git("git status --porcelain", cwd=str(d)) == ""
+    assert call_git("git fsck --no-dangling", cwd=str(d)) == ""
+
+
+def test_bulk_import_short_blob(temp_dir, call_git):
+    d = Path(temp_dir) / "myrepo"
+    os.mkdir(str(d))
+    git = git_factory(str(d), bare=True)
+    head = call_git("git rev-parse HEAD", cwd=str(d))
+
+    @contextlib.contextmanager
+    def short_blob_body(body):
+        yield io.BytesIO(body[:-1]), len(body)
+
+    with pytest.raises(ValueError):
+        with GitTransaction(git, bulk_import=True) as t:
+            proc = t.tree._proc
+            t.write_bytes(t.repo_dir / "a", b"a")
+            with patch("synctogit.git_fast_import.open_blob_body", short_blob_body):
+                t.write_bytes(t.repo_dir / "b", b"bb")
+    # fast-import is killed instead of taking the rest of the stream
+    # for the blob.
+    assert proc.returncode != 0
+    assert call_git("git rev-parse HEAD", cwd=str(d)) == head
+
+
+def test_bulk_import_requires_sha1(temp_dir, call_git):
+    d = Path(temp_dir) / "myrepo"
+    os.mkdir(str(d))
+    call_git("git init --bare --object-format=sha256", cwd=str(d))
+
+    tree = FastImportTree(git.Repo(str(d)), d)
+    with pytest.raises(GitError):
+        tree.load()
+    tree.close()
+
+
+def test_pygit2_backend_is_optional(git_repo):
+    try:
+        import pygit2  # noqa
+    except ImportError:
+        with pytest.raises(ValueError):
+            create_git_backend(git_repo, GitBackendType.pygit2)
+    else:
+        assert create_git_backend(git_repo, GitBackendType.pygit2)
@@ -0,0 +1,90 @@
+import collections
+import threading
+import time
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+
+from synctogit.scheduler import Scheduler
+
+
+def write_config(config_dir: Path, name: str, service: str, repo_dir: str) -> None:
+    (config_dir / ("%s.ini" % name)).write_text(
+        "[synctogit]\nservice = %s\n\n[git]\nrepo_dir = %s\n" % (service, repo_dir)
+    )
+
+
+@pytest.fixture
+def config_dir(temp_dir):
+    d = Path(temp_dir) / "configs"
+    d.mkdir()
+    return d
+
+
+def test_accounts_are_reported_separately(config_dir):
+    write_config(config_dir, "good", "todoist", "/tmp/good")
+    write_config(config_dir, "failing", "todoist", "/tmp/failing")
+    write_config(config_dir, "unknown", "myspace", "/tmp/unknown")
+    (config_dir / "not-a-config.txt").write_text("")
+
+    syncers = {}
+
+    def create(service, config, *, batch, force_update):
+        assert batch
+        name = Path(config.config_read_writer.config_path).stem
+        syncer = syncers[name] = Mock()
+        syncer.close.return_value = True
+        return syncer
+
+    scheduler = Scheduler.from_dir(config_dir)
+    with patch("synctogit.scheduler.Syncer.create", side_effect=create) as mock:
+        results = scheduler.run()
+        assert [r.name for r in results] == ["failing", "good", "unknown"]
+        assert [r.is_ok for r in results] == [True, True, False]
+
+        syncers["failing"].sync.side_effect = ValueError("Some random exception")
+        results = scheduler.run()
+        assert [r.is_ok for r in results] == [False, True, False]
+        assert isinstance(results[0].error, ValueError)
+
+    # The syncers are kept between the runs.
+    assert mock.call_count == 2
+    assert syncers["good"].sync.call_count == 2
+
+    syncers["failing"].close.return_value = False
+    failures = scheduler.close()
+    assert [r.name for r in failures] == ["failing"]
+    assert syncers["good"].close.call_count == 1
+
+
+def test_repo_and_service_limits(config_dir):
+    for i in range(3):
+        write_config(config_dir, "shared%d" % i, "todoist", "/tmp/shared")
+    for i in range(4):
+        write_config(config_dir, "evernote%d" % i, "evernote", "/tmp/evernote%d" % i)
+
+    lock = threading.Lock()
+    running = collections.Counter()
+    max_running = collections.Counter()
+
+    def create(service, config, **kwargs):
+        key = "repo" if service == "todoist" else service
+
+        def sync():
+            with lock:
+                running[key] += 1
+                max_running[key] = max(max_running[key], running[key])
+            time.sleep(0.05)
+            with lock:
+                running[key] -= 1
+
+        return Mock(sync=Mock(side_effect=sync))
+
+    scheduler = Scheduler.from_dir(config_dir, jobs=7, max_per_service=2)
+    with patch("synctogit.scheduler.Syncer.create", side_effect=create):
+        results = scheduler.run()
+    assert len(results) == 7
+    assert all(r.is_ok for r in results)
+    assert max_running["repo"] == 1
+    assert max_running["evernote"] == 2
@@ -1,3 +1,4 @@
+import threading
 from collections import defaultdict
 from datetime import date, datetime
 from unittest.mock import Mock, patch
@@ -5,7 +6,9 @@ from unittest.mock import Mock, patch
 import pytest
 import pytz
 
+import synctogit.todoist.client as todoist_client
 from synctogit.todoist import models
+from synctogit.todoist.service import TodoistSync
 from synctogit.todoist.todoist import Todoist
 
 
@@ -524,3 +527,43 @@ def test_parse_due_time(
     if due_datetime is not None:
         due_datetime = todoist_user_timezone.localize(due_datetime)
     assert todoist._parse_due_date_time(todo_item) == (due_date, due_datetime)
+
+
+@patch("synctogit.service.retries.sleep")
+def test_sync_retries_ratelimited(mock_sleep, todoist):
+    todoist.api.sync.side_effect = [
+        todoist_client.SyncRateLimitError("Too many requests", retry_after=5),
+        None,
+    ]
+    todoist.sync()
+    assert todoist.api.sync.call_count == 2
+    assert mock_sleep.call_count == 1
+    assert mock_sleep.call_args[0] == (5,)
+
+
+def test_accounts_are_throttled_separately():
+    accounts = []
+    for _ in range(2):
+        sync = TodoistSync(Mock(), Mock(), Mock(), False)
+        with patch("synctogit.todoist.todoist.Todoist._create_api", Mock()):
+            accounts.append(Todoist("", None, rate_limiter=sync.rate_limiter))
+    throttled, other = accounts
+    throttled.api.sync.side_effect = [
+        todoist_client.SyncRateLimitError("Too many requests", retry_after=60),
+        None,
+    ]
+
+    def sleep(seconds):
+        # The other account isn't paused while this one is waiting.
+        t = threading.Thread(target=other.sync)
+        t.start()
+        t.join(timeout=10)
+        assert not t.is_alive()
+
+    with patch("synctogit.service.retries.sleep", side_effect=sleep):
+        throttled.sync()
+
+    assert throttled.api.sync.call_count == 2
+    assert other.api.sync.call_count == 1
+    assert throttled.rate_limiter.rate < throttled.rate_limiter.max_rate
+    assert other.rate_limiter.rate == other.rate_limiter.max_rate